@@ -9,6 +9,8 @@ const STATUS_ICONS = {
 
 const SCAN_TIMEOUT = 15000
 const POLL_INTERVAL = 500
+const STATUS_STREAM_URL = '/api/status/stream'
+const PREVIEW_STREAM_URL = '/api/preview/stream'
 
 export function useFingerprintScanner() {
   const status = ref('ready')
@@ -17,7 +19,11 @@ export function useFingerprintScanner() {
   const statusIcon = ref('🔍')
   const isScanning = ref(false)
   const capturedImage = ref(null)
+  const previewUrl = ref(null)
   const pollInterval = ref(null)
+  const statusStream = ref(null)
+  const scanVersion = ref(0)
+  const jobId = ref(null)
   const scanTimeout = ref(null)
 
   const updateStatus = (newStatus, title, message) => {
@@ -27,6 +33,37 @@ export function useFingerprintScanner() {
     statusIcon.value = STATUS_ICONS[newStatus] || '🔍'
   }
 
+  const startStatusUpdates = () => {
+    if (typeof EventSource === 'undefined') {
+      startPolling()
+      return
+    }
+    if (statusStream.value) return
+
+    // Only status versions newer than the trigger belong to this scan;
+    // EventSource resumes from Last-Event-ID on reconnect
+    const source = new EventSource(`${STATUS_STREAM_URL}?since=${scanVersion.value}`)
+    source.onmessage = async (event) => {
+      const statusData = JSON.parse(event.data)
+      if (!isScanning.value || statusData.version <= scanVersion.value) return
+
+      if (statusData.job_id === jobId.value) {
+        handleScanStatus(statusData)
+      } else {
+        // Another kiosk's job; our own transitions may have been coalesced
+        // into this event, so check our job directly
+        const jobData = await fetchScanStatus()
+        if (jobData && isScanning.value) {
+          handleScanStatus(jobData)
+        }
+      }
+    }
+    source.onerror = () => {
+      console.error('Status stream error, reconnecting...')
+    }
+    statusStream.value = source
+  }
+
   const startPolling = () => {
     if (pollInterval.value) return
     
@@ -42,7 +79,11 @@ export function useFingerprintScanner() {
     }, POLL_INTERVAL)
   }
 
-  const stopPolling = () => {
+  const stopStatusUpdates = () => {
+    if (statusStream.value) {
+      statusStream.value.close()
+      statusStream.value = null
+    }
     if (pollInterval.value) {
       clearInterval(pollInterval.value)
       pollInterval.value = null
@@ -66,8 +107,9 @@ export function useFingerprintScanner() {
 
   const handleScanTimeout = () => {
     isScanning.value = false
-    stopPolling()
+    stopStatusUpdates()
     stopScanTimeout()
+    requestCancel()
     updateStatus('error', 'Scan Timeout', 'No fingerprint detected. Please try again.')
   }
 
@@ -77,15 +119,21 @@ export function useFingerprintScanner() {
     try {
       isScanning.value = true
       capturedImage.value = null
+      // A fresh URL per scan opens a new stream; it closes when the preview unmounts
+      previewUrl.value = `${PREVIEW_STREAM_URL}?scan=${Date.now()}`
       updateStatus('scanning', 'Scanning...', 'Place your finger on the sensor')
 
       await triggerScan()
-      startPolling()
+      startStatusUpdates()
       startScanTimeout()
     } catch (error) {
       console.error('Failed to start scan:', error)
       isScanning.value = false
-      updateStatus('error', 'Scan Failed', 'Could not start fingerprint scan')
+      if (error.busy) {
+        updateStatus('error', 'Scanner Busy', 'Too many scans are waiting. Please try again shortly.')
+      } else {
+        updateStatus('error', 'Scan Failed', 'Could not start fingerprint scan')
+      }
     }
   }
 
@@ -93,11 +141,26 @@ export function useFingerprintScanner() {
     if (!isScanning.value) return
 
     isScanning.value = false
-    stopPolling()
+    stopStatusUpdates()
     stopScanTimeout()
+    requestCancel()
     updateStatus('ready', 'Scan Cancelled', 'Click "Start Scan" to try again')
   }
 
+  // Frees the sensor for the next scan instead of letting it wait out the timeout
+  const requestCancel = async () => {
+    if (!jobId.value) return
+    try {
+      await fetch('/api/cancel-scan', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ job_id: jobId.value })
+      })
+    } catch (error) {
+      console.error('Cancel request failed:', error)
+    }
+  }
+
   const retakeScan = () => {
     capturedImage.value = null
     startScan()
@@ -111,19 +174,30 @@ export function useFingerprintScanner() {
         body: JSON.stringify({ action: 'start_scan' })
       })
 
+      if (response.status === 429) {
+        const busyError = new Error('Scanner busy')
+        busyError.busy = true
+        throw busyError
+      }
       if (!response.ok) {
         throw new Error('Failed to trigger scan')
       }
+
+      const result = await response.json()
+      scanVersion.value = result.version || 0
+      jobId.value = result.job_id
     } catch (error) {
-      updateStatus('scanning', 'Manual Trigger Required', 
-        'Run: echo. > communication\\capture_request.flag')
+      if (!error.busy) {
+        updateStatus('scanning', 'Manual Trigger Required', 
+          'Run: echo. > communication\\capture_request.flag')
+      }
       throw error
     }
   }
 
   const fetchScanStatus = async () => {
     try {
-      const response = await fetch('/api/status')
+      const response = await fetch(`/api/status/${jobId.value}`)
       if (response.ok) {
         return await response.json()
       }
@@ -135,30 +209,45 @@ export function useFingerprintScanner() {
 
   const handleScanStatus = (statusData) => {
     switch (statusData.status) {
+      case 'queued':
+        updateStatus('scanning', 'Waiting...', 
+          statusData.message || 'Waiting for the scanner...')
+        break
+
       case 'capturing':
         updateStatus('scanning', 'Scanning...', 
           statusData.message || 'Processing fingerprint...')
         break
       
       case 'success':
-        handleScanSuccess()
+        handleScanSuccess(statusData)
         break
       
       case 'error':
         handleScanError(statusData)
         break
+
+      case 'cancelled':
+        isScanning.value = false
+        stopStatusUpdates()
+        stopScanTimeout()
+        updateStatus('ready', 'Scan Cancelled', 'Click "Start Scan" to try again')
+        break
     }
   }
 
-  const handleScanSuccess = async () => {
+  const handleScanSuccess = async (statusData) => {
     isScanning.value = false
-    stopPolling()
+    stopStatusUpdates()
     stopScanTimeout()
 
     try {
       const imageUrl = await loadCapturedImage()
       capturedImage.value = imageUrl
-      updateStatus('success', 'Scan Complete', 'Fingerprint captured successfully!')
+      const quality = statusData.quality
+      updateStatus('success', 'Scan Complete', quality
+        ? `Fingerprint captured successfully! (quality ${Math.round(quality.score)}/100)`
+        : 'Fingerprint captured successfully!')
     } catch (error) {
       console.error('Failed to load image:', error)
       updateStatus('error', 'Image Load Failed', 'Could not load captured fingerprint')
@@ -167,15 +256,15 @@ export function useFingerprintScanner() {
 
   const handleScanError = (statusData) => {
     isScanning.value = false
-    stopPolling()
+    stopStatusUpdates()
     stopScanTimeout()
-    updateStatus('error', 'Scan Failed', 
+    updateStatus('error', statusData.error === 'low_quality' ? 'Poor Print Quality' : 'Scan Failed', 
       statusData.message || 'An error occurred during scanning')
   }
 
   const loadCapturedImage = async () => {
     try {
-      const response = await fetch('/api/image')
+      const response = await fetch(`/api/image/${jobId.value}?format=png`)
       if (response.ok) {
         const blob = await response.blob()
         return URL.createObjectURL(blob)
@@ -191,7 +280,7 @@ export function useFingerprintScanner() {
   })
 
   onUnmounted(() => {
-    stopPolling()
+    stopStatusUpdates()
     stopScanTimeout()
   })
 
@@ -202,6 +291,7 @@ export function useFingerprintScanner() {
     statusIcon,
     isScanning,
     capturedImage,
+    previewUrl,
     startScan,
     cancelScan,
     retakeScan
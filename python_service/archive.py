@@ -0,0 +1,247 @@
+import os
+import mmap
+import struct
+import bisect
+import threading
+import time
+
+# ===== Configuration =====
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+ARCHIVE_DIR = os.environ.get("FINGERPRINT_ARCHIVE_DIR", os.path.join(PROJECT_ROOT, "communication", "archive"))
+
+ARCHIVE_ENABLED = os.environ.get("FINGERPRINT_ARCHIVE", "1") != "0"
+SEGMENT_FRAMES = int(os.environ.get("FINGERPRINT_ARCHIVE_SEGMENT_FRAMES", "1024"))  # ~72 MB per segment
+MAX_SEGMENTS = int(os.environ.get("FINGERPRINT_ARCHIVE_MAX_SEGMENTS", "0"))         # 0 keeps every segment
+
+IMAGE_X, IMAGE_Y = 256, 288
+FRAME_BYTES = IMAGE_X * IMAGE_Y
+
+# Index entry: job ID (12 raw bytes), timestamp, segment, slot, device label,
+# quality score (255 = not scored)
+INDEX_RECORD = struct.Struct('<12sdII16sB3x')
+NO_QUALITY = 255
+
+class ArchiveEntry:
+    """Index entry for one archived frame."""
+
+    __slots__ = ("job_id", "timestamp", "segment", "slot", "device", "quality")
+
+    def __init__(self, job_id, timestamp, segment, slot, device, quality):
+        self.job_id = job_id
+        self.timestamp = timestamp
+        self.segment = segment
+        self.slot = slot
+        self.device = device
+        self.quality = quality
+
+    def to_dict(self) -> dict:
+        return {"job_id": self.job_id, "timestamp": self.timestamp,
+                "device": self.device or None, "quality": self.quality}
+
+    @classmethod
+    def unpack(cls, data, offset: int = 0):
+        raw_id, timestamp, segment, slot, device, quality = INDEX_RECORD.unpack_from(data, offset)
+        return cls(raw_id.hex(), timestamp, segment, slot, device.rstrip(b'\0').decode('utf-8', 'replace'),
+                   None if quality == NO_QUALITY else quality)
+
+    def pack(self) -> bytes:
+        quality = NO_QUALITY if self.quality is None else max(0, min(100, int(round(self.quality))))
+        return INDEX_RECORD.pack(bytes.fromhex(self.job_id), self.timestamp, self.segment, self.slot,
+                                 self.device.encode('utf-8')[:16], quality)
+
+# ===== Archive =====
+class CaptureArchive:
+    """Append-only store of raw frames in memory-mapped segment files.
+
+    Frames are copied straight into a preallocated segment-NNNNNN.dat mapping;
+    the fixed-size index.dat record appended afterwards is the commit point,
+    so a crash never indexes a partly written frame. Lookups by job ID are a
+    dict hit plus an offset into the segment; time range scans bisect the
+    index, which is kept in append (time) order. Full segments are sealed and
+    a new one started; beyond max_segments the oldest is deleted.
+
+    A readonly archive (e.g. in the bridge) picks up frames appended by the
+    writing process on each call.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_frames: int = SEGMENT_FRAMES,
+                 max_segments: int = MAX_SEGMENTS, readonly: bool = False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_frames = segment_frames
+        self.max_segments = max_segments
+        self.readonly = readonly
+        self.index_path = os.path.join(directory, "index.dat")
+        self._lock = threading.Lock()
+        self._entries = []      # In append order
+        self._times = []        # Parallel to _entries, for bisect
+        self._by_id = {}
+        self._index_size = 0
+        self._index_id = None   # Inode of the index file, changed when retention rewrites it
+        self._maps = {}         # segment -> (file, mmap)
+        self._refresh()
+        if not readonly:
+            if os.path.exists(self.index_path) and os.path.getsize(self.index_path) != self._index_size:
+                # Drop a torn last record from a crash so appends stay record-aligned
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(self._index_size)
+            self._index_file = open(self.index_path, 'ab')
+            self._segment = self._entries[-1].segment if self._entries else 1
+            self._next_slot = self._entries[-1].slot + 1 if self._entries else 0
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment-{segment:06d}.dat")
+
+    def _refresh(self):
+        """Load index records appended since the last call."""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        size = st.st_size
+        if st.st_ino != self._index_id:
+            # Rewritten by retention in the writer; reload from scratch
+            self._entries, self._times, self._by_id, self._index_size = [], [], {}, 0
+            self._close_maps()
+            self._index_id = st.st_ino
+        usable = size - (size - self._index_size) % INDEX_RECORD.size
+        if usable <= self._index_size:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_size)
+            data = f.read(usable - self._index_size)
+        for offset in range(0, len(data), INDEX_RECORD.size):
+            self._add(ArchiveEntry.unpack(data, offset))
+        self._index_size = usable
+
+    def _add(self, entry: ArchiveEntry):
+        self._entries.append(entry)
+        self._times.append(entry.timestamp)
+        self._by_id[entry.job_id] = entry
+
+    def _map(self, segment: int, create: bool = False) -> mmap.mmap:
+        """Memory-map a segment, creating it at full size if asked."""
+        if segment in self._maps:
+            return self._maps[segment][1]
+        path = self._segment_path(segment)
+        size = self.segment_frames * FRAME_BYTES
+        if create and not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.truncate(size)
+        f = open(path, 'rb' if self.readonly else 'r+b')
+        access = mmap.ACCESS_READ if self.readonly else mmap.ACCESS_WRITE
+        mapping = mmap.mmap(f.fileno(), 0, access=access)
+        self._maps[segment] = (f, mapping)
+        return mapping
+
+    def _unmap(self, segment: int):
+        f, mapping = self._maps.pop(segment, (None, None))
+        if mapping is not None:
+            mapping.close()
+            f.close()
+
+    def _close_maps(self):
+        for segment in list(self._maps):
+            self._unmap(segment)
+
+    # ===== Writing =====
+    def append(self, job_id: str, frame, device: str = "", quality: float = None,
+               timestamp: float = None) -> ArchiveEntry:
+        """Copy a raw frame into the archive and index it under job_id."""
+        view = memoryview(frame).cast('B')
+        if len(view) != FRAME_BYTES:
+            raise ValueError(f"Expected a {FRAME_BYTES}-byte frame, got {len(view)}")
+        with self._lock:
+            if self._next_slot >= self.segment_frames:
+                self._rotate()
+            mapping = self._map(self._segment, create=True)
+            offset = self._next_slot * FRAME_BYTES
+            mapping[offset:offset + FRAME_BYTES] = view
+
+            entry = ArchiveEntry(job_id, timestamp or time.time(), self._segment, self._next_slot,
+                                 device or "", quality)
+            self._index_file.write(entry.pack())
+            self._index_file.flush()
+            self._index_size += INDEX_RECORD.size
+            self._add(entry)
+            self._next_slot += 1
+            return entry
+
+    def _rotate(self):
+        """Seal the current segment, start the next one and apply retention."""
+        if self._segment in self._maps:
+            self._maps[self._segment][1].flush()
+            self._unmap(self._segment)
+        self._segment += 1
+        self._next_slot = 0
+        if self.max_segments and self._segment - self.max_segments >= 1:
+            self._drop_segments_before(self._segment - self.max_segments + 1)
+
+    def _drop_segments_before(self, first: int):
+        """Delete segments older than first and rewrite the index without them."""
+        kept = [e for e in self._entries if e.segment >= first]
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(e.pack() for e in kept))
+        self._index_file.close()
+        os.replace(tmp_path, self.index_path)
+        self._index_file = open(self.index_path, 'ab')
+        self._index_id = os.stat(self.index_path).st_ino
+
+        self._entries, self._times, self._by_id = [], [], {}
+        for entry in kept:
+            self._add(entry)
+        self._index_size = len(kept) * INDEX_RECORD.size
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".dat") and int(name[8:14]) < first:
+                self._unmap(int(name[8:14]))
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass  # Still mapped by a reader (Windows); retried on the next rotation
+
+    # ===== Reading =====
+    def __len__(self) -> int:
+        with self._lock:
+            if self.readonly:
+                self._refresh()
+            return len(self._entries)
+
+    def entry(self, job_id: str):
+        """Index entry for job_id, or None if it is not archived."""
+        with self._lock:
+            if self.readonly:
+                self._refresh()
+            return self._by_id.get(job_id)
+
+    def read(self, job_id: str):
+        """Raw top-down frame bytes for job_id, or None if it is not archived."""
+        with self._lock:
+            if self.readonly:
+                self._refresh()
+            entry = self._by_id.get(job_id)
+            if entry is None:
+                return None
+            mapping = self._map(entry.segment)
+            offset = entry.slot * FRAME_BYTES
+            return mapping[offset:offset + FRAME_BYTES]
+
+    def scan(self, start: float = None, end: float = None, limit: int = None) -> list:
+        """Entries with start <= timestamp < end, oldest first."""
+        with self._lock:
+            if self.readonly:
+                self._refresh()
+            lo = 0 if start is None else bisect.bisect_left(self._times, start)
+            hi = len(self._times) if end is None else bisect.bisect_left(self._times, end)
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            return self._entries[lo:hi]
+
+    def close(self):
+        with self._lock:
+            if not self.readonly:
+                if self._segment in self._maps:
+                    self._maps[self._segment][1].flush()
+                self._index_file.close()
+            self._close_maps()
@@ -0,0 +1,164 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; without it only gzip variants are built
+    brotli = None
+
+# ===== Configuration =====
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "frontend-vue")
+# The built bundle (npm run build) when present, otherwise the frontend sources
+STATIC_DIR = os.environ.get("BRIDGE_STATIC_DIR") or (
+    os.path.join(FRONTEND_DIR, "dist") if os.path.isdir(os.path.join(FRONTEND_DIR, "dist")) else FRONTEND_DIR)
+
+MAX_MEMORY_ASSET = int(os.environ.get("BRIDGE_MAX_MEMORY_ASSET", str(1024 * 1024)))  # Larger files use sendfile
+MIN_COMPRESS_SIZE = 256     # Smaller bodies are not worth a Content-Encoding
+GZIP_LEVEL = 9              # Compressed once at startup, so use the best ratio
+SKIP_DIRS = {"node_modules"}
+
+ASSET_TYPES = {".html", ".js", ".mjs", ".css", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".webp",
+               ".ico", ".woff", ".woff2", ".ttf", ".map", ".txt"}
+COMPRESSIBLE_TYPES = {".html", ".js", ".mjs", ".css", ".svg", ".map", ".txt", ".ttf", ".ico"}
+
+# Vite writes bundle files as assets/<name>-<8-char hash>.<ext>; their content
+# never changes under the same name, so clients may cache them for good
+HASHED_ASSET = re.compile(r"^/assets/.+-[0-9A-Za-z_-]{8}\.[0-9a-z]+$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q > 0)."""
+    accepted = set()
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name.lower())
+    if "*" in accepted:
+        accepted.update(ENCODINGS)
+    return accepted
+
+class Asset:
+    """One static file, held in memory with precompressed variants, or on disk."""
+
+    __slots__ = ("url", "path", "content_type", "cache_control", "size", "etag", "variants")
+
+    def __init__(self, url: str, path: str, content_type: str, cache_control: str, size: int,
+                 etag: str, variants: dict):
+        self.url = url
+        self.path = path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.size = size
+        self.etag = etag
+        self.variants = variants  # encoding ("identity", "gzip", "br") -> bytes; empty if on disk
+
+    @property
+    def in_memory(self) -> bool:
+        return bool(self.variants)
+
+    def select(self, accept_encoding: str = None) -> tuple:
+        """Return (encoding, etag, body) for the smallest variant the client accepts.
+
+        body is None for assets too large to hold in memory; send the file
+        at path instead.
+        """
+        if not self.variants:
+            return "identity", self.etag, None
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                # Each encoding is a different representation, so gets its own strong ETag
+                return encoding, f'{self.etag[:-1]}-{encoding}"', self.variants[encoding]
+        return "identity", self.etag, self.variants["identity"]
+
+def _compress(content: bytes) -> dict:
+    variants = {}
+    data = gzip.compress(content, GZIP_LEVEL, mtime=0)
+    if len(data) < len(content):
+        variants["gzip"] = data
+    if brotli is not None:
+        data = brotli.compress(content)
+        if len(data) < len(content):
+            variants["br"] = data
+    return variants
+
+def load_asset(url: str, path: str) -> Asset:
+    """Read one file into an Asset, compressing it if worthwhile."""
+    ext = os.path.splitext(path)[1].lower()
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or ext in (".js", ".mjs", ".svg"):
+        content_type += "; charset=utf-8"
+    cache_control = IMMUTABLE_CACHE if HASHED_ASSET.match(url) else REVALIDATE_CACHE
+    size = os.path.getsize(path)
+
+    digest = hashlib.blake2b(digest_size=12)
+    variants = {}
+    with open(path, 'rb') as f:
+        if size <= MAX_MEMORY_ASSET:
+            content = f.read()
+            digest.update(content)
+            variants["identity"] = content
+            if ext in COMPRESSIBLE_TYPES and size >= MIN_COMPRESS_SIZE:
+                variants.update(_compress(content))
+        else:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return Asset(url, path, content_type, cache_control, size, f'"{digest.hexdigest()}"', variants)
+
+class AssetTable:
+    """Static frontend files keyed by URL path, loaded once at startup.
+
+    Serving an in-memory asset costs a dict lookup: no stat, no read, no
+    MIME guess and no compression per request.
+    """
+
+    def __init__(self, root: str = STATIC_DIR):
+        self.root = root
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for directory, dirs, files in os.walk(self.root):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+            for name in files:
+                if os.path.splitext(name)[1].lower() not in ASSET_TYPES:
+                    continue
+                path = os.path.join(directory, name)
+                url = "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+                try:
+                    assets[url] = load_asset(url, path)
+                except OSError as e:
+                    print(f"Skipping asset {path}: {e}")
+        if "/index.html" in assets:
+            assets["/"] = assets["/index.html"]
+        self.assets = assets
+
+    def get(self, url: str):
+        return self.assets.get(url)
+
+    def files(self) -> list:
+        """Distinct assets; "/" is an alias of /index.html."""
+        return list({id(a): a for a in self.assets.values()}.values())
+
+    def __len__(self) -> int:
+        return len(self.files())
+
+    def memory_bytes(self) -> int:
+        return sum(len(v) for a in self.files() for v in a.variants.values())
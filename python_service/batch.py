@@ -0,0 +1,201 @@
+"""Offline re-processing of stored captures.
+
+Streams frames from a directory of BMPs or a capture archive through the
+decode -> quality -> template pipeline on a process pool. Results are
+appended to <output>/results.jsonl as chunks finish, which doubles as the
+checkpoint: re-running the same command skips frames already processed.
+Frames that failed (e.g. a file still being written) are tried again on
+the next run, so a key may have several lines; the last one is current.
+Templates are written to <output>/templates/, mirroring the source paths.
+
+    python -m python_service.batch --archive communication/archive --output reprocessed
+    python -m python_service.batch --input captures/ --stages quality --workers 8
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Sibling modules are imported flat, as when the services run as scripts
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+
+from imaging import decode_bmp
+from quality import assess_quality
+from archive import CaptureArchive, IMAGE_X, IMAGE_Y
+import template
+
+STAGES = ("quality", "template")
+RESULTS_FILE = "results.jsonl"
+PROGRESS_INTERVAL = 2.0
+
+# ===== Sources =====
+def list_bmp_keys(directory: str) -> list:
+    """BMP files under directory, as sorted relative paths."""
+    keys = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(".bmp"):
+                keys.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(keys)
+
+def list_archive_keys(directory: str) -> list:
+    """Job IDs in a capture archive, oldest first."""
+    archive = CaptureArchive(directory, readonly=True)
+    try:
+        return [entry.job_id for entry in archive.scan()]
+    finally:
+        archive.close()
+
+# ===== Worker Side =====
+_archive = None  # Per-process read-only archive, opened on first use
+
+def load_frame(kind: str, root: str, key: str) -> tuple:
+    """Return (width, height, top-down pixels) for one stored capture."""
+    global _archive
+    if kind == "archive":
+        if _archive is None:
+            _archive = CaptureArchive(root, readonly=True)
+        frame = _archive.read(key)
+        if frame is None:
+            raise ValueError("Frame not in archive")
+        return IMAGE_X, IMAGE_Y, frame
+    with open(os.path.join(root, key), 'rb') as f:
+        return decode_bmp(f.read())
+
+def template_path(output: str, key: str) -> str:
+    """Where a capture's template goes: its key's path mirrored under <output>/templates."""
+    path = os.path.join(output, "templates", os.path.splitext(os.path.normpath(key))[0] + ".fpt")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def process_chunk(kind: str, root: str, keys: list, stages: tuple, output: str) -> list:
+    """Run the pipeline over a chunk of captures, returning one result per key."""
+    results = []
+    for key in keys:
+        result = {"key": key}
+        started = time.perf_counter()
+        try:
+            width, height, pixels = load_frame(kind, root, key)
+            result.update(width=width, height=height)
+            quality = None
+            if "quality" in stages:
+                quality = assess_quality(pixels, width, height)
+                result["quality"] = quality
+            if "template" in stages:
+                data = template.extract_template(pixels, width, height, quality["score"] if quality else None)
+                with open(template_path(output, key), 'wb') as f:
+                    f.write(data)
+                result["template"] = {"version": template.TEMPLATE_VERSION, "size": len(data),
+                                      "minutiae": (len(data) - template.HEADER.size) // template.MINUTIA.size}
+        except Exception as e:
+            result["error"] = str(e)
+        result["ms"] = round((time.perf_counter() - started) * 1000, 3)
+        results.append(result)
+    return results
+
+# ===== Driver =====
+def read_checkpoint(path: str) -> set:
+    """Keys whose latest result in a results file is a success."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                key = result["key"]
+            except (ValueError, KeyError):
+                continue  # Torn last line from an interrupted run
+            if "error" in result:
+                done.discard(key)
+            else:
+                done.add(key)
+    return done
+
+def run_batch(kind: str, root: str, output: str, stages: tuple, workers: int,
+              chunk_size: int, restart: bool = False) -> dict:
+    """Process every capture from root not already in output's results."""
+    os.makedirs(os.path.join(output, "templates"), exist_ok=True)
+    results_path = os.path.join(output, RESULTS_FILE)
+    if restart and os.path.exists(results_path):
+        os.remove(results_path)
+
+    keys = list_archive_keys(root) if kind == "archive" else list_bmp_keys(root)
+    done = read_checkpoint(results_path)
+    pending = [key for key in keys if key not in done]
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    print(f"{len(keys)} captures, {len(keys) - len(pending)} already processed, "
+          f"{len(pending)} to go in {len(chunks)} chunks on {workers} workers")
+
+    summary = {"processed": 0, "errors": 0, "quality_sum": 0.0, "scored": 0}
+    started = last_report = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(results_path, 'a') as out:
+        # Keep a bounded number of chunks in flight so huge sources stream
+        queue = iter(chunks)
+        in_flight = set()
+        while True:
+            while len(in_flight) < workers * 2:
+                chunk = next(queue, None)
+                if chunk is None:
+                    break
+                in_flight.add(pool.submit(process_chunk, kind, root, chunk, stages, output))
+            if not in_flight:
+                break
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for result in future.result():
+                    out.write(json.dumps(result) + "\n")
+                    summary["processed"] += 1
+                    summary["errors"] += "error" in result
+                    if result.get("quality"):
+                        summary["quality_sum"] += result["quality"]["score"]
+                        summary["scored"] += 1
+            out.flush()
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                rate = summary["processed"] / (now - started)
+                eta = (len(pending) - summary["processed"]) / rate if rate else 0
+                print(f"  {summary['processed']}/{len(pending)} ({rate:.1f}/s, ETA {eta:.0f}s, "
+                      f"{summary['errors']} errors)")
+                last_report = now
+
+    elapsed = time.monotonic() - started
+    summary["elapsed_s"] = round(elapsed, 3)
+    summary["rate_per_s"] = round(summary["processed"] / elapsed, 1) if elapsed else 0.0
+    summary["mean_quality"] = round(summary.pop("quality_sum") / summary["scored"], 1) if summary["scored"] else None
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-process stored fingerprint captures")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory of BMP captures")
+    source.add_argument("--archive", help="Capture archive directory")
+    parser.add_argument("--output", default="batch_output", help="Directory for results and templates")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help=f"Comma-separated stages after decode: {', '.join(STAGES)}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=32, help="Captures per task")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous results and start over")
+    args = parser.parse_args(argv)
+    args.stages = tuple(s for s in args.stages.split(",") if s)
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    kind, root = ("archive", args.archive) if args.archive else ("bmp", args.input)
+    summary = run_batch(kind, root, args.output, args.stages, max(1, args.workers),
+                        max(1, args.chunk_size), args.restart)
+    print(f"Done: {summary['processed']} captures in {summary['elapsed_s']}s "
+          f"({summary['rate_per_s']}/s), {summary['errors']} errors, mean quality {summary['mean_quality']}")
+    return summary
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""End-to-end benchmark for the fingerprint service and bridge server.
+
+Drives N concurrent virtual kiosks through trigger -> status -> image against a
+running bridge (or spawns the service and bridge against the simulated device
+with --spawn), then measures /api/status throughput. Results are written as
+JSON and can be compared against a previous run:
+
+    python benchmark.py --spawn --kiosks 4 --scans 5 --output run.json
+    python benchmark.py --spawn --compare baseline.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+from urllib.parse import urlparse
+from jobs import FINAL_STATES
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_URL = "http://localhost:8080"
+STARTUP_TIMEOUT = 15.0
+SCAN_TIMEOUT = 30.0
+
+# ===== Statistics =====
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100) - 1))
+    return sorted_values[rank]
+
+def summarize(values: list) -> dict:
+    """Count, mean and p50/p95/p99/max of a list of millisecond samples."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3),
+    }
+
+class Samples:
+    """Thread-safe per-stage sample collector."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.errors = {}
+
+    def add(self, stage: str, value_ms: float):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(value_ms)
+
+    def error(self, kind: str):
+        with self._lock:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+# ===== HTTP Client =====
+class BridgeClient:
+    """Keep-alive HTTP client for one virtual kiosk."""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.conn = None
+
+    def request(self, method: str, path: str, body: bytes = None, timeout: float = SCAN_TIMEOUT):
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            try:
+                self.conn.request(method, path, body=body,
+                                  headers={"Content-Type": "application/json"} if body else {})
+                response = self.conn.getresponse()
+                data = response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                # Server closed an idle keep-alive connection; retry once
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+# ===== Scenarios =====
+def run_kiosk(url: str, scans: int, samples: Samples, image_format: str):
+    """Run sequential trigger -> status -> image cycles for one kiosk."""
+    client = BridgeClient(url)
+    try:
+        for _ in range(scans):
+            start = time.perf_counter()
+            status, data = client.request("POST", "/api/trigger-scan", b'{"action":"start_scan"}')
+            triggered = time.perf_counter()
+            if status != 200:
+                samples.error(f"trigger_{status}")
+                continue
+            samples.add("trigger_ms", (triggered - start) * 1000)
+            response = json.loads(data)
+            version, job_id = response.get("version", 0), response["job_id"]
+
+            # Long-poll the shared status until this job reaches a final state;
+            # transitions of other jobs can coalesce ours, so confirm per job
+            final = None
+            deadline = time.monotonic() + SCAN_TIMEOUT
+            while time.monotonic() < deadline:
+                status, data = client.request("GET", f"/api/status?since={version}&timeout=10")
+                if status != 200:
+                    samples.error(f"status_{status}")
+                    break
+                status_data = json.loads(data)
+                version = status_data.get("version", version)
+                if status_data.get("job_id") != job_id:
+                    status, data = client.request("GET", f"/api/status/{job_id}")
+                    if status != 200:
+                        continue
+                    status_data = json.loads(data)
+                if status_data.get("status") in FINAL_STATES:
+                    final = status_data
+                    break
+            finished = time.perf_counter()
+
+            if final is None:
+                samples.error("scan_timeout")
+                continue
+            if final["status"] != "success":
+                samples.error(final.get("error") or f"scan_{final['status']}")
+                continue
+            samples.add("trigger_to_success_ms", (finished - start) * 1000)
+            for stage, value in (final.get("timings") or {}).items():
+                samples.add(stage, value)
+
+            start = time.perf_counter()
+            status, data = client.request("GET", f"/api/image/{job_id}?format={image_format}")
+            if status == 200:
+                samples.add("image_fetch_ms", (time.perf_counter() - start) * 1000)
+                samples.add("trigger_to_image_ms", (time.perf_counter() - triggered) * 1000)
+            else:
+                samples.error(f"image_{status}")
+    finally:
+        client.close()
+
+def run_capture_benchmark(url: str, kiosks: int, scans: int, image_format: str,
+                          finger_delay: float = None) -> dict:
+    """Run the capture scenario with concurrent kiosks.
+
+    With a known simulated finger_delay, detection lag (time from the finger
+    landing to PSGetImage reporting it) is derived from detect_ms.
+    """
+    samples = Samples()
+    threads = [threading.Thread(target=run_kiosk, args=(url, scans, samples, image_format))
+               for _ in range(kiosks)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    if finger_delay is not None:
+        for value in samples.stages.get("detect_ms", []):
+            samples.add("detect_lag_ms", max(0.0, value - finger_delay * 1000))
+
+    completed = len(samples.stages.get("trigger_to_success_ms", []))
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "captures": completed,
+        "captures_per_min": round(completed / elapsed * 60, 2) if elapsed else 0.0,
+        "stages": {stage: summarize(values) for stage, values in sorted(samples.stages.items())},
+        "errors": samples.errors,
+    }
+
+def run_status_benchmark(url: str, clients: int, duration: float) -> dict:
+    """Hammer GET /api/status from concurrent keep-alive clients."""
+    samples = Samples()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        client = BridgeClient(url)
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request("GET", "/api/status", timeout=5)
+                except OSError:
+                    samples.error("connection")
+                    continue
+                if status == 200:
+                    samples.add("status_ms", (time.perf_counter() - start) * 1000)
+                else:
+                    samples.error(f"status_{status}")
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = samples.stages.get("status_ms", [])
+    return {
+        "clients": clients,
+        "elapsed_s": round(elapsed, 3),
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(latencies),
+        "errors": samples.errors,
+    }
+
+# ===== Spawned Stack =====
+def spawn_stack(url: str, env_overrides: dict) -> list:
+    """Start the service and bridge against the simulated device."""
+    env = dict(os.environ)
+    env.setdefault("FINGERPRINT_DEVICE", "simulated")
+    env.update(env_overrides)
+    processes = [
+        subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, script)], cwd=SCRIPT_DIR, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for script in ("fingerprint_service.py", "bridge_server.py")
+    ]
+
+    client = BridgeClient(url)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            status, data = client.request("GET", "/api/status", timeout=1)
+            if status == 200 and json.loads(data).get("status") == "ready":
+                client.close()
+                return processes
+        except OSError:
+            pass
+        time.sleep(0.2)
+    stop_stack(processes)
+    raise SystemExit("Service/bridge did not become ready")
+
+def stop_stack(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# ===== Reporting =====
+def print_report(results: dict):
+    capture = results["capture"]
+    print(f"Captures: {capture['captures']} in {capture['elapsed_s']}s "
+          f"({capture['captures_per_min']}/min)")
+    print(f"  {'stage':24s} {'count':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s}")
+    for stage, stats in capture["stages"].items():
+        if stats["count"]:
+            print(f"  {stage:24s} {stats['count']:6d} {stats['p50']:9.2f} {stats['p95']:9.2f} {stats['p99']:9.2f}")
+    if capture["errors"]:
+        print(f"  errors: {capture['errors']}")
+
+    status = results.get("status_throughput")
+    if status:
+        latency = status["latency"]
+        print(f"Status: {status['requests_per_sec']} req/s with {status['clients']} clients "
+              f"(p50 {latency.get('p50', 0)} ms, p99 {latency.get('p99', 0)} ms)")
+        if status["errors"]:
+            print(f"  errors: {status['errors']}")
+
+def compare_results(baseline: dict, current: dict):
+    """Print p50/p95/p99 and throughput deltas against a baseline run."""
+    print(f"Comparison against baseline from {baseline['meta'].get('timestamp', '?')}:")
+    base_stages = baseline.get("capture", {}).get("stages", {})
+    for stage, stats in current["capture"]["stages"].items():
+        base = base_stages.get(stage)
+        if not base or not base.get("count") or not stats.get("count"):
+            continue
+        deltas = []
+        for key in ("p50", "p95", "p99"):
+            change = (stats[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            deltas.append(f"{key} {base[key]:.2f}->{stats[key]:.2f} ({change:+.1f}%)")
+        print(f"  {stage:24s} " + "  ".join(deltas))
+
+    base_rps = baseline.get("status_throughput", {}).get("requests_per_sec")
+    rps = current.get("status_throughput", {}).get("requests_per_sec")
+    if base_rps and rps:
+        print(f"  {'status req/s':24s} {base_rps} -> {rps} ({(rps - base_rps) / base_rps * 100:+.1f}%)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark trigger->status->image latency and bridge throughput")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Bridge server URL")
+    parser.add_argument("--kiosks", type=int, default=4, help="Concurrent virtual kiosks")
+    parser.add_argument("--scans", type=int, default=5, help="Scans per kiosk")
+    parser.add_argument("--format", default="png", choices=("png", "bmp"), help="Image format to fetch")
+    parser.add_argument("--status-clients", type=int, default=16, help="Clients for the status throughput run")
+    parser.add_argument("--status-duration", type=float, default=5.0, help="Seconds for the status throughput run (0 to skip)")
+    parser.add_argument("--spawn", action="store_true", help="Start service and bridge with the simulated device")
+    parser.add_argument("--finger-delay", type=float, default=0.3, help="Simulated finger placement delay (with --spawn)")
+    parser.add_argument("--upload-latency", type=float, default=0.1, help="Simulated upload latency (with --spawn)")
+    parser.add_argument("--detect-policy", default="adaptive", choices=("adaptive", "fixed"),
+                        help="Finger detection polling policy (with --spawn)")
+    parser.add_argument("--output", help="Write results JSON to this path")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    processes = []
+    if args.spawn:
+        processes = spawn_stack(args.url, {
+            "FINGERPRINT_SIM_DELAY": str(args.finger_delay),
+            "FINGERPRINT_SIM_UPLOAD": str(args.upload_latency),
+            "FINGERPRINT_DETECT_POLICY": args.detect_policy,
+        })
+
+    try:
+        results = {
+            "meta": {
+                "timestamp": datetime.now().isoformat(),
+                "url": args.url,
+                "kiosks": args.kiosks,
+                "scans_per_kiosk": args.scans,
+                "image_format": args.format,
+                "spawned": args.spawn,
+                "detect_policy": args.detect_policy if args.spawn else None,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            },
+            "capture": run_capture_benchmark(args.url, args.kiosks, args.scans, args.format,
+                                             args.finger_delay if args.spawn else None),
+        }
+        if args.status_duration > 0:
+            results["status_throughput"] = run_status_benchmark(args.url, args.status_clients, args.status_duration)
+    finally:
+        stop_stack(processes)
+
+    print_report(results)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare_results(json.load(f), results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -1,166 +1,920 @@
 import os
 import json
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import time
+import socket
+import secrets
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-import mimetypes
+from transport import create_bridge_transport
+from imaging import FORMATS, negotiate_format, transcode_bmp, encode_image
+from template import TEMPLATE_MIME, TEMPLATE_VERSION
+from identify import Gallery
+from archive import CaptureArchive, IMAGE_X, IMAGE_Y
+from jobs import QueueFullError, FINAL_STATES, JOB_HISTORY, is_valid_job_id, capture_file, template_file
+from assets import AssetTable
+from preview import PREVIEW_ENABLED, PREVIEW_REFRESH, PREVIEW_MIME, blank_preview
+from burst import burst_options
+from metrics import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE, SERVICE_METRICS_FILE
+
+# ===== Configuration =====
+WATCH_INTERVAL = 1.0      # Max time the status watcher waits for a push
+WATCH_ERROR_DELAY = 1.0   # Initial back-off of a watcher after an error, doubling up to WATCH_MAX_DELAY
+WATCH_MAX_DELAY = 10.0
+LONG_POLL_TIMEOUT = 25.0  # Default/maximum wait for /api/status?since=<version>
+SSE_HEARTBEAT = 15.0      # Keep-alive comment interval on /api/status/stream
+PREVIEW_BOUNDARY = b"fingerprint-preview"
+# Status versions restart at 0 with the bridge, so ETags also carry a per-process nonce
+BOOT_ID = secrets.token_hex(4)
+
+# Concurrency limits; each open connection (keep-alive or stream) holds one slot
+MAX_CONNECTIONS = int(os.environ.get("BRIDGE_MAX_CONNECTIONS", "64"))
+REQUEST_TIMEOUT = int(os.environ.get("BRIDGE_REQUEST_TIMEOUT", "10"))
+KEEPALIVE_MAX_REQUESTS = 100
+MAX_BODY_BYTES = 64 * 1024  # POST bodies are small JSON requests; larger ones get 413 unread
+
+# Files kept in memory: a capture and a template for each job the service retains
+FILE_CACHE_ENTRIES = 2 * JOB_HISTORY + 2
+
+# ===== Metrics =====
+REQUEST_SECONDS = Histogram("bridge_request_duration_seconds", "Time to answer a request, by route",
+                            ("method", "route"))
+RESPONSES_TOTAL = Counter("bridge_responses_total", "Responses sent, by route and status code",
+                          ("method", "route", "code"))
+RESPONSE_BYTES_TOTAL = Counter("bridge_response_bytes_total", "Bytes written to clients, by route", ("route",))
+ACTIVE_CONNECTIONS = Gauge("bridge_active_connections", "Open client connections")
+MAX_CONNECTIONS_GAUGE = Gauge("bridge_max_connections", "Connection limit before clients get 503")
+REJECTED_CONNECTIONS_TOTAL = Counter("bridge_rejected_connections_total",
+                                     "Connections answered with 503 because the server was full")
+STATUS_STREAMS = Gauge("bridge_status_streams", "Open /api/status/stream clients")
+PREVIEW_STREAMS = Gauge("bridge_preview_streams", "Open /api/preview/stream clients")
+PREVIEW_FRAMES_TOTAL = Counter("bridge_preview_frames_total", "Live preview frames received from the service")
+SERVICE_METRICS_AGE = Gauge("bridge_service_metrics_age_seconds",
+                            "Age of the capture service's last metrics export; grows when the service is down")
+
+# Routes whose last path segment is an ID, reported as one route each
+ID_ROUTES = ('/api/status/', '/api/image/', '/api/template/', '/api/archive/')
+API_ROUTES = {'/', '/metrics', '/api/status', '/api/status/stream', '/api/preview/stream', '/api/image',
+              '/api/archive', '/api/trigger-scan', '/api/cancel-scan', '/api/enroll', '/api/identify'}
+
+def route_label(path: str) -> str:
+    """Bounded route name for a request path, for metric labels."""
+    path = path.split('?', 1)[0]
+    if path in API_ROUTES:
+        return path
+    for prefix in ID_ROUTES:
+        if path.startswith(prefix):
+            return prefix + '{job_id}'
+    return 'other' if path.startswith('/api/') else 'static'
+
+def service_metrics_age() -> float:
+    try:
+        return max(0.0, time.time() - os.path.getmtime(SERVICE_METRICS_FILE))
+    except OSError:
+        return float("inf")
+
+SERVICE_METRICS_AGE.set_function(service_metrics_age)
+
+class CountingWriter:
+    """Wraps a connection's write file and counts the bytes written."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+SERVICE_NOT_RUNNING = {
+    "status": "error",
+    "message": "Service not running",
+    "timestamp": "",
+    "image_path": None,
+    "error": "status_file_missing"
+}
+
+class StatusBroadcaster:
+    """Single status watcher shared by every status client.
+
+    One background thread reads status from the transport and bumps a version
+    counter on every change; status requests, long-polls and event streams only
+    wait on the shared condition, so N subscribers cost one status read.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.version = 0
+        self.status = None
+        self.payload = b""
+        self._cond = threading.Condition()
+        threading.Thread(target=self._watch_loop, name="status-watcher", daemon=True).start()
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            status = self.transport.read_status()
+        except Exception as e:
+            print(f"Error reading status: {e}")
+            return
+        if status is None:
+            status = SERVICE_NOT_RUNNING
+        with self._cond:
+            if status != self.status:
+                self.status = status
+                self.version += 1
+                self.payload = json.dumps({**status, "version": self.version}, separators=(',', ':')).encode('utf-8')
+                self._cond.notify_all()
+
+    def _watch_loop(self):
+        # Must never die: every SSE and long-poll client depends on it
+        delay = WATCH_ERROR_DELAY
+        while True:
+            try:
+                self.transport.wait_for_update(WATCH_INTERVAL)
+                self._refresh()
+                delay = WATCH_ERROR_DELAY
+            except Exception as e:
+                print(f"Status watcher error: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, WATCH_MAX_DELAY)
+
+    def snapshot(self):
+        """Return the current (version, status, payload) triple."""
+        with self._cond:
+            return self.version, self.status, self.payload
+
+    def wait_for(self, since: int, timeout: float):
+        """Wait until the version exceeds since, returning (version, status, payload)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since, timeout)
+            return self.version, self.status, self.payload
+
+class PreviewBroadcaster:
+    """Latest live preview frame shared by every preview client.
+
+    While anyone watches, one thread keeps asking the service for preview
+    frames and bumps a version on each new one. Clients wait on the version
+    and always take the newest frame, so a slow client skips frames instead
+    of queueing them and never holds up the service or other clients.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.version = 0
+        self.frame = None
+        self.clients = 0
+        self._cond = threading.Condition()
+        threading.Thread(target=self._watch_loop, name="preview-watcher", daemon=True).start()
+
+    def _watch_loop(self):
+        requested = 0.0
+        delay = WATCH_ERROR_DELAY
+        while True:
+            with self._cond:
+                while self.clients == 0:
+                    self._cond.wait()
+            try:
+                now = time.monotonic()
+                if now - requested >= PREVIEW_REFRESH:
+                    requested = now
+                    self.transport.request_preview()
+                frame = self.transport.read_preview(PREVIEW_REFRESH)
+                delay = WATCH_ERROR_DELAY
+            except Exception as e:
+                print(f"Preview watcher error: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, WATCH_MAX_DELAY)
+                continue
+            if frame is not None:
+                PREVIEW_FRAMES_TOTAL.inc()
+                with self._cond:
+                    self.frame = frame
+                    self.version += 1
+                    self._cond.notify_all()
+
+    def attach(self) -> int:
+        """Register a client, returning the current version to wait past."""
+        with self._cond:
+            self.clients += 1
+            self._cond.notify_all()
+            return self.version
+
+    def detach(self):
+        with self._cond:
+            self.clients -= 1
+
+    def wait_for(self, since: int, timeout: float):
+        """Wait until the version passes since, returning (version, frame)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since, timeout)
+            return self.version, self.frame
+
+class FileCache:
+    """In-memory LRU cache of file contents keyed on mtime and size.
+
+    Serving a cached file costs one stat; the file is only re-read after the
+    service rewrites it. Entries carry a strong ETag derived from the same key.
+    Derived variants (e.g. a PNG of a BMP) live with their file's entry. At
+    most max_entries files are kept, and a file's entry is dropped as soon as
+    it is found deleted, so pruned jobs do not stay in memory.
+    """
+
+    def __init__(self, max_entries: int = FILE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> [key, etag, content, {variant: data}]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _lookup(self, path: str):
+        """Return the current entry for path, re-reading it if it changed, or None."""
+        try:
+            st = os.stat(path)
+            key = (st.st_mtime_ns, st.st_size)
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry and entry[0] == key:
+                    self._entries.move_to_end(path)
+                    return entry
+            with open(path, 'rb') as f:
+                content = f.read()
+            # Only cache if the file did not change while it was being read
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+        entry = [key, f'"{key[0]:x}-{key[1]:x}"', content, {}]
+        if (st.st_mtime_ns, st.st_size) == key:
+            with self._lock:
+                self._entries[path] = entry
+                self._entries.move_to_end(path)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+    def get(self, path: str):
+        """Return (etag, content) for path, or None if it does not exist."""
+        entry = self._lookup(path)
+        return None if entry is None else (entry[1], entry[2])
+
+    def get_variant(self, path: str, name: str, transform):
+        """Return (etag, transform(content)) for path, cached until the file changes."""
+        entry = self._lookup(path)
+        if entry is None:
+            return None
+        variant_etag = f'{entry[1][:-1]}-{name}"'
+        data = entry[3].get(name)
+        if data is None:
+            data = entry[3][name] = transform(entry[2])
+        return variant_etag, data
+
+class BridgeHTTPServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a bounded number of concurrent connections.
+
+    Each connection is served on its own daemon thread, so a slow download or
+    stalled client no longer blocks other kiosks. Connections beyond
+    max_connections are answered with 503 instead of queueing unbounded threads.
+    """
+
+    def __init__(self, server_address, handler_class, max_connections: int = MAX_CONNECTIONS):
+        super().__init__(server_address, handler_class)
+        self.max_connections = max_connections
+        self.active_connections = 0
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._count_lock = threading.Lock()
+        ACTIVE_CONNECTIONS.set_function(lambda: self.active_connections)
+        MAX_CONNECTIONS_GAUGE.set(max_connections)
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.reject_request(request)
+            return
+        with self._count_lock:
+            self.active_connections += 1
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self._release_slot()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._count_lock:
+            self.active_connections -= 1
+        self._slots.release()
+
+    def reject_request(self, request):
+        """Answer a connection over the limit with 503 and close it."""
+        REJECTED_CONNECTIONS_TOTAL.inc()
+        try:
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\n"
+                            b"Retry-After: 1\r\n"
+                            b"Content-Length: 0\r\n"
+                            b"Connection: close\r\n\r\n")
+        except OSError:
+            pass
+        self.shutdown_request(request)
 
 class FingerprintBridgeHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests; idle connections and
+    # stalled reads/writes are dropped after the socket timeout
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+    # Headers and body go out in separate writes; without TCP_NODELAY each
+    # keep-alive response stalls on Nagle + delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    
     def __init__(self, *args, **kwargs):
         self.project_root = os.path.dirname(os.path.abspath(__file__))
         self.communication_dir = os.path.join(os.path.dirname(self.project_root), "communication")
-        self.frontend_dir = os.path.join(os.path.dirname(self.project_root), "frontend-vue")
+        self.requests_served = 0
+        self.request_started = None
+        self.response_code = None
         super().__init__(*args, **kwargs)
     
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+    
+    def parse_request(self):
+        # Timed from here rather than handle_one_request, which also waits
+        # for the next request on an idle keep-alive connection
+        self.request_started = time.perf_counter()
+        return super().parse_request()
+    
+    def handle_one_request(self):
+        self.requests_served += 1
+        self.request_started = None
+        written = self.wfile.written
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_started is not None:
+                self.record_request(time.perf_counter() - self.request_started, self.wfile.written - written)
+        if self.requests_served >= KEEPALIVE_MAX_REQUESTS:
+            self.close_connection = True
+    
+    def record_request(self, seconds: float, written: int):
+        """Record one request's latency, status code and response size."""
+        method = self.command or "-"
+        route = route_label(self.path) if self.command else "other"
+        REQUEST_SECONDS.labels(method, route).observe(seconds)
+        RESPONSES_TOTAL.labels(method, route, self.response_code or "-").inc()
+        RESPONSE_BYTES_TOTAL.labels(route).inc(written)
+    
+    def log_request(self, code='-', size='-'):
+        self.response_code = int(code) if isinstance(code, int) else code
+        super().log_request(code, size)
+    
+    def read_body(self):
+        """Read the request body so the connection can be reused.
+
+        Replies 400 to a malformed Content-Length and 413 to a body over
+        MAX_BODY_BYTES without reading it, closes the connection and returns
+        None.
+        """
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, "Invalid Content-Length")
+        elif length > MAX_BODY_BYTES:
+            self.send_error(413, "Request body too large")
+        else:
+            return self.rfile.read(length) if length > 0 else b""
+        self.close_connection = True
+        return None
+    
     def do_GET(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
         
-        if path == '/':
-            # Serve the main HTML file
-            self.serve_file(os.path.join(self.frontend_dir, "index.html"))
+        if path == '/metrics':
+            # Bridge and capture service metrics in Prometheus text format
+            self.serve_metrics()
+            
+        elif path == '/api/status/stream':
+            # Push status changes as Server-Sent Events
+            self.serve_status_stream(parse_qs(parsed_path.query))
+            
+        elif path == '/api/preview/stream':
+            # Stream live sensor frames as multipart PNG
+            self.serve_preview_stream()
+            
+        elif path.startswith('/api/status/'):
+            # Return the status of a single capture job
+            self.serve_job_status(path[len('/api/status/'):])
             
         elif path.startswith('/api/status'):
-            # Return status.json content
-            self.serve_status()
+            # Return current status, optionally long-polling for a change
+            self.serve_status(parse_qs(parsed_path.query))
             
-        elif path.startswith('/api/image'):
-            # Return the latest captured image
-            self.serve_image()
+        elif path.startswith('/api/image/'):
+            # Return a capture job's image
+            job_id = path[len('/api/image/'):]
+            if is_valid_job_id(job_id):
+                self.serve_image(parse_qs(parsed_path.query), capture_file(job_id))
+            else:
+                self.send_error(404, "Unknown job")
+            
+        elif path.startswith('/api/template/'):
+            # Return a capture job's minutiae template
+            self.serve_template(path[len('/api/template/'):])
             
-        elif path.endswith('.css'):
-            # Serve CSS files
-            self.serve_file(os.path.join(self.frontend_dir, path.lstrip('/')))
+        elif path.startswith('/api/archive/'):
+            # Return an archived frame by job ID
+            self.serve_archived_image(parse_qs(parsed_path.query), path[len('/api/archive/'):])
             
-        elif path.endswith('.js'):
-            # Serve JavaScript files
-            self.serve_file(os.path.join(self.frontend_dir, path.lstrip('/')))
+        elif path == '/api/archive':
+            # List archived frames in a time range (?since=&until=&limit=)
+            self.serve_archive_index(parse_qs(parsed_path.query))
+            
+        elif path.startswith('/api/image'):
+            # Return the latest captured image (?format=png|bmp or Accept)
+            self.serve_image(parse_qs(parsed_path.query))
             
         else:
-            self.send_error(404, "File not found")
+            # Frontend files (index.html at /) from the preloaded asset table
+            self.serve_asset(path)
     
     def do_POST(self):
         parsed_path = urlparse(self.path)
         path = parsed_path.path
+        body = self.read_body()
+        if body is None:
+            return
         
         if path == '/api/trigger-scan':
-            # Create capture request flag
-            self.trigger_scan()
+            # Send capture request
+            self.trigger_scan(body)
+        elif path == '/api/cancel-scan':
+            # Cancel a queued or running capture job
+            self.cancel_scan(body)
+        elif path == '/api/enroll':
+            # Enrol a capture job's template under a user ID
+            self.enroll(body)
+        elif path == '/api/identify':
+            # Identify a capture job's print against the gallery
+            self.identify(body)
         else:
             self.send_error(404, "Endpoint not found")
     
-    def serve_file(self, file_path):
-        """Serve a static file"""
-        try:
-            if os.path.exists(file_path):
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-                
-                # Determine content type
-                content_type, _ = mimetypes.guess_type(file_path)
-                if content_type is None:
-                    content_type = 'application/octet-stream'
-                
-                self.send_response(200)
-                self.send_header('Content-Type', content_type)
-                self.send_header('Content-Length', str(len(content)))
-                self.add_cors_headers()
-                self.end_headers()
-                self.wfile.write(content)
-            else:
-                self.send_error(404, "File not found")
-        except Exception as e:
-            print(f"Error serving file {file_path}: {e}")
-            self.send_error(500, "Internal server error")
+    def serve_asset(self, path):
+        """Serve a static frontend file, compressed as the client allows"""
+        asset = self.server.assets.get(path)
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+        
+        encoding, etag, body = asset.select(self.headers.get('Accept-Encoding'))
+        if self.is_not_modified(etag):
+            self.send_not_modified(etag, asset.cache_control)
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', asset.content_type)
+        self.send_header('Content-Length', str(len(body) if body is not None else asset.size))
+        if encoding != 'identity':
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', asset.cache_control)
+        self.add_cors_headers()
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+        else:
+            self.send_file_body(asset.path, asset.size)
+    
+    def send_file_body(self, path: str, size: int):
+        """Copy a file to the client; uses sendfile where the platform has it"""
+        with open(path, 'rb') as f:
+            sent = self.connection.sendfile(f, 0, size)
+        # Bypasses wfile, so count the bytes for the metrics here
+        self.wfile.written += sent
     
-    def serve_status(self):
-        """Serve the current status from status.json"""
+    def serve_status(self, query):
+        """Serve the current status, waiting for a newer version if ?since= is given"""
         try:
-            status_file = os.path.join(self.communication_dir, "status.json")
-            
-            if os.path.exists(status_file):
-                with open(status_file, 'r') as f:
-                    status_data = json.load(f)
+            broadcaster = self.server.broadcaster
+            if 'since' in query:
+                since = int(query['since'][0])
+                timeout = min(float(query.get('timeout', [LONG_POLL_TIMEOUT])[0]), LONG_POLL_TIMEOUT)
+                version, _, payload = broadcaster.wait_for(since, timeout)
             else:
-                # Default status if file doesn't exist
-                status_data = {
-                    "status": "error",
-                    "message": "Service not running",
-                    "timestamp": "",
-                    "image_path": None,
-                    "error": "status_file_missing"
-                }
+                version, _, payload = broadcaster.snapshot()
             
-            response_json = json.dumps(status_data)
+            etag = f'"status-{BOOT_ID}-{version}"'
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('ETag', etag)
             self.add_cors_headers()
             self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
+            self.wfile.write(payload)
             
+        except ValueError:
+            self.send_error(400, "Invalid since/timeout parameter")
         except Exception as e:
             print(f"Error serving status: {e}")
             self.send_error(500, "Error reading status")
     
-    def serve_image(self):
-        """Serve the latest captured fingerprint image"""
+    def serve_status_stream(self, query):
+        """Stream status changes as Server-Sent Events"""
         try:
-            image_file = os.path.join(self.communication_dir, "latest_capture.bmp")
-            
-            if os.path.exists(image_file):
-                with open(image_file, 'rb') as f:
-                    image_data = f.read()
-                
-                self.send_response(200)
-                self.send_header('Content-Type', 'image/bmp')
-                self.send_header('Content-Length', str(len(image_data)))
-                self.add_cors_headers()
-                self.end_headers()
-                self.wfile.write(image_data)
+            last_id = self.headers.get('Last-Event-ID') or query.get('since', ['0'])[0]
+            last_version = int(last_id)
+        except ValueError:
+            last_version = 0
+        
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        # The stream has no length, so it ends the connection when it closes
+        self.send_header('Connection', 'close')
+        self.add_cors_headers()
+        self.end_headers()
+        
+        broadcaster = self.server.broadcaster
+        STATUS_STREAMS.inc()
+        try:
+            while True:
+                version, _, payload = broadcaster.wait_for(last_version, SSE_HEARTBEAT)
+                if version > last_version:
+                    self.wfile.write(f"id: {version}\ndata: ".encode('utf-8') + payload + b"\n\n")
+                    last_version = version
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            STATUS_STREAMS.dec()
+    
+    def serve_preview_stream(self):
+        """Stream live sensor frames as a multipart/x-mixed-replace PNG sequence"""
+        if not PREVIEW_ENABLED:
+            self.send_error(404, "Live preview disabled")
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={PREVIEW_BOUNDARY.decode()}')
+        self.send_header('Cache-Control', 'no-cache')
+        # The stream has no length, so it ends the connection when it closes
+        self.send_header('Connection', 'close')
+        self.add_cors_headers()
+        self.end_headers()
+        
+        broadcaster = self.server.preview
+        last_version = broadcaster.attach()
+        PREVIEW_STREAMS.inc()
+        try:
+            # Start with an empty sensor so the client shows something at once;
+            # frames from before the client connected are stale
+            self.wfile.write(b"--" + PREVIEW_BOUNDARY + b"\r\n")
+            self.write_preview_part(self.server.blank_preview)
+            while True:
+                version, frame = broadcaster.wait_for(last_version, SSE_HEARTBEAT)
+                if version > last_version:
+                    self.write_preview_part(frame["png"])
+                    last_version = version
+                else:
+                    # Nothing new: repeat the last frame so dead clients are noticed
+                    self.write_preview_part(frame["png"] if frame else self.server.blank_preview)
+        except (BrokenPipeError, ConnectionResetError, socket.timeout):
+            pass
+        finally:
+            broadcaster.detach()
+            PREVIEW_STREAMS.dec()
+    
+    def write_preview_part(self, png: bytes):
+        """Write one frame, closed by the next boundary so clients show it at once"""
+        self.wfile.write(f"Content-Type: {PREVIEW_MIME}\r\nContent-Length: {len(png)}\r\n\r\n".encode('ascii') +
+                         png + b"\r\n--" + PREVIEW_BOUNDARY + b"\r\n")
+        self.wfile.flush()
+    
+    def serve_metrics(self):
+        """Serve this process's metrics followed by the capture service's last export"""
+        body = REGISTRY.render().encode('utf-8')
+        try:
+            with open(SERVICE_METRICS_FILE, 'rb') as f:
+                body += f.read()
+        except OSError:
+            pass  # Service not started yet; its age gauge reports +Inf
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.add_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def serve_job_status(self, job_id):
+        """Serve the status record of a capture job"""
+        try:
+            record = self.server.transport.read_job(job_id) if is_valid_job_id(job_id) else None
+            if record is None:
+                self.send_error(404, "Unknown job")
+                return
+            self.send_json(record, headers={'Cache-Control': 'no-cache'})
+        except Exception as e:
+            print(f"Error serving job status: {e}")
+            self.send_error(500, "Error reading job status")
+    
+    def serve_image(self, query, image_file=None):
+        """Serve a captured fingerprint image, by default the latest one"""
+        try:
+            fmt = negotiate_format(query.get('format', [None])[0], self.headers.get('Accept'))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        try:
+            if image_file is None:
+                image_file = os.path.join(self.communication_dir, "latest_capture.bmp")
+            if fmt == "bmp":
+                cached = self.server.file_cache.get(image_file)
             else:
+                cached = self.server.file_cache.get_variant(
+                    image_file, fmt, lambda data: transcode_bmp(data, fmt))
+            
+            if cached is None:
                 self.send_error(404, "No image available")
+                return
+            
+            etag, image_data = cached
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
+            
+            self.send_response(200)
+            self.send_header('Content-Type', FORMATS[fmt])
+            self.send_header('Content-Length', str(len(image_data)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept')
+            self.send_header('ETag', etag)
+            self.add_cors_headers()
+            self.end_headers()
+            self.wfile.write(image_data)
                 
         except Exception as e:
             print(f"Error serving image: {e}")
             self.send_error(500, "Error reading image")
     
-    def trigger_scan(self):
-        """Create capture request flag file"""
+    def serve_template(self, job_id):
+        """Serve the binary minutiae template extracted from a capture job"""
         try:
-            flag_file = os.path.join(self.communication_dir, "capture_request.flag")
-            
-            # Create the flag file
-            with open(flag_file, 'w') as f:
-                f.write("")
+            cached = self.server.file_cache.get(template_file(job_id)) if is_valid_job_id(job_id) else None
+            if cached is None:
+                self.send_error(404, "No template available")
+                return
             
-            response = {"success": True, "message": "Scan triggered"}
-            response_json = json.dumps(response)
+            etag, data = cached
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
             
+            # A job's template never changes once written
             self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Content-Length', str(len(response_json)))
+            self.send_header('Content-Type', TEMPLATE_MIME)
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Cache-Control', 'max-age=31536000, immutable')
+            self.send_header('ETag', etag)
+            self.send_header('X-Template-Version', str(TEMPLATE_VERSION))
             self.add_cors_headers()
             self.end_headers()
-            self.wfile.write(response_json.encode('utf-8'))
+            self.wfile.write(data)
+            
+        except Exception as e:
+            print(f"Error serving template: {e}")
+            self.send_error(500, "Error reading template")
+    
+    def trigger_scan(self, body):
+        """Queue a capture job with the fingerprint service"""
+        # Optional burst settings: {"burst": <frames>, "publish_all": <bool>}
+        try:
+            options = json.loads(body or b'{}')
+        except ValueError:
+            options = {}
+        request = {"requested_at": time.time()}
+        if isinstance(options, dict):
+            try:
+                burst_options(options)
+            except ValueError as e:
+                self.send_json({"success": False, "message": str(e), "error": "invalid_burst"}, 400)
+                return
+            request.update((k, options[k]) for k in ("burst", "publish_all") if k in options)
+        
+        try:
+            # Status versions after this one belong to the triggered scan
+            version, _, _ = self.server.broadcaster.snapshot()
+            job_id = self.server.transport.trigger(request)
+            
+            response = {"success": True, "message": "Scan triggered", "version": version, "job_id": job_id}
+            self.send_json(response)
             
-            print("Scan triggered via API")
+            print(f"Scan triggered via API (job {job_id})")
+            
+        except QueueFullError:
+            response = {"success": False, "message": "Scanner busy, please try again", "error": "queue_full"}
+            self.send_json(response, 429, {'Retry-After': '1'})
             
         except Exception as e:
             print(f"Error triggering scan: {e}")
             self.send_error(500, "Failed to trigger scan")
     
+    def serve_archive_index(self, query):
+        """Serve archive entries with since <= timestamp < until, oldest first"""
+        try:
+            since = float(query['since'][0]) if 'since' in query else None
+            until = float(query['until'][0]) if 'until' in query else None
+            limit = max(1, min(int(query.get('limit', [100])[0]), 1000))
+        except ValueError:
+            self.send_error(400, "Invalid archive query")
+            return
+        
+        try:
+            entries = self.server.archive.scan(since, until, limit)
+            self.send_json({"entries": [e.to_dict() for e in entries], "total": len(self.server.archive)},
+                           headers={'Cache-Control': 'no-cache'})
+        except Exception as e:
+            print(f"Error reading archive: {e}")
+            self.send_error(500, "Error reading archive")
+    
+    def serve_archived_image(self, query, job_id):
+        """Serve an archived frame, encoded on the fly"""
+        try:
+            fmt = negotiate_format(query.get('format', [None])[0], self.headers.get('Accept'))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        
+        try:
+            frame = self.server.archive.read(job_id) if is_valid_job_id(job_id) else None
+            if frame is None:
+                self.send_error(404, "Frame not archived")
+                return
+            
+            # Archived frames never change, so the job ID is a strong ETag
+            etag = f'"archive-{job_id}-{fmt}"'
+            if self.is_not_modified(etag):
+                self.send_not_modified(etag)
+                return
+            
+            image_data = encode_image(frame, fmt, IMAGE_X, IMAGE_Y)
+            self.send_response(200)
+            self.send_header('Content-Type', FORMATS[fmt])
+            self.send_header('Content-Length', str(len(image_data)))
+            self.send_header('Cache-Control', 'max-age=31536000, immutable')
+            self.send_header('Vary', 'Accept')
+            self.send_header('ETag', etag)
+            self.add_cors_headers()
+            self.end_headers()
+            self.wfile.write(image_data)
+            
+        except Exception as e:
+            print(f"Error serving archived image: {e}")
+            self.send_error(500, "Error reading archive")
+    
+    def read_job_template(self, body):
+        """Parse a JSON body naming a job and load its template, or send an error"""
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            self.send_json({"success": False, "message": "Invalid JSON body"}, 400)
+            return None, None
+        if self.server.gallery is None:
+            self.send_json({"success": False, "message": "Identification unavailable"}, 503)
+            return None, None
+        
+        job_id = request.get('job_id')
+        cached = self.server.file_cache.get(template_file(job_id)) if is_valid_job_id(job_id) else None
+        if cached is None:
+            self.send_json({"success": False, "message": "No template for job"}, 404)
+            return None, None
+        return request, cached[1]
+    
+    def enroll(self, body):
+        """Add a capture job's template to the gallery"""
+        try:
+            request, template = self.read_job_template(body)
+            if request is None:
+                return
+            user_id = request.get('user_id')
+            if not isinstance(user_id, str) or not user_id or len(user_id) > 256:
+                self.send_json({"success": False, "message": "user_id is required"}, 400)
+                return
+            size = self.server.gallery.enroll(user_id, template)
+            self.send_json({"success": True, "user_id": user_id, "gallery_size": size})
+            print(f"Enrolled {user_id} from job {request['job_id']}")
+            
+        except Exception as e:
+            print(f"Error enrolling template: {e}")
+            self.send_error(500, "Failed to enroll")
+    
+    def identify(self, body):
+        """Match a capture job's template against the gallery"""
+        try:
+            request, template = self.read_job_template(body)
+            if request is None:
+                return
+            top = max(1, min(int(request.get('top', 5)), 50))
+            result = self.server.gallery.identify(template, top=top)
+            self.send_json({"success": True, "job_id": request['job_id'], **result})
+            
+        except (TypeError, ValueError) as e:
+            self.send_json({"success": False, "message": str(e)}, 400)
+        except Exception as e:
+            print(f"Error identifying template: {e}")
+            self.send_error(500, "Failed to identify")
+    
+    def cancel_scan(self, body):
+        """Ask the fingerprint service to cancel a capture job"""
+        try:
+            try:
+                request = json.loads(body or b'{}')
+            except ValueError:
+                request = None
+            job_id = request.get('job_id') if isinstance(request, dict) else None
+            record = self.server.transport.read_job(job_id) if is_valid_job_id(job_id) else None
+            if record is None:
+                self.send_json({"success": False, "message": "Unknown job"}, 404)
+                return
+            if record.get('status') in FINAL_STATES:
+                self.send_json({"success": False, "message": f"Job already {record['status']}",
+                                "status": record['status']}, 409)
+                return
+            
+            self.server.transport.cancel(job_id)
+            self.send_json({"success": True, "message": "Cancellation requested", "job_id": job_id})
+            print(f"Scan cancelled via API (job {job_id})")
+            
+        except Exception as e:
+            print(f"Error cancelling scan: {e}")
+            self.send_error(500, "Failed to cancel scan")
+    
+    def send_json(self, data, code=200, headers=None):
+        """Send a JSON response"""
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.add_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def is_not_modified(self, etag: str) -> bool:
+        """Check whether the client's If-None-Match matches etag"""
+        header = self.headers.get('If-None-Match')
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or etag in tags
+    
+    def send_not_modified(self, etag: str, cache_control: str = 'no-cache'):
+        """Send a 304 response for a cached representation"""
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.add_cors_headers()
+        self.end_headers()
+    
     def add_cors_headers(self):
         """Add CORS headers for frontend compatibility"""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        # self.send_header('Connection', 'keep-alive')
-        # self.send_header('Keep-Alive', 'timeout=5, max=100')
+        if not self.close_connection:
+            remaining = KEEPALIVE_MAX_REQUESTS - self.requests_served
+            self.send_header('Keep-Alive', f'timeout={REQUEST_TIMEOUT}, max={remaining}')
     
     def do_OPTIONS(self):
         """Handle preflight requests"""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.add_cors_headers()
         self.end_headers()
     
@@ -170,17 +924,44 @@ class FingerprintBridgeHandler(BaseHTTPRequestHandler):
 
 def main():
     server_address = ('localhost', 8080)
-    httpd = HTTPServer(server_address, FingerprintBridgeHandler)
+    httpd = BridgeHTTPServer(server_address, FingerprintBridgeHandler)
+    httpd.transport = create_bridge_transport()
+    httpd.broadcaster = StatusBroadcaster(httpd.transport)
+    httpd.preview = PreviewBroadcaster(httpd.transport)
+    httpd.blank_preview = blank_preview(IMAGE_X, IMAGE_Y)
+    httpd.file_cache = FileCache()
+    httpd.assets = AssetTable()
+    httpd.archive = CaptureArchive(readonly=True)
+    try:
+        httpd.gallery = Gallery()
+    except RuntimeError as e:
+        print(f"Gallery disabled: {e}")
+        httpd.gallery = None
     
     print("=" * 60)
     print("FINGERPRINT BRIDGE SERVER")
     print("=" * 60)
     print(f"Server running on http://localhost:8080")
+    print(f"Transport: {httpd.transport.name}")
+    print(f"Max connections: {httpd.max_connections}, request timeout: {REQUEST_TIMEOUT}s")
+    print(f"Static assets: {len(httpd.assets)} files from {httpd.assets.root} "
+          f"({httpd.assets.memory_bytes() // 1024} KiB in memory)")
     print("Frontend accessible at: http://localhost:8080")
     print("API endpoints:")
-    print("  GET  /api/status  - Get scanner status")
-    print("  GET  /api/image   - Get latest fingerprint image") 
-    print("  POST /api/trigger-scan - Trigger fingerprint capture")
+    print("  GET  /api/status  - Get scanner status (?since=<version> to long-poll)")
+    print("  GET  /api/status/stream - Stream status changes (Server-Sent Events)")
+    print("  GET  /api/status/<job_id> - Get the status of a capture job")
+    print("  GET  /api/preview/stream - Live sensor preview (multipart PNG)")
+    print("  GET  /api/image   - Get latest fingerprint image (?format=png|bmp)")
+    print("  GET  /api/image/<job_id>  - Get a capture job's image")
+    print("  GET  /api/template/<job_id>  - Get a capture job's minutiae template")
+    print("  GET  /api/archive  - List archived frames (?since=&until=&limit=)")
+    print("  GET  /api/archive/<job_id>  - Get an archived frame (?format=png|bmp)")
+    print("  GET  /metrics     - Bridge and service metrics (Prometheus text format)")
+    print("  POST /api/trigger-scan - Queue a fingerprint capture (returns job_id; body {\"burst\": N} keeps the best of N frames)")
+    print("  POST /api/cancel-scan - Cancel a queued or running capture ({job_id})")
+    print("  POST /api/enroll  - Enrol a job's template ({user_id, job_id})")
+    print("  POST /api/identify  - Identify a job's print against the gallery ({job_id})")
     print("=" * 60)
     print("Press Ctrl+C to stop server")
     
@@ -189,6 +970,10 @@ def main():
     except KeyboardInterrupt:
         print("\nShutting down server...")
         httpd.shutdown()
+        httpd.transport.close()
+        if httpd.gallery is not None:
+            httpd.gallery.close()
+        httpd.archive.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
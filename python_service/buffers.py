@@ -0,0 +1,65 @@
+import queue
+from ctypes import c_ubyte
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; CaptureBuffer.array() requires it
+    np = None
+
+# ===== Configuration =====
+IMAGE_X, IMAGE_Y = 256, 288
+IMAGE_BYTES = IMAGE_X * IMAGE_Y
+POOL_SIZE = 4
+
+class CaptureBuffer:
+    """Pre-allocated image buffer the device uploads into directly.
+
+    `view` and `array()` expose the valid bytes without copying; release the
+    buffer (or leave its `with` block) once every consumer is done with them.
+    """
+
+    def __init__(self, pool, size: int):
+        self.pool = pool
+        self.raw = (c_ubyte * size)()
+        self.length = 0
+
+    @property
+    def view(self) -> memoryview:
+        """Zero-copy view of the captured bytes."""
+        return memoryview(self.raw).cast('B')[:self.length]
+
+    def array(self, width: int = IMAGE_X, height: int = IMAGE_Y):
+        """Zero-copy (height, width) uint8 NumPy view of the captured bytes."""
+        return np.frombuffer(self.raw, dtype=np.uint8, count=width * height).reshape(height, width)
+
+    def release(self):
+        """Return the buffer to its pool."""
+        self.pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class BufferPool:
+    """Fixed set of reusable capture buffers."""
+
+    def __init__(self, count: int = POOL_SIZE, size: int = IMAGE_BYTES):
+        self.size = size
+        # LIFO so the most recently used (cache-warm) buffer is reused first
+        self._free = queue.LifoQueue()
+        for _ in range(count):
+            self._free.put(CaptureBuffer(self, size))
+
+    def acquire(self, timeout: float = None) -> CaptureBuffer:
+        """Take a free buffer, waiting up to timeout seconds for one."""
+        try:
+            buf = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise RuntimeError("No free capture buffer available")
+        buf.length = 0
+        return buf
+
+    def release(self, buf: CaptureBuffer):
+        self._free.put(buf)
@@ -0,0 +1,113 @@
+import os
+import time
+import ctypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from buffers import BufferPool, CaptureBuffer
+from device import Device, DeviceError, CaptureCancelled, PS_OK, PS_NO_FINGER, IMAGE_X, IMAGE_Y
+from quality import burst_score
+
+# ===== Configuration =====
+# Frames per capture when a request does not ask; 1 takes the first frame as before
+BURST_FRAMES = int(os.environ.get("FINGERPRINT_BURST_FRAMES", "1"))
+MAX_BURST_FRAMES = 8
+BURST_SCORERS = 2     # Threads scoring frames while the next one uploads
+BURST_BUFFERS = 3     # Buffers a burst holds at once: best so far, being scored, being uploaded
+
+# Frames are scored off the capture thread; NumPy and the sensor calls both
+# release the GIL, so scoring overlaps the next upload
+scorer = ThreadPoolExecutor(max_workers=BURST_SCORERS, thread_name_prefix="burst-score")
+
+def burst_options(request: dict) -> tuple:
+    """(frames, publish_all) requested for a capture; ValueError if invalid.
+
+    "burst" is the number of frames to take (default BURST_FRAMES) and
+    "publish_all" sends every frame to the live preview, not just the best.
+    """
+    frames = request.get("burst", BURST_FRAMES)
+    if isinstance(frames, bool) or not isinstance(frames, int) or not 1 <= frames <= MAX_BURST_FRAMES:
+        raise ValueError(f"burst must be an integer from 1 to {MAX_BURST_FRAMES}")
+    publish_all = request.get("publish_all", False)
+    if not isinstance(publish_all, bool):
+        raise ValueError("publish_all must be true or false")
+    return frames, publish_all
+
+def _score(buf: CaptureBuffer):
+    return burst_score(buf.view, IMAGE_X, IMAGE_Y)
+
+def capture_burst(device: Device, buf: CaptureBuffer, pool: BufferPool, frames: int, timeout: float,
+                  timings: dict = None, cancel: threading.Event = None, on_frame=None,
+                  on_poll=None, stats: dict = None) -> dict:
+    """Capture up to frames consecutive images and leave the sharpest in buf.
+
+    The first frame is captured as usual, waiting for a finger; the rest
+    are taken back to back while the finger stays down, and the burst ends
+    early once it is lifted. Each frame is scored on the scorer pool while
+    the next one uploads, and only the best so far is kept, so a burst of
+    any length needs two buffers from pool besides buf. on_frame(buf) is
+    called with every frame as it arrives, and on_poll and stats are passed
+    on to Device.capture for the wait for the first one. Without NumPy frames cannot be
+    scored and the last one, taken once the finger has settled, is kept.
+
+    Returns {"frames", "best", "scores"}; timings gets "burst_ms" for the
+    frames after the first.
+    """
+    cancel = cancel or threading.Event()
+    device.capture(buf, timeout, timings, cancel=cancel, on_poll=on_poll, stats=stats)
+    if on_frame is not None:
+        on_frame(buf)
+    if frames <= 1:
+        return {"frames": 1, "best": 0, "scores": []}
+
+    started = time.perf_counter()
+    scores = []
+    with pool.acquire(timeout) as spare1, pool.acquire(timeout) as spare2:
+        free = [spare1, spare2]
+        best = best_score = None
+        pending = (0, buf, scorer.submit(_score, buf))
+
+        def settle(pending):
+            # Keep the scored frame if it beats the best so far; free the loser
+            nonlocal best, best_score
+            index, frame, future = pending
+            score = future.result()
+            scores.append(score)
+            if best is None or best_score is None or (score is not None and score > best_score):
+                if best is not None:
+                    free.append(best[1])
+                best, best_score = (index, frame), score
+            else:
+                free.append(frame)
+
+        try:
+            for index in range(1, frames):
+                if cancel.is_set():
+                    raise CaptureCancelled("Capture cancelled")
+                rc = device.get_image()
+                if rc == PS_NO_FINGER:
+                    break  # Finger lifted; rank what we have
+                if rc != PS_OK:
+                    raise DeviceError(f"Burst capture failed: {device.err_text(rc)}", rc)
+                frame = free.pop()
+                rc = device.up_image(frame)
+                if rc != PS_OK:
+                    free.append(frame)
+                    raise DeviceError(f"Image upload failed: {device.err_text(rc)}", rc)
+                if on_frame is not None:
+                    on_frame(frame)
+                settle(pending)
+                pending = (index, frame, scorer.submit(_score, frame))
+            settle(pending)
+        finally:
+            # Never hand a buffer back to the pool while a scorer still reads it
+            if not pending[2].cancel():
+                wait([pending[2]])
+
+        best_index, frame = best
+        if frame is not buf:
+            ctypes.memmove(buf.raw, frame.raw, frame.length)
+            buf.length = frame.length
+    if timings is not None:
+        timings["burst_ms"] = (time.perf_counter() - started) * 1000
+    return {"frames": len(scores), "best": best_index, "scores": scores}
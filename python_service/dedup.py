@@ -0,0 +1,240 @@
+"""Duplicate and replay detection with perceptual hashes of raw captures.
+
+Usage (benchmark with a synthetic index):
+    python dedup.py [--size 1000000] [--lookups 10000] [--distance 3]
+"""
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+import itertools
+import threading
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it captures are not hashed
+    np = None
+
+# ===== Configuration =====
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+DEDUP_DIR = os.environ.get("FINGERPRINT_DEDUP_DIR", os.path.join(PROJECT_ROOT, "communication", "dedup"))
+
+AVAILABLE = np is not None
+DEDUP_ENABLED = os.environ.get("FINGERPRINT_DEDUP", "1") != "0"
+# Frames within this many differing hash bits are flagged as duplicates; sensor
+# noise on a re-submitted frame flips 0-2 bits, a re-placed finger 10 or more
+DUPLICATE_DISTANCE = int(os.environ.get("FINGERPRINT_DUPLICATE_DISTANCE", "3"))
+REJECT_DUPLICATES = os.environ.get("FINGERPRINT_REJECT_DUPLICATES", "0") == "1"
+
+HASH_BITS = 64
+DCT_SIZE = 32    # Frames are reduced to DCT_SIZE x DCT_SIZE block means
+HASH_SIZE = 8    # The lowest HASH_SIZE x HASH_SIZE DCT coefficients form the hash
+INDEX_CHUNKS = 4
+
+# Persisted as fixed-size records: hash, job ID (12 raw bytes), timestamp
+RECORD = struct.Struct('<Q12sd')
+
+# ===== Hashing =====
+_dct_matrix = None
+
+def _dct():
+    global _dct_matrix
+    if _dct_matrix is None:
+        k = np.arange(DCT_SIZE, dtype=np.float32)[:, None]
+        n = np.arange(DCT_SIZE, dtype=np.float32)[None, :]
+        _dct_matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * DCT_SIZE)).astype(np.float32)
+    return _dct_matrix
+
+def perceptual_hash(pixels, width: int, height: int) -> int:
+    """64-bit DCT hash of a top-down grayscale frame (None without NumPy).
+
+    Block means over a 32x32 grid, then a 2-D DCT; each of the 64 lowest
+    frequency coefficients gives one bit, set when it is above their median.
+    """
+    if np is None:
+        return None
+    img = np.frombuffer(memoryview(pixels).cast('B'), dtype=np.uint8, count=width * height)
+    bh, bw = height // DCT_SIZE, width // DCT_SIZE
+    img = img.reshape(height, width)[:bh * DCT_SIZE, :bw * DCT_SIZE].astype(np.float32)
+    blocks = img.reshape(DCT_SIZE, bh, DCT_SIZE, bw).mean(axis=(1, 3))
+    d = _dct()
+    coeffs = (d @ blocks @ d.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = coeffs > np.median(coeffs[1:])  # The DC term is left out of the median
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+# ===== Index =====
+class HashIndex:
+    """Multi-index hashing over 64-bit hashes for Hamming-radius search.
+
+    Each hash is split into chunks, and each chunk value is a key into its
+    own table. Two hashes within distance r agree to within r // chunks bits
+    on at least one chunk, so a search only probes the keys that close to
+    the query's chunks and checks the few hashes found there, instead of
+    scanning every stored hash.
+    """
+
+    def __init__(self, max_distance: int = DUPLICATE_DISTANCE, chunks: int = INDEX_CHUNKS):
+        self.max_distance = max_distance
+        self.chunks = chunks
+        widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._shifts = [sum(widths[:i]) for i in range(chunks)]
+        self._masks = [(1 << w) - 1 for w in widths]
+        # Key offsets to probe within each chunk: every flip of up to r // chunks bits
+        radius = max_distance // chunks
+        self._flips = [[sum(1 << b for b in bits) for k in range(radius + 1)
+                        for bits in itertools.combinations(range(w), k)] for w in widths]
+        self._tables = [{} for _ in range(chunks)]
+        self.hashes = array('Q')
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, value: int) -> int:
+        """Store a hash, returning its position."""
+        position = len(self.hashes)
+        self.hashes.append(value)
+        for table, shift, mask in zip(self._tables, self._shifts, self._masks):
+            key = (value >> shift) & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = bucket = array('I')
+            bucket.append(position)
+        return position
+
+    def search(self, value: int, max_distance: int = None) -> list:
+        """(distance, position) of stored hashes within max_distance, nearest first."""
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        hashes = self.hashes
+        seen = set()
+        found = []
+        for table, shift, mask, flips in zip(self._tables, self._shifts, self._masks, self._flips):
+            key = (value >> shift) & mask
+            for flip in flips:
+                bucket = table.get(key ^ flip)
+                if bucket is None:
+                    continue
+                for position in bucket:
+                    if position in seen:
+                        continue
+                    seen.add(position)
+                    distance = (hashes[position] ^ value).bit_count()
+                    if distance <= limit:
+                        found.append((distance, position))
+        found.sort()
+        return found
+
+# ===== Persistent Detector =====
+class DuplicateDetector:
+    """Hash index over every capture, persisted as an append-only record file.
+
+    check_and_add() reports the closest earlier capture within
+    DUPLICATE_DISTANCE bits and then records the new one; records are
+    appended to hashes.bin as they come, and reloaded on start.
+    """
+
+    def __init__(self, directory: str = DEDUP_DIR, max_distance: int = DUPLICATE_DISTANCE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, "hashes.bin")
+        self.index = HashIndex(max_distance)
+        perceptual_hash(bytes(DCT_SIZE * DCT_SIZE), DCT_SIZE, DCT_SIZE)  # Warm up NumPy before the first capture
+        self._job_ids = bytearray()
+        self._times = array('d')
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(self.path, 'ab')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % RECORD.size  # Drop a torn last record
+        for value, raw_id, timestamp in RECORD.iter_unpack(memoryview(data)[:usable]):
+            self._remember(value, raw_id, timestamp)
+        if usable != len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(usable)
+
+    def _remember(self, value: int, raw_id: bytes, timestamp: float):
+        self.index.add(value)
+        self._job_ids += raw_id
+        self._times.append(timestamp)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _describe(self, distance: int, position: int) -> dict:
+        raw_id = bytes(self._job_ids[position * 12:position * 12 + 12])
+        return {"job_id": raw_id.hex(), "distance": distance, "timestamp": self._times[position]}
+
+    def find(self, value: int) -> list:
+        """Earlier captures within the duplicate distance of a hash, nearest first."""
+        with self._lock:
+            return [self._describe(d, p) for d, p in self.index.search(value)]
+
+    def check_and_add(self, value: int, job_id: str, timestamp: float = None) -> dict:
+        """Record a capture's hash, returning the nearest earlier duplicate or None."""
+        timestamp = timestamp or time.time()
+        raw_id = bytes.fromhex(job_id)
+        with self._lock:
+            matches = self.index.search(value)
+            duplicate = self._describe(*matches[0]) if matches else None
+            self._remember(value, raw_id, timestamp)
+            self._file.write(RECORD.pack(value, raw_id, timestamp))
+            self._file.flush()
+        return duplicate
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+# ===== Benchmark =====
+def benchmark(size: int, lookups: int, distance: int, seed: int = 1):
+    """Time index build and lookups over random hashes, checking results by brute force."""
+    rng = random.Random(seed)
+    index = HashIndex(distance)
+    values = [rng.getrandbits(HASH_BITS) for _ in range(size)]
+    started = time.perf_counter()
+    for value in values:
+        index.add(value)
+    build_s = time.perf_counter() - started
+
+    # Half the probes are near-copies of stored hashes, half are unrelated
+    probes = []
+    for i in range(lookups):
+        if i % 2 == 0:
+            value = values[rng.randrange(size)]
+            for bit in rng.sample(range(HASH_BITS), rng.randint(0, distance)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(HASH_BITS)
+        probes.append(value)
+    started = time.perf_counter()
+    results = [index.search(value) for value in probes]
+    lookup_us = (time.perf_counter() - started) / lookups * 1e6
+
+    hits = sum(1 for r in results if r)
+    for value, result in zip(probes[:20], results[:20]):
+        expected = sorted((hamming(v, value), i) for i, v in enumerate(values) if hamming(v, value) <= distance)
+        assert result == expected, "Index disagrees with brute force"
+    print(f"{size} hashes: built in {build_s:.1f}s, {lookup_us:.1f} us/lookup, "
+          f"{hits}/{lookups} probes matched (radius {distance})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the perceptual hash index")
+    parser.add_argument("--size", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    parser.add_argument("--distance", type=int, default=DUPLICATE_DISTANCE)
+    args = parser.parse_args(argv)
+    benchmark(args.size, args.lookups, args.distance)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
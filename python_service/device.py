@@ -0,0 +1,403 @@
+import os
+import glob
+import time
+import random
+import ctypes
+import threading
+from ctypes import byref, c_int, c_uint, c_ubyte, c_char_p, c_void_p
+
+from buffers import CaptureBuffer
+from imaging import decode_bmp
+
+# ===== Configuration =====
+DLL_NAME = "SynoAPIEx.dll"
+DEFAULT_ADDR = 0xFFFFFFFF
+
+# PSGetImage polling schedule while waiting for a finger (see DETECTION_POLICIES)
+DETECT_POLICY = os.environ.get("FINGERPRINT_DETECT_POLICY", "adaptive")
+
+# "synoapi" drives the real sensor through SynoAPIEx.dll; "simulated" replays
+# BMP fixtures so the service can run without hardware (e.g. on Linux CI);
+# "replay" answers from a recorded trace of DLL calls (see dlltrace.py)
+DEVICE_BACKEND = os.environ.get("FINGERPRINT_DEVICE", "synoapi")
+
+# Sensors driven by one service, comma-separated: "usb:N", "com:N" or
+# "udisk:N" open SynoAPIEx device N of that type, "auto" the first sensor
+# found, "simulated" a simulated sensor. Empty means one DEVICE_BACKEND sensor.
+DEVICES = os.environ.get("FINGERPRINT_DEVICES", "")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_FIXTURES = os.environ.get("FINGERPRINT_SIM_FIXTURES", os.path.join(SCRIPT_DIR, "fixtures"))
+
+HANDLE = c_void_p
+DEVICE_USB, DEVICE_COM, DEVICE_UDISK = 0, 1, 2
+DEVICE_TYPES = {"usb": DEVICE_USB, "com": DEVICE_COM, "udisk": DEVICE_UDISK}
+PS_OK, PS_COMM_ERR, PS_NO_FINGER = 0x00, 0x01, 0x02
+IMAGE_X, IMAGE_Y = 256, 288
+IMAGE_BYTES = IMAGE_X * IMAGE_Y
+
+ERROR_TEXT = {
+    PS_OK: "Success",
+    PS_COMM_ERR: "Send package error",
+    PS_NO_FINGER: "No finger on sensor",
+}
+
+class DeviceError(RuntimeError):
+    """A sensor call returned a failure code."""
+
+    def __init__(self, message: str, code: int = None):
+        super().__init__(message)
+        self.code = code
+
+class CaptureCancelled(RuntimeError):
+    """The capture's cancellation token was set while waiting for a finger."""
+
+# ===== Finger Detection =====
+class DetectionPolicy:
+    """Polling schedule for PSGetImage while waiting for a finger.
+
+    Polls every fast_interval seconds for the first fast_window seconds after
+    a capture starts (when a finger is most likely to land), then backs off
+    exponentially by backoff up to max_interval to save USB round-trips.
+    """
+
+    def __init__(self, fast_interval: float = 0.02, fast_window: float = 0.5,
+                 backoff: float = 1.5, max_interval: float = 0.2):
+        self.fast_interval = fast_interval
+        self.fast_window = fast_window
+        self.backoff = backoff
+        self.max_interval = max_interval
+
+    def next_interval(self, elapsed: float, previous: float) -> float:
+        """Seconds to wait before the next poll, given time since capture start."""
+        if elapsed < self.fast_window:
+            return self.fast_interval
+        return min(self.max_interval, max(previous, self.fast_interval) * self.backoff)
+
+DETECTION_POLICIES = {
+    "adaptive": DetectionPolicy(),
+    # The original fixed 200 ms poll, kept for comparison
+    "fixed": DetectionPolicy(fast_interval=0.2, fast_window=0.0, backoff=1.0, max_interval=0.2),
+}
+
+# ===== Device Interface =====
+class Device:
+    """Fingerprint sensor interface.
+
+    Backends implement open/close and the two sensor primitives, get_image
+    (returns PS_OK once a finger is on the sensor) and up_image (uploads the
+    frame into a buffer); the capture loop is shared.
+    """
+
+    name = "device"
+    label = "device"  # Identifies the sensor in logs and job records
+    policy = DETECTION_POLICIES.get(DETECT_POLICY, DETECTION_POLICIES["adaptive"])
+
+    def open(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def get_image(self) -> int:
+        raise NotImplementedError
+
+    def up_image(self, buf: CaptureBuffer) -> int:
+        raise NotImplementedError
+
+    def err_text(self, code: int) -> str:
+        return ERROR_TEXT.get(code, f"Error 0x{code:02X}")
+
+    def arm(self):
+        """Called as a capture starts waiting for a finger."""
+
+    def capture(self, buf: CaptureBuffer, timeout: float, timings: dict = None,
+                policy: DetectionPolicy = None, cancel: threading.Event = None,
+                on_poll=None, stats: dict = None) -> CaptureBuffer:
+        """Wait for a finger and upload the image into buf.
+
+        If timings is given, the finger-detection wait and upload durations
+        are stored in it as "detect_ms" and "upload_ms"; if stats is given,
+        the PSGetImage polls are added to its "detect_polls" count, so it
+        totals every capture of a job. Setting cancel aborts the wait
+        with CaptureCancelled before the next poll. on_poll() is called
+        after every poll that found no finger yet, e.g. to grab a preview of
+        a finger still being placed.
+        """
+        policy = policy or self.policy
+        cancel = cancel or threading.Event()
+        self.arm()
+        started = time.monotonic()
+        deadline = started + timeout
+        interval = 0.0
+        polls = 0
+        while True:
+            if cancel.is_set():
+                raise CaptureCancelled("Capture cancelled")
+            rc = self.get_image()
+            polls += 1
+            if rc == PS_OK:
+                break
+            if rc == PS_NO_FINGER:
+                if on_poll is not None:
+                    on_poll()
+                now = time.monotonic()
+                if now >= deadline:
+                    raise TimeoutError("No finger detected within timeout")
+                interval = policy.next_interval(now - started, interval)
+                cancel.wait(min(interval, deadline - now))
+                continue
+            raise DeviceError(f"Capture failed: {self.err_text(rc)}", rc)
+
+        detected = time.monotonic()
+        rc = self.up_image(buf)
+        if rc != PS_OK:
+            raise DeviceError(f"Image upload failed: {self.err_text(rc)}", rc)
+        if timings is not None:
+            timings["detect_ms"] = (detected - started) * 1000
+            timings["upload_ms"] = (time.monotonic() - detected) * 1000
+        if stats is not None:
+            stats["detect_polls"] = stats.get("detect_polls", 0) + polls
+        return buf
+
+    def wait_for_lift(self, timeout: float, policy: DetectionPolicy = None,
+                      cancel: threading.Event = None):
+        """Poll PSGetImage until the finger is off the sensor.
+
+        Called before re-capturing so the next capture gets a new placement
+        rather than the finger still resting there. Raises TimeoutError if
+        the finger stays down, CaptureCancelled once cancel is set.
+        """
+        policy = policy or self.policy
+        cancel = cancel or threading.Event()
+        started = time.monotonic()
+        deadline = started + timeout
+        interval = 0.0
+        while True:
+            if cancel.is_set():
+                raise CaptureCancelled("Capture cancelled")
+            rc = self.get_image()
+            if rc == PS_NO_FINGER:
+                return
+            if rc != PS_OK:
+                raise DeviceError(f"Capture failed: {self.err_text(rc)}", rc)
+            now = time.monotonic()
+            if now >= deadline:
+                raise TimeoutError("Finger was not lifted within timeout")
+            interval = policy.next_interval(now - started, interval)
+            cancel.wait(min(interval, deadline - now))
+
+# ===== SynoAPIEx Backend =====
+_dll = None
+
+def load_vendor_dll(name: str = DLL_NAME) -> ctypes.CDLL:
+    """Load and configure the vendor DLL once per process."""
+    global _dll
+    if _dll is not None:
+        return _dll
+    try:
+        candidate = os.path.join(SCRIPT_DIR, name)
+        dll = ctypes.WinDLL(candidate if os.path.isfile(candidate) else name)
+    except (OSError, AttributeError) as e:
+        raise SystemExit(f"Failed to load {name}: {e}")
+
+    dll.PSAutoOpen.argtypes = [ctypes.POINTER(HANDLE), ctypes.POINTER(c_int), c_int, c_uint, c_int]
+    dll.PSAutoOpen.restype = c_int
+    dll.PSOpenDeviceEx.argtypes = [ctypes.POINTER(HANDLE), c_int, c_int, c_int, c_int, c_int]
+    dll.PSOpenDeviceEx.restype = c_int
+    dll.PSCloseDeviceEx.argtypes = [HANDLE]
+    dll.PSCloseDeviceEx.restype = c_int
+    dll.PSGetImage.argtypes = [HANDLE, c_int]
+    dll.PSGetImage.restype = c_int
+    dll.PSUpImage.argtypes = [HANDLE, c_int, ctypes.POINTER(c_ubyte), ctypes.POINTER(c_int)]
+    dll.PSUpImage.restype = c_int
+    dll.PSImgData2BMP.argtypes = [ctypes.POINTER(c_ubyte), c_char_p]
+    dll.PSImgData2BMP.restype = c_int
+    dll.PSErr2Str.argtypes = [c_int]
+    dll.PSErr2Str.restype = ctypes.c_char_p
+
+    # Record every sensor call for offline replay when FINGERPRINT_TRACE is set
+    import dlltrace
+    if dlltrace.TRACE_FILE:
+        dll = dlltrace.TracingDLL(dll, dlltrace.TRACE_FILE)
+        print(f"Tracing {name} calls to {dlltrace.TRACE_FILE}")
+
+    _dll = dll
+    return dll
+
+class SynoDevice(Device):
+    """Sensor attached through the vendor SynoAPIEx DLL.
+
+    With no index the first sensor found is opened (PSAutoOpen); otherwise
+    sensor number index of device_type is opened with PSOpenDeviceEx. dll
+    replaces the vendor DLL, e.g. with a dlltrace.ReplayDLL.
+    """
+
+    name = "synoapi"
+
+    def __init__(self, addr: int = DEFAULT_ADDR, device_type: int = DEVICE_USB, index: int = None,
+                 dll=None):
+        self.dll = dll if dll is not None else load_vendor_dll()
+        self.addr = addr
+        self.device_type = device_type
+        self.index = index
+        self.handle = None
+
+    def open(self):
+        h = HANDLE()
+        if self.index is None:
+            dtype = c_int(-1)
+            rc = self.dll.PSAutoOpen(byref(h), byref(dtype), self.addr, 0, 1)
+        else:
+            rc = self.dll.PSOpenDeviceEx(byref(h), self.device_type, 1, 1, 2, self.index)
+
+        if rc != PS_OK or not h:
+            raise DeviceError(f"Device open failed: {self.err_text(rc)}", rc)
+
+        self.handle = h
+
+    def close(self):
+        if self.handle:
+            self.dll.PSCloseDeviceEx(self.handle)
+            self.handle = None
+
+    def get_image(self) -> int:
+        return self.dll.PSGetImage(self.handle, self.addr)
+
+    def up_image(self, buf: CaptureBuffer) -> int:
+        img_len = c_int(len(buf.raw))
+        rc = self.dll.PSUpImage(self.handle, self.addr, buf.raw, byref(img_len))
+        buf.length = img_len.value if rc == PS_OK else 0
+        return rc
+
+    def err_text(self, code: int) -> str:
+        s = self.dll.PSErr2Str(code)
+        return s.decode(errors="ignore") if s else f"Error 0x{code:02X}"
+
+# ===== Simulated Backend =====
+class SimulatedDevice(Device):
+    """Sensor stand-in that replays BMP fixtures.
+
+    A "finger" lands finger_delay seconds after capture starts and is
+    lifted by the first upload, or finger_hold seconds after landing if set
+    (so bursts can take several frames). Uploads before it lands show it
+    partly placed, covering more of the frame as the delay runs; get_image fails with PS_COMM_ERR
+    or PS_NO_FINGER at the configured rates, and each upload sleeps
+    upload_latency seconds before copying the next fixture.
+    """
+
+    name = "simulated"
+
+    def __init__(self, fixtures: str = SIM_FIXTURES, finger_delay: float = 1.0,
+                 upload_latency: float = 0.3, comm_error_rate: float = 0.0,
+                 no_finger_rate: float = 0.0, finger_hold: float = 0.0, seed: int = None):
+        self.frames = self._load_fixtures(fixtures)
+        self.finger_delay = finger_delay
+        self.upload_latency = upload_latency
+        self.comm_error_rate = comm_error_rate
+        self.no_finger_rate = no_finger_rate
+        self.finger_hold = finger_hold
+        self.rng = random.Random(seed)
+        self.is_open = False
+        self._next_frame = 0
+        self._armed_at = None
+        self._finger_down = False
+
+    @staticmethod
+    def _load_fixtures(fixtures: str) -> list:
+        paths = sorted(glob.glob(os.path.join(fixtures, "*.bmp"))) if os.path.isdir(fixtures) else [fixtures]
+        frames = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                width, height, pixels = decode_bmp(f.read())
+            if width * height != IMAGE_BYTES:
+                raise ValueError(f"Fixture {path} is {width}x{height}, expected {IMAGE_X}x{IMAGE_Y}")
+            frames.append(pixels)
+        if not frames:
+            raise ValueError(f"No BMP fixtures found in {fixtures}")
+        return frames
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def arm(self):
+        # Health probes and preview grabs poll get_image while idle; the
+        # finger delay counts from the start of the capture, not from them
+        self._armed_at = None
+
+    def get_image(self) -> int:
+        if not self.is_open:
+            return PS_COMM_ERR
+        if self.rng.random() < self.comm_error_rate:
+            return PS_COMM_ERR
+        now = time.monotonic()
+        if self._armed_at is None:
+            self._armed_at = now
+        self._finger_down = False
+        if now - self._armed_at < self.finger_delay or self.rng.random() < self.no_finger_rate:
+            return PS_NO_FINGER
+        if self.finger_hold and now - self._armed_at >= self.finger_delay + self.finger_hold:
+            self._armed_at = None  # Lifted; the next capture waits for a new placement
+            return PS_NO_FINGER
+        self._finger_down = True
+        return PS_OK
+
+    def up_image(self, buf: CaptureBuffer) -> int:
+        if not self.is_open:
+            return PS_COMM_ERR
+        time.sleep(self.upload_latency)
+        frame = self.frames[self._next_frame % len(self.frames)]
+        if not self._finger_down:
+            # Still being placed: the top rows of the print on an empty sensor
+            placed = 0.0
+            if self._armed_at is not None and self.finger_delay > 0:
+                placed = min((time.monotonic() - self._armed_at) / self.finger_delay, 1.0)
+            rows = int(IMAGE_Y * placed)
+            frame = frame[:rows * IMAGE_X] + b"\xff" * ((IMAGE_Y - rows) * IMAGE_X)
+            ctypes.memmove(buf.raw, frame, len(frame))
+            buf.length = len(frame)
+            return PS_OK
+        self._next_frame += 1
+        ctypes.memmove(buf.raw, frame, len(frame))
+        buf.length = len(frame)
+        if not self.finger_hold:
+            # The finger is lifted; the next capture waits for a new placement
+            self._armed_at = None
+        return PS_OK
+
+def create_device(kind: str = DEVICE_BACKEND, index: int = None) -> Device:
+    """Create the configured device backend."""
+    if kind == "simulated":
+        env = os.environ.get
+        return SimulatedDevice(
+            finger_delay=float(env("FINGERPRINT_SIM_DELAY", "1.0")),
+            upload_latency=float(env("FINGERPRINT_SIM_UPLOAD", "0.3")),
+            comm_error_rate=float(env("FINGERPRINT_SIM_COMM_ERR_RATE", "0")),
+            no_finger_rate=float(env("FINGERPRINT_SIM_NO_FINGER_RATE", "0")),
+            finger_hold=float(env("FINGERPRINT_SIM_HOLD", "0")),
+        )
+    if kind == "replay":
+        from dlltrace import open_replay_dll
+        device = SynoDevice(dll=open_replay_dll())
+        device.name = "replay"
+        return device
+    if kind in ("synoapi", "auto"):
+        return SynoDevice()
+    if kind in DEVICE_TYPES:
+        return SynoDevice(device_type=DEVICE_TYPES[kind], index=index or 0)
+    raise ValueError(f"Unknown device backend: {kind}")
+
+def create_devices(spec: str = DEVICES) -> list:
+    """Create one device per entry of a FINGERPRINT_DEVICES list."""
+    entries = [e.strip() for e in spec.split(",") if e.strip()] or [DEVICE_BACKEND]
+    devices = []
+    for i, entry in enumerate(entries):
+        kind, _, index = entry.partition(":")
+        device = create_device(kind, int(index) if index else None)
+        # Repeated entries (e.g. "simulated,simulated") get distinct labels
+        device.label = entry if entries.count(entry) == 1 else f"{entry}#{i}"
+        devices.append(device)
+    return devices
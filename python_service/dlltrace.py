@@ -0,0 +1,338 @@
+"""Record and replay SynoAPIEx calls.
+
+Set FINGERPRINT_TRACE=<file> to record every PS* call the sensor backend
+makes (arguments, return code, timing and uploaded image) to a binary
+trace. FINGERPRINT_DEVICE=replay with FINGERPRINT_REPLAY_TRACE=<file> then
+runs the service against that trace instead of the DLL.
+
+Usage (summarise a trace, or replay its captures without the service):
+    python dlltrace.py <trace> [--replay] [--speed 1.0]
+"""
+import os
+import sys
+import time
+import zlib
+import struct
+import argparse
+import threading
+from collections import deque
+
+from device import PS_OK, PS_COMM_ERR
+
+# ===== Configuration =====
+TRACE_FILE = os.environ.get("FINGERPRINT_TRACE", "")
+REPLAY_TRACE = os.environ.get("FINGERPRINT_REPLAY_TRACE", "")
+# Replayed calls take their recorded duration divided by this; 0 returns at once
+REPLAY_SPEED = float(os.environ.get("FINGERPRINT_REPLAY_SPEED", "1"))
+
+TRACE_COMPRESSION = 1  # zlib level for image payloads; fast enough to keep up with uploads
+
+# File header: magic, wall-clock start time
+HEADER = struct.Struct('<8sd')
+MAGIC = b"FPTRACE1"
+# One per call: op, channel, flags, return code, start (s since trace start),
+# duration (s), argument, payload length; followed by the payload
+RECORD = struct.Struct('<BBHiddII')
+FLAG_ZLIB = 0x1
+
+# Calls recorded; each open starts a new channel, which later calls on its handle share
+OPEN_AUTO, OPEN_EX, CLOSE, GET_IMAGE, UP_IMAGE, ERR_TEXT = range(6)
+OP_NAMES = {OPEN_AUTO: "PSAutoOpen", OPEN_EX: "PSOpenDeviceEx", CLOSE: "PSCloseDeviceEx",
+            GET_IMAGE: "PSGetImage", UP_IMAGE: "PSUpImage", ERR_TEXT: "PSErr2Str"}
+
+class TraceRecord:
+    """One recorded call."""
+
+    __slots__ = ("op", "channel", "rc", "started", "duration", "arg", "payload")
+
+    def __init__(self, op, channel, rc, started, duration, arg, payload):
+        self.op = op
+        self.channel = channel
+        self.rc = rc
+        self.started = started
+        self.duration = duration
+        self.arg = arg
+        self.payload = payload
+
+# ===== Recording =====
+class TraceWriter:
+    """Append-only trace file shared by every traced handle in the process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started = time.perf_counter()
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, time.time()))
+
+    def write(self, op: int, channel: int, rc: int, started: float, duration: float,
+              arg: int = 0, payload: bytes = b""):
+        flags = 0
+        if op == UP_IMAGE and payload:
+            packed = zlib.compress(payload, TRACE_COMPRESSION)
+            if len(packed) < len(payload):
+                payload, flags = packed, FLAG_ZLIB
+        record = RECORD.pack(op, channel, flags, rc, started - self.started, duration,
+                             arg & 0xFFFFFFFF, len(payload))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(record + payload)
+            self._file.flush()  # A crashed session still leaves a readable trace
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def _target(ref):
+    # The ctypes object behind a byref() argument
+    return getattr(ref, "_obj", ref)
+
+class TracingDLL:
+    """Stands in for the vendor DLL, recording each sensor call it forwards.
+
+    Only the calls SynoDevice makes are traced; other attributes go
+    straight to the DLL.
+    """
+
+    def __init__(self, dll, writer):
+        self._dll = dll
+        self._writer = writer if isinstance(writer, TraceWriter) else TraceWriter(writer)
+        self._channels = {}  # Open handle value -> channel
+        self._opens = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._dll, name)
+
+    def close(self):
+        self._writer.close()
+
+    def _channel(self, handle) -> int:
+        return self._channels.get(getattr(handle, "value", handle), 0xFF)
+
+    def _open(self, op: int, call, p_handle, arg: int, *args) -> int:
+        with self._lock:
+            channel = self._opens & 0xFF
+            self._opens += 1
+        started = time.perf_counter()
+        rc = call(p_handle, *args)
+        duration = time.perf_counter() - started
+        handle = _target(p_handle).value
+        if rc == PS_OK and handle:
+            self._channels[handle] = channel
+        self._writer.write(op, channel, rc, started, duration, arg)
+        return rc
+
+    def PSAutoOpen(self, p_handle, p_type, addr, baud, verify):
+        return self._open(OPEN_AUTO, self._dll.PSAutoOpen, p_handle, addr, p_type, addr, baud, verify)
+
+    def PSOpenDeviceEx(self, p_handle, device_type, com, baud, package, index):
+        return self._open(OPEN_EX, self._dll.PSOpenDeviceEx, p_handle, (device_type << 8) | index,
+                          device_type, com, baud, package, index)
+
+    def PSCloseDeviceEx(self, handle):
+        started = time.perf_counter()
+        rc = self._dll.PSCloseDeviceEx(handle)
+        self._writer.write(CLOSE, self._channel(handle), rc, started, time.perf_counter() - started)
+        return rc
+
+    def PSGetImage(self, handle, addr):
+        started = time.perf_counter()
+        rc = self._dll.PSGetImage(handle, addr)
+        self._writer.write(GET_IMAGE, self._channel(handle), rc, started, time.perf_counter() - started, addr)
+        return rc
+
+    def PSUpImage(self, handle, addr, data, p_length):
+        started = time.perf_counter()
+        rc = self._dll.PSUpImage(handle, addr, data, p_length)
+        duration = time.perf_counter() - started
+        length = _target(p_length).value if rc == PS_OK else 0
+        payload = bytes(memoryview(data).cast('B')[:length])
+        self._writer.write(UP_IMAGE, self._channel(handle), rc, started, duration, addr, payload)
+        return rc
+
+    def PSErr2Str(self, code):
+        started = time.perf_counter()
+        text = self._dll.PSErr2Str(code)
+        self._writer.write(ERR_TEXT, 0, 0, started, time.perf_counter() - started, code, text or b"")
+        return text
+
+# ===== Reading =====
+def read_trace(path: str) -> tuple:
+    """Return (start wall-clock time, records) of a trace; a torn last record is dropped."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a sensor trace")
+    magic, wall_start = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a sensor trace")
+    records = []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        op, channel, flags, rc, started, duration, arg, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        payload = data[offset:offset + length]
+        offset += length
+        if flags & FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+        records.append(TraceRecord(op, channel, rc, started, duration, arg, payload))
+    return wall_start, records
+
+# ===== Replay =====
+class ReplayDLL:
+    """Stands in for the vendor DLL, answering calls from a recorded trace.
+
+    Each open takes the next recorded open's result and channel; calls on
+    its handle then return that channel's recorded results in order (calls
+    the trace has no match for are skipped over), each taking its recorded
+    duration divided by speed. A replayed session therefore sees the same
+    finger arrivals, errors and frames, in the same order, as the recorded
+    one. Past the end of the trace the sensor answers like an unplugged
+    one, with PS_COMM_ERR.
+    """
+
+    def __init__(self, path: str, speed: float = REPLAY_SPEED):
+        self.path = path
+        self.speed = speed
+        _, records = read_trace(path)
+        self._opens = deque(r for r in records if r.op in (OPEN_AUTO, OPEN_EX))
+        self._calls = {}
+        for r in records:
+            if r.op in (CLOSE, GET_IMAGE, UP_IMAGE):
+                self._calls.setdefault(r.channel, deque()).append(r)
+        self._err_text = {r.arg: r.payload for r in records if r.op == ERR_TEXT and r.payload}
+        self.skipped = 0
+        self.exhausted = threading.Event()
+        self._lock = threading.Lock()
+
+    def _take(self, op: int, channel: int = None):
+        """Next recorded call of op (on channel), or None once the trace has none."""
+        with self._lock:
+            calls = self._opens if channel is None else self._calls.get(channel, ())
+            while calls:
+                record = calls.popleft()
+                if channel is None or record.op == op:
+                    break
+                self.skipped += 1
+            else:
+                if not self.exhausted.is_set():
+                    print(f"Replay trace {self.path} exhausted")
+                    self.exhausted.set()
+                return None
+        if self.speed > 0:
+            time.sleep(record.duration / self.speed)
+        return record
+
+    def _open(self, p_handle) -> int:
+        record = self._take(OPEN_AUTO)
+        if record is None:
+            return PS_COMM_ERR
+        if record.rc == PS_OK:
+            # Handles are channel + 1 so a recorded channel 0 is not a NULL handle
+            _target(p_handle).value = record.channel + 1
+        return record.rc
+
+    def PSAutoOpen(self, p_handle, p_type, addr, baud, verify):
+        return self._open(p_handle)
+
+    def PSOpenDeviceEx(self, p_handle, device_type, com, baud, package, index):
+        return self._open(p_handle)
+
+    def PSCloseDeviceEx(self, handle):
+        record = self._take(CLOSE, getattr(handle, "value", handle) - 1)
+        return PS_OK if record is None else record.rc
+
+    def PSGetImage(self, handle, addr):
+        record = self._take(GET_IMAGE, getattr(handle, "value", handle) - 1)
+        return PS_COMM_ERR if record is None else record.rc
+
+    def PSUpImage(self, handle, addr, data, p_length):
+        record = self._take(UP_IMAGE, getattr(handle, "value", handle) - 1)
+        if record is None:
+            return PS_COMM_ERR
+        frame = record.payload[:len(data)]
+        memoryview(data).cast('B')[:len(frame)] = frame
+        _target(p_length).value = len(frame)
+        return record.rc
+
+    def PSErr2Str(self, code):
+        return self._err_text.get(code & 0xFFFFFFFF)
+
+_replay_dll = None
+
+def open_replay_dll(path: str = REPLAY_TRACE) -> ReplayDLL:
+    """The process's replay source, shared by every replay device."""
+    global _replay_dll
+    if _replay_dll is None:
+        if not path:
+            raise ValueError("FINGERPRINT_REPLAY_TRACE is not set")
+        _replay_dll = ReplayDLL(path)
+    return _replay_dll
+
+# ===== Command Line =====
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def summarize(path: str):
+    """Print call counts, return codes and durations per call type."""
+    wall_start, records = read_trace(path)
+    span = records[-1].started + records[-1].duration if records else 0.0
+    print(f"{path}: {len(records)} calls over {span:.1f}s, recorded {time.ctime(wall_start)}")
+    for op, name in OP_NAMES.items():
+        calls = [r for r in records if r.op == op]
+        if not calls:
+            continue
+        codes = {}
+        for r in calls:
+            codes[r.rc] = codes.get(r.rc, 0) + 1
+        ms = [r.duration * 1000 for r in calls]
+        rcs = ", ".join(f"0x{rc:02X}: {n}" for rc, n in sorted(codes.items()))
+        print(f"  {name:16} {len(calls):6} calls  p50 {_percentile(ms, 0.5):8.2f} ms  "
+              f"p95 {_percentile(ms, 0.95):8.2f} ms  max {max(ms):8.2f} ms  rc {{{rcs}}}")
+
+def replay_captures(path: str, speed: float, timeout: float = 15.0):
+    """Run the trace's captures through the capture loop and print their timings."""
+    from device import SynoDevice, DeviceError
+    from buffers import BufferPool
+
+    dll = ReplayDLL(path, speed)
+    device = SynoDevice(dll=dll)
+    device.open()
+    pool = BufferPool(count=1)
+    captures = 0
+    started = time.perf_counter()
+    with pool.acquire() as buf:
+        while not dll.exhausted.is_set():
+            timings, stats = {}, {}
+            try:
+                device.capture(buf, timeout, timings, stats=stats)
+            except (DeviceError, TimeoutError) as e:
+                if not dll.exhausted.is_set():
+                    print(f"  {e}")  # Recorded failures replay too
+                continue
+            captures += 1
+            print(f"  capture {captures}: detect {timings['detect_ms']:.1f} ms "
+                  f"({stats['detect_polls']} polls), upload {timings['upload_ms']:.1f} ms")
+    print(f"{captures} captures replayed in {time.perf_counter() - started:.2f}s "
+          f"(speed {speed}, {dll.skipped} calls skipped)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise or replay a sensor call trace")
+    parser.add_argument("trace")
+    parser.add_argument("--replay", action="store_true", help="Replay the trace's captures")
+    parser.add_argument("--speed", type=float, default=REPLAY_SPEED,
+                        help="Replay speed-up; 0 skips recorded call durations")
+    args = parser.parse_args(argv)
+    summarize(args.trace)
+    if args.replay:
+        replay_captures(args.trace, args.speed)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,14 +1,30 @@
 import os
 import time
-import json
-import ctypes
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from ctypes import byref, c_int, c_uint, c_ubyte, c_char_p, c_void_p
+from transport import create_service_transport, write_status_file, write_file_atomic, PREVIEW_FILE
+from imaging import encode_bmp
+from buffers import BufferPool, CaptureBuffer, POOL_SIZE
+from device import (Device, DeviceError, CaptureCancelled, create_devices, IMAGE_X, IMAGE_Y, IMAGE_BYTES,
+                    PS_OK, PS_NO_FINGER)
+from quality import assess_quality, QUALITY_THRESHOLD, QUALITY_RETRIES
+import template
+from logger import BackgroundLogger
+from metrics import Counter, Gauge, Histogram, FileExporter
+from archive import CaptureArchive, ARCHIVE_ENABLED
+from preview import PreviewPublisher, PREVIEW_ENABLED, PREVIEW_MAX_FPS
+from supervisor import DeviceSupervisor
+from burst import capture_burst, burst_options, BURST_BUFFERS
+from dedup import (DuplicateDetector, perceptual_hash, DEDUP_ENABLED, REJECT_DUPLICATES,
+                   AVAILABLE as DEDUP_AVAILABLE)
+from jobs import (JobHistory, capture_file, template_file, JOB_HISTORY, REQUESTS_DIR, JOBS_DIR,
+                  CAPTURES_DIR, TEMPLATES_DIR, CANCELS_DIR)
 
 # ===== Configuration =====
-DLL_NAME = "SynoAPIEx.dll"
-DEFAULT_ADDR = 0xFFFFFFFF
 CAPTURE_TIMEOUT = 15  # Shorter timeout for web interface
+REQUEST_WAIT = 0.5  # Max time a capture worker blocks waiting for a request
+WORKER_STOP_TIMEOUT = 5  # Max wait on shutdown for workers to wind down cancelled captures
 
 # File paths for communication - go up one level from python_service
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,121 +39,293 @@ ERROR_LOG = os.path.join(COMM_DIR, "error.log")
 # Create communication directory
 os.makedirs(COMM_DIR, exist_ok=True)
 
-# ===== Load DLL =====
-def load_vendor_dll(name: str) -> ctypes.CDLL:
-    try:
-        here = os.path.dirname(os.path.abspath(__file__))
-        candidate = os.path.join(here, name)
-        return ctypes.WinDLL(candidate if os.path.isfile(candidate) else name)
-    except OSError as e:
-        raise SystemExit(f"Failed to load {name}: {e}")
-
-dll = load_vendor_dll(DLL_NAME)
-
-# ===== DLL Setup =====
-HANDLE = c_void_p
-DEVICE_USB, DEVICE_COM, DEVICE_UDISK = 0, 1, 2
-PS_OK, PS_COMM_ERR, PS_NO_FINGER = 0x00, 0x01, 0x02
-IMAGE_X, IMAGE_Y = 256, 288
-IMAGE_BYTES = IMAGE_X * IMAGE_Y
-
-# Function signatures
-dll.PSAutoOpen.argtypes = [ctypes.POINTER(HANDLE), ctypes.POINTER(c_int), c_int, c_uint, c_int]
-dll.PSAutoOpen.restype = c_int
-dll.PSCloseDeviceEx.argtypes = [HANDLE]
-dll.PSCloseDeviceEx.restype = c_int
-dll.PSGetImage.argtypes = [HANDLE, c_int]
-dll.PSGetImage.restype = c_int
-dll.PSUpImage.argtypes = [HANDLE, c_int, ctypes.POINTER(c_ubyte), ctypes.POINTER(c_int)]
-dll.PSUpImage.restype = c_int
-dll.PSImgData2BMP.argtypes = [ctypes.POINTER(c_ubyte), c_char_p]
-dll.PSImgData2BMP.restype = c_int
-dll.PSErr2Str.argtypes = [c_int]
-dll.PSErr2Str.restype = ctypes.c_char_p
-
-def err_text(code: int) -> str:
-    s = dll.PSErr2Str(code)
-    return s.decode(errors="ignore") if s else f"Error 0x{code:02X}"
+# Errors are written by a background thread so logging never stalls a capture
+error_logger = BackgroundLogger(ERROR_LOG)
+
+# Status updates are numbered so readers can order them and spot changes cheaply
+status_seq = 0
+status_lock = threading.Lock()
+
+# ===== Metrics =====
+# Exported to a file the bridge serves at GET /metrics
+DEVICE_OPEN_SECONDS = Histogram("fingerprint_device_open_seconds", "Time to open a sensor", ("device",))
+CAPTURE_STAGE_SECONDS = Histogram("fingerprint_capture_stage_seconds",
+                                  "Time spent in each stage of a capture job", ("device", "stage"))
+CAPTURES_TOTAL = Counter("fingerprint_captures_total", "Finished capture jobs by outcome", ("device", "result"))
+SENSOR_POLLS_TOTAL = Counter("fingerprint_sensor_polls_total", "PSGetImage calls made while waiting for a finger",
+                             ("device",))
+STATUS_PUBLISH_SECONDS = Histogram("fingerprint_status_publish_seconds", "Time to publish a status update")
+ACTIVE_CAPTURES = Gauge("fingerprint_active_captures", "Capture jobs in progress")
+DEVICES_READY = Gauge("fingerprint_devices_ready", "Sensors open and answering health probes")
+DEVICE_UP = Gauge("fingerprint_device_up", "1 while a sensor is ready, 0 while it is (re)connecting", ("device",))
+DEVICE_RECONNECTS_TOTAL = Counter("fingerprint_device_reconnects_total", "Sensor reopens after a failure",
+                                  ("device",))
+DUPLICATES_TOTAL = Counter("fingerprint_duplicates_total", "Captures matching an earlier frame's perceptual hash",
+                           ("device",))
+
+# Timing keys recorded by process_capture_request, and the stage each one reports as
+TIMING_STAGES = {"pickup_ms": "pickup", "publish_ms": "publish", "detect_ms": "detect_wait",
+                 "upload_ms": "upload", "burst_ms": "burst", "quality_ms": "quality", "dedup_ms": "dedup", "save_ms": "save",
+                 "template_ms": "template", "archive_ms": "archive"}
+
+# Request/status channel to the bridge server, created in main()
+transport = None
+
+# Capture buffers reused across captures instead of allocating per frame;
+# resized in main() so every device can hold one
+buffer_pool = BufferPool(size=IMAGE_BYTES)
+
+# Append-only store of every raw frame, opened in main()
+capture_archive = None
+
+# Perceptual hashes of every accepted frame, for spotting replays; opened in main()
+duplicate_detector = None
+
+# One supervisor per configured sensor, created in main(); their states are
+# reported with every status update
+supervisors = []
+DEVICES_READY.set_function(lambda: sum(1 for s in supervisors if s.ready))
+
+# Live preview frames, encoded and sent off the capture path; started in main()
+preview_publisher = None
+
+# Recent job records; evicted jobs have their record and image removed
+job_history = JobHistory(remove_files=True)
+
+# Cancellation tokens of captures in progress, and jobs cancelled while queued
+active_captures = {}
+cancelled_jobs = OrderedDict()
+captures_lock = threading.Lock()
+ACTIVE_CAPTURES.set_function(lambda: len(active_captures))
 
 # ===== Status Management =====
-def update_status(status: str, message: str = "", error: str = None):
-    """Update status file for frontend communication."""
+def update_status(status: str, message: str = "", error: str = None, timings: dict = None,
+                  job_id: str = None, device: str = None, quality: dict = None,
+                  template_info: dict = None, duplicate: dict = None, burst: dict = None):
+    """Update status file for frontend communication, and the job's record if given."""
+    global status_seq
     status_data = {
+        "seq": 0,
         "status": status,
         "message": message,
         "timestamp": datetime.now().isoformat(),
         "image_path": IMAGE_FILE if status == "success" else None,
-        "error": error
+        "error": error,
+        "timings": timings,
+        "job_id": job_id,
+        "device": device,
+        "quality": quality,
+        "template": template_info,
+        "duplicate": duplicate,
+        "burst": burst,
+        "devices": {s.label: s.snapshot() for s in supervisors}
     }
     
     try:
-        with open(STATUS_FILE, 'w') as f:
-            json.dump(status_data, f, indent=2)
+        # Numbered and published under one lock so concurrent workers publish in order
+        with status_lock, STATUS_PUBLISH_SECONDS.time():
+            status_seq += 1
+            status_data["seq"] = status_seq
+            if transport is not None:
+                transport.publish_status(status_data)
+            else:
+                write_status_file(status_data, STATUS_FILE)
+        
+        if job_id is not None and transport is not None:
+            record = {**status_data, "image_path": capture_file(job_id) if status == "success" else None}
+            transport.publish_job(record)
+            job_history.put(record)
     except Exception as e:
         log_error(f"Failed to update status: {e}")
 
-def log_error(error_msg: str):
+def log_error(error_msg: str, **fields):
     """Log errors to error file."""
-    try:
-        with open(ERROR_LOG, 'a') as f:
-            f.write(f"{datetime.now().isoformat()}: {error_msg}\n")
-    except:
-        pass  # Silently fail if can't log
+    error_logger.error(error_msg, **fields)
 
 # ===== Device Operations =====
-def open_device() -> HANDLE:
-    """Open fingerprint device."""
-    h = HANDLE()
-    dtype = c_int(-1)
-    rc = dll.PSAutoOpen(byref(h), byref(dtype), DEFAULT_ADDR, 0, 1)
-    
-    if rc != PS_OK or not h:
-        raise RuntimeError(f"Device open failed: {err_text(rc)}")
-    
-    return h
-
-def close_device(h: HANDLE):
-    """Close fingerprint device."""
-    if h:
-        dll.PSCloseDeviceEx(h)
-
-def capture_fingerprint(h: HANDLE) -> bytes:
-    """Capture fingerprint image."""
-    # Wait for finger with timeout
-    start_time = time.time()
-    while True:
-        rc = dll.PSGetImage(h, DEFAULT_ADDR)
-        if rc == PS_OK:
-            break
-        if rc == PS_NO_FINGER:
-            if time.time() - start_time > CAPTURE_TIMEOUT:
-                raise TimeoutError("No finger detected within timeout")
-            time.sleep(0.2)
-            continue
-        raise RuntimeError(f"Capture failed: {err_text(rc)}")
-    
-    # Upload image data
-    img_buf = (c_ubyte * IMAGE_BYTES)()
-    img_len = c_int(IMAGE_BYTES)
-    rc = dll.PSUpImage(h, DEFAULT_ADDR, img_buf, byref(img_len))
-    
-    if rc != PS_OK:
-        raise RuntimeError(f"Image upload failed: {err_text(rc)}")
-    
-    return bytes(bytearray(img_buf)[:img_len.value])
-
-def save_fingerprint_image(img_bytes: bytes):
-    """Save fingerprint as BMP file."""
-    buf = (c_ubyte * len(img_bytes)).from_buffer_copy(img_bytes)
-    rc = dll.PSImgData2BMP(buf, IMAGE_FILE.encode("utf-8"))
-    
-    if rc != PS_OK:
-        raise RuntimeError(f"Image save failed: {err_text(rc)}")
+def device_state_changed(supervisor: DeviceSupervisor):
+    """Report a sensor going down or coming back."""
+    label = supervisor.label
+    DEVICE_UP.labels(label).set(1 if supervisor.ready else 0)
+    if supervisor.ready:
+        DEVICE_OPEN_SECONDS.labels(label).observe(supervisor.open_seconds)
+        if supervisor.reconnects:
+            DEVICE_RECONNECTS_TOTAL.labels(label).inc()
+        message = f"Device {label} ready"
+        print(message)
+    else:
+        message = f"Device {label} {supervisor.state}: {supervisor.error}"
+        log_error(message, device=label)
+        print(message)
+    if any(s.ready for s in supervisors):
+        update_status("ready", f"{message}. Waiting for capture requests...", device=label)
+    else:
+        update_status("error", f"{message}. No device available, retrying...", "device_unavailable",
+                      device=label)
+
+def capture_fingerprint(device: Device, buf: CaptureBuffer, timings: dict = None,
+                        cancel: threading.Event = None, frames: int = 1, on_frame=None,
+                        on_poll=None, stats: dict = None) -> dict:
+    """Capture fingerprint image into buf, keeping the best of a burst if frames > 1.
+
+    Returns the burst's frame count, best frame and scores, or None for a
+    single frame.
+    """
+    if frames > 1:
+        return capture_burst(device, buf, buffer_pool, frames, CAPTURE_TIMEOUT, timings, cancel, on_frame,
+                             on_poll, stats)
+    device.capture(buf, CAPTURE_TIMEOUT, timings, cancel=cancel, on_poll=on_poll, stats=stats)
+    if on_frame is not None:
+        on_frame(buf)
+    return None
+
+class LowQualityError(RuntimeError):
+    """Every capture attempt scored below QUALITY_THRESHOLD."""
+
+    def __init__(self, message: str, quality: dict):
+        super().__init__(message)
+        self.quality = quality
+
+def capture_quality_fingerprint(device: Device, buf: CaptureBuffer, timings: dict,
+                                job_id: str = None, cancel: threading.Event = None,
+                                frames: int = 1, publish_all: bool = False, stats: dict = None) -> tuple:
+    """Capture into buf, re-capturing while the print scores below QUALITY_THRESHOLD.
+
+    Each attempt takes a burst of frames and keeps the best when frames > 1;
+    publish_all sends every frame of it to the live preview, not just the
+    kept one. Returns the accepted capture's quality metrics (None without
+    NumPy) and its burst summary (None for single frames).
+    """
+    on_frame = (lambda frame: publish_preview(device, frame)) if publish_all else None
+    on_poll = placement_preview(device)
+    for attempt in range(1, QUALITY_RETRIES + 2):
+        burst = capture_fingerprint(device, buf, timings, cancel, frames, on_frame, on_poll, stats)
+        if not publish_all:
+            publish_preview(device, buf)
+        
+        started = time.perf_counter()
+        quality = assess_quality(buf.view, IMAGE_X, IMAGE_Y)
+        timings["quality_ms"] = (time.perf_counter() - started) * 1000
+        if quality is None:
+            return None, burst
+        quality["attempts"] = attempt
+        if quality["score"] >= QUALITY_THRESHOLD:
+            return quality, burst
+        
+        if attempt <= QUALITY_RETRIES:
+            update_status("capturing", f"Low quality print (score {quality['score']}). "
+                          "Lift and place finger again...", job_id=job_id, device=device.label,
+                          quality=quality)
+            # The finger is usually still down; re-capturing now would take the same print
+            device.wait_for_lift(CAPTURE_TIMEOUT, cancel=cancel)
+    raise LowQualityError(f"Print quality too low (score {quality['score']})", quality)
+
+def publish_preview(device: Device, buf: CaptureBuffer):
+    """Offer a frame to the live preview if anyone is watching."""
+    if preview_publisher is not None and transport.preview_wanted():
+        preview_publisher.publish(device.label, buf.view)
+
+def placement_preview(device: Device):
+    """Hook for Device.capture's finger wait that previews the finger being placed.
+
+    While a preview is watched, uploads what the sensor currently sees
+    between detection polls (at most PREVIEW_MAX_FPS times a second), so
+    the user gets feedback before the finger is firmly down. Each upload
+    delays the next poll by its duration, so it only runs while watched.
+    """
+    if preview_publisher is None:
+        return None
+    last = 0.0
+    
+    def grab():
+        nonlocal last
+        now = time.monotonic()
+        if now - last < 1 / PREVIEW_MAX_FPS or not transport.preview_wanted():
+            return
+        last = now
+        with buffer_pool.acquire() as frame:
+            # Failures show up on the next detection poll
+            if device.up_image(frame) == PS_OK:
+                preview_publisher.publish(device.label, frame.view)
+    return grab
+
+def grab_preview_frame(device: Device, stop: threading.Event):
+    """Upload one live preview frame from an idle device if a finger is on it."""
+    started = time.monotonic()
+    rc = device.get_image()
+    if rc == PS_OK:
+        with buffer_pool.acquire() as buf:
+            rc = device.up_image(buf)
+            if rc == PS_OK:
+                preview_publisher.publish(device.label, buf.view)
+    if rc not in (PS_OK, PS_NO_FINGER):
+        raise DeviceError(f"Preview frame failed: {device.err_text(rc)}", rc)
+    # Cap the frame rate; an empty sensor answers PSGetImage at once
+    stop.wait(max(0.0, 1 / PREVIEW_MAX_FPS - (time.monotonic() - started)))
+
+class DuplicateCaptureError(Exception):
+    """The captured frame matches an earlier capture."""
+
+    def __init__(self, message: str, duplicate: dict):
+        super().__init__(message)
+        self.duplicate = duplicate
+
+def check_duplicate(buf: CaptureBuffer, job_id: str, label: str, timings: dict) -> dict:
+    """Hash an accepted frame and look it up among earlier captures.
+
+    Returns the closest earlier capture ({job_id, distance, timestamp}) or
+    None; raises DuplicateCaptureError for a match when REJECT_DUPLICATES
+    is set. Every frame is indexed, so later replays of it are caught too.
+    """
+    if duplicate_detector is None:
+        return None
+    started = time.perf_counter()
+    duplicate = duplicate_detector.check_and_add(perceptual_hash(buf.view, IMAGE_X, IMAGE_Y), job_id)
+    timings["dedup_ms"] = (time.perf_counter() - started) * 1000
+    if duplicate is None:
+        return None
+    DUPLICATES_TOTAL.labels(label).inc()
+    if REJECT_DUPLICATES:
+        raise DuplicateCaptureError(f"Capture duplicates job {duplicate['job_id']} "
+                                    f"(hash distance {duplicate['distance']})", duplicate)
+    return duplicate
+
+def save_fingerprint_image(img_bytes, job_id: str = None):
+    """Save fingerprint as BMP file, and as the job's capture if given."""
+    # Encoded in-process rather than through PSImgData2BMP, and replaced
+    # atomically so the bridge never serves a half-written image
+    bmp = encode_bmp(img_bytes, IMAGE_X, IMAGE_Y)
+    if job_id is not None:
+        write_file_atomic(capture_file(job_id), bmp)
+    write_file_atomic(IMAGE_FILE, bmp)
+
+def save_fingerprint_template(img_bytes, job_id: str, quality: dict = None):
+    """Extract and save the job's minutiae template, returning its summary."""
+    if not template.AVAILABLE:
+        return None
+    score = quality["score"] if quality else None
+    data = template.extract_template(img_bytes, IMAGE_X, IMAGE_Y, score)
+    write_file_atomic(template_file(job_id), data)
+    return {"version": template.TEMPLATE_VERSION, "size": len(data),
+            "minutiae": (len(data) - template.HEADER.size) // template.MINUTIA.size}
+
+def cancel_job(job_id: str):
+    """Cancel a running capture, or mark a queued job to be skipped at pickup."""
+    with captures_lock:
+        cancel = active_captures.get(job_id)
+        if cancel is not None:
+            cancel.set()
+            return
+        cancelled_jobs[job_id] = True
+        while len(cancelled_jobs) > JOB_HISTORY:
+            cancelled_jobs.popitem(last=False)
 
 # ===== Main Service Loop =====
 def cleanup_old_files():
     """Clean up old communication files."""
-    files_to_clean = [REQUEST_FLAG, IMAGE_FILE]
+    files_to_clean = [REQUEST_FLAG, IMAGE_FILE, PREVIEW_FILE]
+    for directory in (REQUESTS_DIR, JOBS_DIR, CAPTURES_DIR, TEMPLATES_DIR, CANCELS_DIR):
+        files_to_clean.extend(os.path.join(directory, name) for name in os.listdir(directory))
     for file_path in files_to_clean:
         if os.path.exists(file_path):
             try:
@@ -145,36 +333,169 @@ def cleanup_old_files():
             except:
                 pass
 
-def process_capture_request(h: HANDLE):
-    """Process a single capture request."""
+def record_capture_metrics(label: str, timings: dict, stats: dict, result: str):
+    """Feed a finished job's stage timings, sensor polls and outcome into the metrics."""
+    for key, stage in TIMING_STAGES.items():
+        if key in timings:
+            CAPTURE_STAGE_SECONDS.labels(label, stage).observe(timings[key] / 1000)
+    if "detect_polls" in stats:
+        SENSOR_POLLS_TOTAL.labels(label).inc(stats["detect_polls"])
+    CAPTURES_TOTAL.labels(label, result).inc()
+
+def process_capture_request(device: Device, request: dict) -> str:
+    """Process a single capture request, returning its outcome."""
+    job_id = request["job_id"]
+    label = device.label
+    result = "capture_error"
+    
+    # Per-stage durations in ms, reported with the final status
+    timings = {}
+    if "requested_at" in request:
+        timings["pickup_ms"] = (time.time() - request["requested_at"]) * 1000
+    # Counts that are not durations, kept out of the published timings
+    capture_stats = {}
+    
+    # Checked between sensor polls so a cancelled scan frees the device at once
+    cancel = threading.Event()
+    with captures_lock:
+        if cancelled_jobs.pop(job_id, None):
+            cancel.set()
+        active_captures[job_id] = cancel
+    
     try:
-        # Remove request flag
-        os.remove(REQUEST_FLAG)
+        if cancel.is_set():
+            raise CaptureCancelled("Cancelled before capture started")
+        frames, publish_all = burst_options(request)
         
         # Update status to capturing
-        update_status("capturing", "Place finger on sensor now...")
-        
-        # Capture fingerprint
-        img_bytes = capture_fingerprint(h)
+        started = time.perf_counter()
+        update_status("capturing", "Place finger on sensor now...", job_id=job_id, device=label)
+        timings["publish_ms"] = (time.perf_counter() - started) * 1000
         
-        # Save image
-        save_fingerprint_image(img_bytes)
+        with buffer_pool.acquire() as buf:
+            # Capture fingerprint, re-capturing poor prints
+            quality, burst = capture_quality_fingerprint(device, buf, timings, job_id, cancel,
+                                                         frames, publish_all, capture_stats)
+            
+            # Flag frames seen before: a latent print or a re-submitted image
+            duplicate = check_duplicate(buf, job_id, label, timings)
+            if duplicate is not None:
+                log_error(f"Capture matches job {duplicate['job_id']} "
+                          f"(hash distance {duplicate['distance']})", job_id=job_id, device=label)
+            
+            # Save image
+            started = time.perf_counter()
+            save_fingerprint_image(buf.view, job_id)
+            timings["save_ms"] = (time.perf_counter() - started) * 1000
+            
+            # Extract the template once here so consumers never re-process the image
+            started = time.perf_counter()
+            try:
+                template_info = save_fingerprint_template(buf.view, job_id, quality)
+            except Exception as e:
+                template_info = None
+                log_error(f"Template extraction failed: {e}", job_id=job_id)
+            timings["template_ms"] = (time.perf_counter() - started) * 1000
+            
+            # Keep the raw frame; the files above are pruned with the job history
+            if capture_archive is not None:
+                started = time.perf_counter()
+                try:
+                    capture_archive.append(job_id, buf.view, label, quality["score"] if quality else None)
+                except Exception as e:
+                    log_error(f"Archiving failed: {e}", job_id=job_id)
+                timings["archive_ms"] = (time.perf_counter() - started) * 1000
         
         # Update status to success
-        update_status("success", "Fingerprint captured successfully!")
+        update_status("success", "Fingerprint captured successfully!",
+                      timings={k: round(v, 3) for k, v in timings.items()}, job_id=job_id,
+                      device=label, quality=quality, template_info=template_info, duplicate=duplicate,
+                      burst=burst)
+        result = "success"
+        
+    except CaptureCancelled as e:
+        result = "cancelled"
+        update_status("cancelled", "Scan cancelled", job_id=job_id, device=label)
+        print(f"[{label}] Job {job_id}: {e}")
         
     except TimeoutError as e:
-        update_status("error", str(e), "timeout")
-        log_error(f"Capture timeout: {e}")
+        result = "timeout"
+        update_status("error", str(e), "timeout", job_id=job_id, device=label)
+        log_error(f"Capture timeout: {e}", job_id=job_id, device=label)
+        
+    except LowQualityError as e:
+        result = "low_quality"
+        update_status("error", str(e), "low_quality", job_id=job_id, device=label, quality=e.quality)
+        log_error(f"Capture rejected: {e}", job_id=job_id, device=label)
+        
+    except DuplicateCaptureError as e:
+        result = "duplicate"
+        update_status("error", str(e), "duplicate", job_id=job_id, device=label, duplicate=e.duplicate)
+        log_error(f"Capture rejected: {e}", job_id=job_id, device=label)
+        
+    except DeviceError as e:
+        result = "device_error"
+        update_status("error", f"Capture failed: {e}", "device_error", job_id=job_id, device=label)
+        log_error(f"Device error: {e}", job_id=job_id, device=label)
         
     except Exception as e:
-        update_status("error", f"Capture failed: {e}", "capture_error")
-        log_error(f"Capture error: {e}")
+        update_status("error", f"Capture failed: {e}", "capture_error", job_id=job_id, device=label)
+        log_error(f"Capture error: {e}", job_id=job_id, device=label)
+    
+    finally:
+        with captures_lock:
+            active_captures.pop(job_id, None)
+        record_capture_metrics(label, timings, capture_stats, result)
+    return result
+
+def capture_worker(supervisor: DeviceSupervisor, stop: threading.Event):
+    """Serve capture requests on one device until stop is set.
+
+    Each device has its own worker and only asks the transport for a request
+    while idle, so queued jobs go to the first idle device. While a bridge
+    wants live preview, an idle worker grabs preview frames instead of
+    blocking, checking for a request before every frame. Whenever the device
+    is not ready the worker takes no requests and its supervisor reopens it,
+    so queued jobs wait for a working device instead of failing.
+    """
+    device = supervisor.device
+    while not stop.is_set():
+        try:
+            if not supervisor.ready:
+                supervisor.connect(stop)
+                continue
+            if preview_publisher is not None and transport.preview_wanted():
+                request = transport.poll_request(0)
+                if request is None:
+                    grab_preview_frame(device, stop)
+                    supervisor.report_ok()
+                    continue
+            else:
+                request = transport.poll_request(REQUEST_WAIT)
+            if request is None:
+                supervisor.probe_if_due()
+                continue
+            
+            print(f"[{device.label}] Capture request {request['job_id']} ({request['source']}). Processing...")
+            result = process_capture_request(device, request)
+            if result == "device_error":
+                supervisor.verify("Device error during capture")
+            else:
+                supervisor.report_ok()
+            print(f"[{device.label}] Capture request completed.")
+        
+        except DeviceError as e:
+            supervisor.verify(str(e))
+        
+        except Exception as e:
+            log_error(f"Capture worker error: {e}", device=device.label)
+            print(f"[{device.label}] Service error: {e}")
+            time.sleep(1)  # Wait before continuing
 
 def main():
     """Main service loop."""
     print("=" * 60)
-    print("FINGERPRINT SERVICE - File-Based Communication")
+    print("FINGERPRINT SERVICE")
     print("=" * 60)
     print(f"Communication directory: {os.path.abspath(COMM_DIR)}")
     print("Service starting...")
@@ -182,36 +503,70 @@ def main():
     # Cleanup old files
     cleanup_old_files()
     
+    # Open request/status channel
+    global transport, buffer_pool, capture_archive, preview_publisher, duplicate_detector
+    transport = create_service_transport()
+    print(f"Transport: {transport.name}")
+    
+    # Export metrics for the bridge's GET /metrics
+    metrics_exporter = FileExporter().start()
+    
+    if PREVIEW_ENABLED:
+        preview_publisher = PreviewPublisher(transport.publish_preview, IMAGE_X, IMAGE_Y)
+    
+    # Open capture archive
+    if ARCHIVE_ENABLED:
+        try:
+            capture_archive = CaptureArchive()
+            print(f"Capture archive: {capture_archive.directory} ({len(capture_archive)} frames)")
+        except Exception as e:
+            log_error(f"Capture archive unavailable: {e}")
+            print(f"Capture archive unavailable: {e}")
+    
+    # Load the perceptual-hash index of earlier captures
+    if DEDUP_ENABLED and DEDUP_AVAILABLE:
+        try:
+            duplicate_detector = DuplicateDetector()
+            print(f"Duplicate detection: {len(duplicate_detector)} hashes")
+        except Exception as e:
+            log_error(f"Duplicate detection unavailable: {e}")
+            print(f"Duplicate detection unavailable: {e}")
+    
     # Initialize status
     update_status("initializing", "Starting fingerprint device...")
     
-    h = None
+    stop = threading.Event()
+    workers = []
     try:
-        # Open device
-        h = open_device()
-        update_status("ready", "Service ready. Waiting for capture requests...")
-        print("Device opened successfully. Service is ready.")
+        # One supervisor and capture worker per configured device; each worker
+        # opens its sensor and reopens it whenever it fails, and the service
+        # reports "ready" as soon as any sensor is
+        for device in create_devices():
+            supervisors.append(DeviceSupervisor(device, on_change=device_state_changed))
+        # A burst holds BURST_BUFFERS frames at once
+        buffer_pool = BufferPool(count=max(POOL_SIZE, len(supervisors) * BURST_BUFFERS), size=IMAGE_BYTES)
+        for supervisor in supervisors:
+            DEVICE_UP.labels(supervisor.label).set(0)
+            worker = threading.Thread(target=capture_worker, args=(supervisor, stop),
+                                      name=f"capture-{supervisor.label}", daemon=True)
+            worker.start()
+            workers.append(worker)
+        labels = ", ".join(f"{s.label} ({s.device.name})" for s in supervisors)
+        print(f"Devices: {labels}")
         print("Monitoring for capture requests... (Press Ctrl+C to stop)")
         
-        # Main service loop
-        while True:
+        # Workers own the sensors; this loop stays free to act on cancellations
+        while any(worker.is_alive() for worker in workers):
             try:
-                # Check for capture request
-                if os.path.exists(REQUEST_FLAG):
-                    print("Capture request detected. Processing...")
-                    process_capture_request(h)
-                    print("Capture request completed.")
-                
-                # Small delay to avoid busy waiting
-                time.sleep(0.1)
-                
-            except KeyboardInterrupt:
-                break
-                
-            except Exception as e:
-                log_error(f"Service loop error: {e}")
-                print(f"Service error: {e}")
-                time.sleep(1)  # Wait before continuing
+                for job_id in transport.poll_cancel(REQUEST_WAIT):
+                    print(f"Cancelling job {job_id}")
+                    cancel_job(job_id)
+            except OSError as e:
+                log_error(f"Cancel poll error: {e}")
+                time.sleep(REQUEST_WAIT)
+    
+    except KeyboardInterrupt:
+        pass
     
     except Exception as e:
         error_msg = f"Device initialization failed: {e}"
@@ -220,10 +575,27 @@ def main():
         log_error(error_msg)
     
     finally:
-        if h:
-            close_device(h)
+        # Abort in-flight captures, then wait for workers before closing their devices
+        stop.set()
+        with captures_lock:
+            for cancel in active_captures.values():
+                cancel.set()
+        deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        for supervisor in supervisors:
+            supervisor.stop()
+        if capture_archive is not None:
+            capture_archive.close()
+        if duplicate_detector is not None:
+            duplicate_detector.close()
+        if preview_publisher is not None:
+            preview_publisher.close()
         update_status("stopped", "Service stopped")
+        transport.close()
+        metrics_exporter.close()
+        error_logger.close()
         print("Service stopped.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
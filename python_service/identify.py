@@ -0,0 +1,377 @@
+"""1:N identification of minutiae templates against an enrolled gallery.
+
+Usage (benchmark with synthetic galleries):
+    python identify.py [--sizes 1000,10000] [--probes 20] [--workers N]
+"""
+import os
+import math
+import multiprocessing
+import struct
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; identification is unavailable without it
+    np = None
+
+from template import decode_template, ENDING
+
+# ===== Configuration =====
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+GALLERY_DIR = os.environ.get("FINGERPRINT_GALLERY_DIR", os.path.join(PROJECT_ROOT, "communication", "gallery"))
+
+CANDIDATES = int(os.environ.get("FINGERPRINT_IDENTIFY_CANDIDATES", "100"))  # Shortlist for fine matching
+MATCH_THRESHOLD = float(os.environ.get("FINGERPRINT_MATCH_THRESHOLD", "0.25"))
+MATCH_WORKERS = int(os.environ.get("FINGERPRINT_MATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARALLEL_MIN = 32  # Fewer candidates than this are matched in-process
+
+# Pair-histogram embedding: every minutiae pair within PAIR_RANGE pixels votes
+# into (distance, relative direction, direction-to-pair-line) bins; these are
+# invariant to translation and rotation of the finger
+PAIR_RANGE = (10.0, 130.0)
+DISTANCE_BINS, RELATIVE_BINS, LINE_BINS = 12, 6, 6
+EMBEDDING_SIZE = DISTANCE_BINS * RELATIVE_BINS * LINE_BINS
+EMBEDDING_VERSION = 1
+
+# Fine matcher tolerances (rotations up to +/-90 degrees are considered)
+DISTANCE_TOLERANCE = 12.0
+ANGLE_TOLERANCE = math.radians(20)
+MIN_MINUTIAE = 4
+
+# Alignment votes are binned by rotation and translation; the most voted
+# bins become the hypotheses that are verified
+ROTATION_BINS = 18
+TRANSLATION_BIN = 8.0
+TRANSLATION_RANGE = 320.0
+HYPOTHESES = 3
+
+RECORD_HEADER = struct.Struct('<HI')  # user ID length, template length
+
+# ===== Features =====
+def _wrap_half_turn(angles):
+    """Wrap angles into [-pi/2, pi/2): direction differences ignoring polarity."""
+    return (angles + np.pi / 2) % np.pi - np.pi / 2
+
+def minutiae_array(template: bytes):
+    """Decode a template into an (n, 4) float32 array of x, y, angle, type."""
+    minutiae = decode_template(template)["minutiae"]
+    return np.asarray(minutiae, dtype=np.float32).reshape(-1, 4)
+
+def embed(minutiae) -> "np.ndarray":
+    """Fixed-length, unit-norm pair-histogram vector for an (n, 4) minutiae array."""
+    vector = np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+    if len(minutiae) < 2:
+        return vector
+    i, j = np.triu_indices(len(minutiae), 1)
+    dx = minutiae[j, 0] - minutiae[i, 0]
+    dy = minutiae[j, 1] - minutiae[i, 1]
+    dist = np.hypot(dx, dy)
+    near = (dist >= PAIR_RANGE[0]) & (dist < PAIR_RANGE[1])
+    i, j, dx, dy, dist = i[near], j[near], dx[near], dy[near], dist[near]
+
+    line = np.arctan2(dy, dx)
+    relative = (minutiae[i, 2] - minutiae[j, 2]) % np.pi
+    to_line = (minutiae[i, 2] - line) % np.pi
+    d_bin = ((dist - PAIR_RANGE[0]) / (PAIR_RANGE[1] - PAIR_RANGE[0]) * DISTANCE_BINS).astype(int)
+    r_bin = np.minimum((relative / np.pi * RELATIVE_BINS).astype(int), RELATIVE_BINS - 1)
+    l_bin = np.minimum((to_line / np.pi * LINE_BINS).astype(int), LINE_BINS - 1)
+    index = (d_bin * RELATIVE_BINS + r_bin) * LINE_BINS + l_bin
+    vector += np.bincount(index, minlength=EMBEDDING_SIZE).astype(np.float32)
+
+    # Square root (Hellinger) damps dominant bins before normalising
+    vector = np.sqrt(vector)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+# ===== Fine Matching =====
+def match_score(probe, candidate) -> float:
+    """Alignment-based similarity of two (n, 4) minutiae arrays, from 0 to 1.
+
+    Every same-type minutiae pair votes for the rotation and translation that
+    maps one onto the other (a Hough transform); the best-supported
+    alignments are applied to the whole probe, and the score is the number of
+    probe minutiae landing on a candidate minutia, squared and normalised by
+    both set sizes.
+    """
+    n, m = len(probe), len(candidate)
+    if n < MIN_MINUTIAE or m < MIN_MINUTIAE:
+        return 0.0
+    pi, ci = np.nonzero(probe[:, None, 3] == candidate[None, :, 3])
+    if len(pi) == 0:
+        return 0.0
+    rotation = _wrap_half_turn(candidate[ci, 2] - probe[pi, 2])
+    cos, sin = np.cos(rotation), np.sin(rotation)
+    tx = candidate[ci, 0] - (cos * probe[pi, 0] - sin * probe[pi, 1])
+    ty = candidate[ci, 1] - (sin * probe[pi, 0] + cos * probe[pi, 1])
+
+    # Vote in (rotation, tx, ty) bins and keep the strongest few
+    t_bins = int(2 * TRANSLATION_RANGE / TRANSLATION_BIN)
+    r_bin = ((rotation / np.pi + 0.5) * ROTATION_BINS).astype(int) % ROTATION_BINS
+    x_bin = np.clip(((tx + TRANSLATION_RANGE) / TRANSLATION_BIN).astype(int), 0, t_bins - 1)
+    y_bin = np.clip(((ty + TRANSLATION_RANGE) / TRANSLATION_BIN).astype(int), 0, t_bins - 1)
+    cell = (r_bin * t_bins + x_bin) * t_bins + y_bin
+    cells, inverse, votes = np.unique(cell, return_inverse=True, return_counts=True)
+    top = np.argsort(-votes)[:HYPOTHESES]
+    hypotheses = []
+    for t in top:
+        members = inverse == t
+        hypotheses.append((float(np.mean(rotation[members])), float(np.mean(tx[members])),
+                           float(np.mean(ty[members]))))
+    h_rot, h_tx, h_ty = (np.asarray(v, dtype=np.float32)[:, None] for v in zip(*hypotheses))
+
+    # Every probe minutia under each hypothesis: (hypotheses, n)
+    h_cos, h_sin = np.cos(h_rot), np.sin(h_rot)
+    x = h_cos * probe[:, 0] - h_sin * probe[:, 1] + h_tx
+    y = h_sin * probe[:, 0] + h_cos * probe[:, 1] + h_ty
+    angle = probe[:, 2] + h_rot
+
+    # Against every candidate minutia: (hypotheses, n, m)
+    d2 = (x[:, :, None] - candidate[:, 0]) ** 2 + (y[:, :, None] - candidate[:, 1]) ** 2
+    da = np.abs(_wrap_half_turn(angle[:, :, None] - candidate[:, 2]))
+    paired = (d2 <= DISTANCE_TOLERANCE ** 2) & (da <= ANGLE_TOLERANCE)
+    matched = int(paired.any(axis=2).sum(axis=1).max())
+    return matched * matched / (n * m)
+
+def match_batch(probe, candidates: list) -> list:
+    """Score probe against (index, minutiae) candidates; runs in worker processes."""
+    return [(index, match_score(probe, minutiae)) for index, minutiae in candidates]
+
+# ===== Gallery =====
+class Gallery:
+    """Enrolled templates with a contiguous embedding index.
+
+    Templates are appended to templates.bin and their embeddings to a raw
+    float32 file alongside, so reopening a large gallery does not recompute
+    them. Identification ranks every enrolment by embedding similarity with
+    one matrix-vector product, then fine-matches the top candidates across
+    worker processes.
+    """
+
+    def __init__(self, directory: str = GALLERY_DIR, workers: int = MATCH_WORKERS):
+        if np is None:
+            raise RuntimeError("Identification requires NumPy")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.workers = workers
+        self.records_path = os.path.join(directory, "templates.bin")
+        self.vectors_path = os.path.join(directory, f"embeddings.v{EMBEDDING_VERSION}.f32")
+        self._lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        self._pool = None
+        self.user_ids = []
+        self.minutiae = []
+        self._vectors = np.zeros((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._load()
+        self._records_file = open(self.records_path, 'ab')
+        self._vectors_file = open(self.vectors_path, 'ab')
+
+    def _load(self):
+        if os.path.exists(self.records_path):
+            with open(self.records_path, 'rb') as f:
+                data = f.read()
+            pos = 0
+            while pos + RECORD_HEADER.size <= len(data):
+                id_len, template_len = RECORD_HEADER.unpack_from(data, pos)
+                end = pos + RECORD_HEADER.size + id_len + template_len
+                if end > len(data):
+                    break  # Torn final record from a crash; ignored
+                start = pos + RECORD_HEADER.size
+                self.user_ids.append(data[start:start + id_len].decode('utf-8'))
+                self.minutiae.append(minutiae_array(data[start + id_len:end]))
+                pos = end
+            if pos < len(data):
+                with open(self.records_path, 'r+b') as f:
+                    f.truncate(pos)
+
+        count = len(self.user_ids)
+        vectors = np.zeros((0, EMBEDDING_SIZE), dtype=np.float32)
+        torn = False
+        if os.path.exists(self.vectors_path):
+            row_bytes = EMBEDDING_SIZE * 4
+            torn = os.path.getsize(self.vectors_path) % row_bytes != 0
+            vectors = np.fromfile(self.vectors_path, dtype=np.float32)
+            vectors = vectors[:len(vectors) // EMBEDDING_SIZE * EMBEDDING_SIZE].reshape(-1, EMBEDDING_SIZE)
+        if len(vectors) != count or torn:
+            # A torn last row would misalign every embedding appended after it
+            # Missing or stale embeddings are recomputed and the file rewritten
+            known = vectors[:count]
+            rest = [embed(m) for m in self.minutiae[len(known):]]
+            vectors = np.vstack([known] + rest) if rest else known
+            with open(self.vectors_path, 'wb') as f:
+                f.write(vectors.astype(np.float32).tobytes())
+        self._vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def enroll(self, user_id: str, template: bytes) -> int:
+        """Add a template for user_id, returning the gallery size."""
+        user_bytes = user_id.encode('utf-8')
+        minutiae = minutiae_array(template)
+        vector = embed(minutiae)
+        with self._lock:
+            self._records_file.write(RECORD_HEADER.pack(len(user_bytes), len(template)) + user_bytes + template)
+            self._records_file.flush()
+            self._vectors_file.write(vector.tobytes())
+            self._vectors_file.flush()
+
+            # Grow the index geometrically so enrolment stays amortised O(1)
+            if self._count == len(self._vectors):
+                grown = np.zeros((max(64, 2 * len(self._vectors)), EMBEDDING_SIZE), dtype=np.float32)
+                grown[:self._count] = self._vectors[:self._count]
+                self._vectors = grown
+            self._vectors[self._count] = vector
+            self.user_ids.append(user_id)
+            self.minutiae.append(minutiae)
+            self._count += 1
+            return self._count
+
+    def _worker_pool(self) -> ProcessPoolExecutor:
+        # Workers are started fresh rather than forked: the service forks from
+        # threads holding locks, which a forked child would inherit held
+        with self._pool_lock:
+            if self._pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._pool
+
+    def _match(self, probe, candidates: list) -> list:
+        if self.workers <= 1 or len(candidates) < PARALLEL_MIN:
+            return match_batch(probe, candidates)
+        pool = self._worker_pool()
+        size = math.ceil(len(candidates) / self.workers)
+        chunks = [candidates[i:i + size] for i in range(0, len(candidates), size)]
+        futures = [pool.submit(match_batch, probe, chunk) for chunk in chunks]
+        return [score for future in futures for score in future.result()]
+
+    def identify(self, template: bytes, top: int = 5, candidates: int = CANDIDATES,
+                 threshold: float = MATCH_THRESHOLD) -> dict:
+        """Find the enrolled users most similar to template.
+
+        Returns up to top matches scoring at least threshold, best first, with
+        per-stage timings in ms.
+        """
+        started = time.perf_counter()
+        probe = minutiae_array(template)
+        vector = embed(probe)
+        with self._lock:
+            count = self._count
+            vectors = self._vectors[:count]
+        timings = {"embed_ms": (time.perf_counter() - started) * 1000}
+
+        # Coarse ranking over the whole gallery
+        started = time.perf_counter()
+        shortlist = []
+        if count:
+            similarity = vectors @ vector
+            k = min(candidates, count)
+            shortlist = np.argpartition(-similarity, k - 1)[:k] if k < count else np.arange(count)
+        timings["index_ms"] = (time.perf_counter() - started) * 1000
+
+        # Fine matching of the shortlist
+        started = time.perf_counter()
+        scores = self._match(probe, [(int(i), self.minutiae[i]) for i in shortlist])
+        timings["match_ms"] = (time.perf_counter() - started) * 1000
+
+        # Best score per user, as users may enrol several impressions
+        best = {}
+        for index, score in scores:
+            user_id = self.user_ids[index]
+            if score >= threshold and score > best.get(user_id, -1.0):
+                best[user_id] = score
+        matches = sorted(best.items(), key=lambda item: -item[1])[:top]
+        return {"matches": [{"user_id": u, "score": round(s, 4)} for u, s in matches],
+                "gallery_size": count, "candidates": len(shortlist),
+                "timings": {k: round(v, 3) for k, v in timings.items()}}
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+        self._records_file.close()
+        self._vectors_file.close()
+
+# ===== Benchmark =====
+def _synthetic_minutiae(rng, count: int):
+    """Random minutiae spread over the sensor area."""
+    m = np.empty((count, 4), dtype=np.float32)
+    m[:, 0] = rng.uniform(24, 232, count)
+    m[:, 1] = rng.uniform(24, 264, count)
+    m[:, 3] = rng.integers(1, 3, count)
+    m[:, 2] = rng.uniform(0, 2 * np.pi, count)
+    m[m[:, 3] != ENDING, 2] %= np.pi
+    return m
+
+def _impression(rng, minutiae):
+    """A second impression: rotated, shifted, jittered, with missing and spurious minutiae."""
+    theta = rng.uniform(-0.25, 0.25)
+    c, s = math.cos(theta), math.sin(theta)
+    cx, cy = 128, 144
+    keep = minutiae[rng.random(len(minutiae)) > 0.2].copy()
+    x, y = keep[:, 0] - cx, keep[:, 1] - cy
+    keep[:, 0] = c * x - s * y + cx + rng.uniform(-15, 15) + rng.normal(0, 2, len(keep))
+    keep[:, 1] = s * x + c * y + cy + rng.uniform(-15, 15) + rng.normal(0, 2, len(keep))
+    keep[:, 2] = keep[:, 2] + theta + rng.normal(0, 0.05, len(keep))
+    keep[keep[:, 3] == ENDING, 2] %= 2 * np.pi
+    keep[keep[:, 3] != ENDING, 2] %= np.pi
+    extra = _synthetic_minutiae(rng, max(1, len(minutiae) // 10))
+    both = np.vstack([keep, extra])
+    inside = (both[:, 0] >= 0) & (both[:, 0] < 256) & (both[:, 1] >= 0) & (both[:, 1] < 288)
+    return both[inside]
+
+def _encode(minutiae) -> bytes:
+    from template import encode_template
+    return encode_template([(int(x), int(y), float(a), int(k)) for x, y, a, k in minutiae])
+
+def benchmark(sizes: list, probes: int = 20, workers: int = MATCH_WORKERS, seed: int = 1):
+    """Identification latency and rank-1 accuracy against synthetic galleries."""
+    import tempfile
+
+    rng = np.random.default_rng(seed)
+    print(f"Workers: {workers}, candidates: {CANDIDATES}")
+    print(f"  {'gallery':>8s} {'enrol s':>8s} {'p50 ms':>8s} {'p95 ms':>8s} "
+          f"{'index ms':>9s} {'match ms':>9s} {'rank-1':>7s}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            gallery = Gallery(directory, workers=workers)
+            prints = [_synthetic_minutiae(rng, int(rng.integers(25, 50))) for _ in range(size)]
+            started = time.perf_counter()
+            for n, m in enumerate(prints):
+                gallery.enroll(f"user{n}", _encode(m))
+            enrol_s = time.perf_counter() - started
+
+            latencies, index_ms, match_ms, hits = [], [], [], 0
+            gallery.identify(_encode(prints[0]))  # Warm the pool
+            for _ in range(probes):
+                target = int(rng.integers(size))
+                probe = _encode(_impression(rng, prints[target]))
+                started = time.perf_counter()
+                result = gallery.identify(probe)
+                latencies.append((time.perf_counter() - started) * 1000)
+                index_ms.append(result["timings"]["index_ms"])
+                match_ms.append(result["timings"]["match_ms"])
+                hits += bool(result["matches"]) and result["matches"][0]["user_id"] == f"user{target}"
+            gallery.close()
+
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"  {size:8d} {enrol_s:8.2f} {latencies[len(latencies) // 2]:8.1f} {p95:8.1f} "
+              f"{sum(index_ms) / probes:9.2f} {sum(match_ms) / probes:9.1f} {hits / probes:7.0%}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark 1:N identification")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated gallery sizes")
+    parser.add_argument("--probes", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=MATCH_WORKERS)
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("Identification requires NumPy")
+    benchmark([int(s) for s in args.sizes.split(",")], args.probes, args.workers)
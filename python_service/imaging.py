@@ -0,0 +1,200 @@
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure-Python paths are used instead
+    np = None
+
+# ===== Configuration =====
+IMAGE_X, IMAGE_Y = 256, 288
+PNG_COMPRESSION = 6
+
+BMP_HEADER_SIZE = 14 + 40
+# 8-bit grayscale palette: entry i is (B, G, R, 0) = (i, i, i, 0)
+GRAY_PALETTE = b"".join(bytes((i, i, i, 0)) for i in range(256))
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+FORMATS = {
+    "bmp": "image/bmp",
+    "png": "image/png",
+}
+
+# ===== BMP =====
+def encode_bmp(pixels, width: int = IMAGE_X, height: int = IMAGE_Y) -> bytearray:
+    """Encode top-down 8-bit grayscale pixels as a bottom-up palettised BMP."""
+    view = memoryview(pixels).cast('B')
+    if len(view) < width * height:
+        raise ValueError(f"Expected {width * height} pixels, got {len(view)}")
+
+    stride = (width + 3) & ~3
+    pad = bytes(stride - width)
+    image_size = stride * height
+    offset = BMP_HEADER_SIZE + len(GRAY_PALETTE)
+
+    out = bytearray(offset + image_size)
+    struct.pack_into('<2sIHHI', out, 0, b'BM', offset + image_size, 0, 0, offset)
+    struct.pack_into('<IiiHHIIiiII', out, 14, 40, width, height, 1, 8, 0, image_size, 0, 0, 256, 0)
+    out[BMP_HEADER_SIZE:offset] = GRAY_PALETTE
+
+    if np is not None and not pad:
+        # Flip rows straight into the output buffer in a single pass
+        rows = np.frombuffer(view, dtype=np.uint8, count=width * height).reshape(height, width)
+        target = np.frombuffer(out, dtype=np.uint8, offset=offset).reshape(height, width)
+        target[:] = rows[::-1]
+    else:
+        pos = offset
+        for y in range(height - 1, -1, -1):
+            out[pos:pos + width] = view[y * width:(y + 1) * width]
+            out[pos + width:pos + stride] = pad
+            pos += stride
+    return out
+
+def decode_bmp(data) -> tuple:
+    """Decode an 8-bit palettised BMP into (width, height, top-down pixels)."""
+    data = memoryview(data).cast('B')
+    if bytes(data[:2]) != b'BM':
+        raise ValueError("Not a BMP file")
+    offset = struct.unpack_from('<I', data, 10)[0]
+    header_size, width, height, _, bpp, compression = struct.unpack_from('<IiiHHI', data, 14)
+    if bpp != 8 or compression != 0:
+        raise ValueError(f"Unsupported BMP format: {bpp} bpp, compression {compression}")
+
+    bottom_up = height > 0
+    height = abs(height)
+    stride = (width + 3) & ~3
+    palette = data[14 + header_size:offset]
+
+    rows = []
+    for y in range(height):
+        row = height - 1 - y if bottom_up else y
+        start = offset + row * stride
+        rows.append(data[start:start + width])
+    pixels = b"".join(rows)
+
+    # Map through the palette unless it is the identity grayscale ramp
+    if len(palette) >= 1024 and bytes(palette[:1024]) != GRAY_PALETTE:
+        table = bytes(palette[i * 4 + 1] for i in range(256))  # green channel
+        pixels = pixels.translate(table)
+    return width, height, pixels
+
+# ===== PNG =====
+def _png_chunk(kind: bytes, payload: bytes) -> bytes:
+    return (struct.pack('>I', len(payload)) + kind + payload +
+            struct.pack('>I', zlib.crc32(kind + payload) & 0xFFFFFFFF))
+
+def _paeth_filter(rows):
+    """Apply the PNG Paeth filter (type 4) to every row with NumPy."""
+    img = rows.astype(np.int16)
+    a = np.zeros_like(img)
+    a[:, 1:] = img[:, :-1]          # left
+    b = np.zeros_like(img)
+    b[1:, :] = img[:-1, :]          # up
+    c = np.zeros_like(img)
+    c[1:, 1:] = img[:-1, :-1]       # upper-left
+
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    pred = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    filtered = ((img - pred) & 0xFF).astype(np.uint8)
+
+    out = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    out[:, 0] = 4
+    out[:, 1:] = filtered
+    return out.tobytes()
+
+def encode_png(pixels, width: int = IMAGE_X, height: int = IMAGE_Y,
+               compression: int = PNG_COMPRESSION) -> bytes:
+    """Encode top-down 8-bit grayscale pixels as a PNG."""
+    view = memoryview(pixels).cast('B')
+    if len(view) < width * height:
+        raise ValueError(f"Expected {width * height} pixels, got {len(view)}")
+
+    if np is not None:
+        rows = np.frombuffer(view, dtype=np.uint8, count=width * height).reshape(height, width)
+        raw = _paeth_filter(rows)
+    else:
+        # Filter type 0 (None) per row
+        raw = b"".join(b"\x00" + view[y * width:(y + 1) * width] for y in range(height))
+
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)  # 8-bit grayscale
+    return (PNG_SIGNATURE +
+            _png_chunk(b'IHDR', ihdr) +
+            _png_chunk(b'IDAT', zlib.compress(raw, compression)) +
+            _png_chunk(b'IEND', b''))
+
+# ===== Format Selection =====
+def encode_image(pixels, fmt: str, width: int = IMAGE_X, height: int = IMAGE_Y) -> bytes:
+    """Encode pixels in the named format ("bmp" or "png")."""
+    if fmt == "png":
+        return encode_png(pixels, width, height)
+    if fmt == "bmp":
+        return encode_bmp(pixels, width, height)
+    raise ValueError(f"Unsupported image format: {fmt}")
+
+def transcode_bmp(data, fmt: str) -> bytes:
+    """Re-encode a BMP file in another format."""
+    if fmt == "bmp":
+        return bytes(data)
+    width, height, pixels = decode_bmp(data)
+    return encode_image(pixels, fmt, width, height)
+
+def negotiate_format(requested: str = None, accept: str = None, default: str = "bmp") -> str:
+    """Pick an output format from an explicit request or an Accept header."""
+    if requested:
+        requested = requested.lower()
+        if requested not in FORMATS:
+            raise ValueError(f"Unsupported image format: {requested}")
+        return requested
+
+    best, best_q = default, 0.0
+    for item in (accept or "").split(','):
+        parts = [p.strip() for p in item.split(';')]
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        for fmt, mime in FORMATS.items():
+            if parts[0] == mime and q > best_q:
+                best, best_q = fmt, q
+    return best
+
+# ===== Benchmark =====
+def benchmark(iterations: int = 200):
+    """Time in-process encoders per frame, and the vendor DLL where available."""
+    import os
+    import tempfile
+
+    pixels = bytes((x ^ y) & 0xFF for y in range(IMAGE_Y) for x in range(IMAGE_X))
+    results = {}
+    for name, fn in (("bmp", encode_bmp), ("png", encode_png)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            data = fn(pixels)
+        results[name] = ((time.perf_counter() - start) / iterations * 1000, len(data))
+
+    try:
+        import ctypes
+        from device import load_vendor_dll
+        dll = load_vendor_dll()
+        buf = (ctypes.c_ubyte * len(pixels)).from_buffer_copy(pixels)
+        path = os.path.join(tempfile.gettempdir(), "bench_capture.bmp").encode("utf-8")
+        start = time.perf_counter()
+        for _ in range(iterations):
+            dll.PSImgData2BMP(buf, path)
+        results["dll_bmp"] = ((time.perf_counter() - start) / iterations * 1000, os.path.getsize(path))
+    except (ImportError, AttributeError, OSError, SystemExit) as e:
+        print(f"Vendor DLL benchmark skipped: {e}")
+
+    print(f"NumPy: {'yes' if np is not None else 'no'}")
+    for name, (ms, size) in results.items():
+        print(f"  {name:8s} {ms:8.3f} ms/frame  {size:7d} bytes")
+    return results
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
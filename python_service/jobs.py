@@ -0,0 +1,95 @@
+import os
+import re
+import time
+import secrets
+import threading
+from collections import OrderedDict
+
+# ===== Configuration =====
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+COMM_DIR = os.path.join(PROJECT_ROOT, "communication")
+
+REQUESTS_DIR = os.path.join(COMM_DIR, "requests")   # Pending requests (file transport)
+JOBS_DIR = os.path.join(COMM_DIR, "jobs")           # Per-job status records
+CAPTURES_DIR = os.path.join(COMM_DIR, "captures")   # Per-job images
+TEMPLATES_DIR = os.path.join(COMM_DIR, "templates") # Per-job minutiae templates
+CANCELS_DIR = os.path.join(COMM_DIR, "cancels")     # Cancellation requests (file transport)
+
+MAX_PENDING_JOBS = int(os.environ.get("FINGERPRINT_MAX_PENDING_JOBS", "8"))
+JOB_HISTORY = int(os.environ.get("FINGERPRINT_JOB_HISTORY", "100"))
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{24}$")
+FINAL_STATES = ("success", "error", "cancelled")
+
+for directory in (REQUESTS_DIR, JOBS_DIR, CAPTURES_DIR, TEMPLATES_DIR, CANCELS_DIR):
+    os.makedirs(directory, exist_ok=True)
+
+class QueueFullError(RuntimeError):
+    """The capture queue is at MAX_PENDING_JOBS."""
+
+# ===== Job IDs and Paths =====
+def new_job_id() -> str:
+    """Create a job ID; IDs sort in submission order."""
+    return f"{time.time_ns():016x}{secrets.token_hex(4)}"
+
+def is_valid_job_id(job_id: str) -> bool:
+    return bool(job_id) and JOB_ID_PATTERN.match(job_id) is not None
+
+def request_file(job_id: str) -> str:
+    return os.path.join(REQUESTS_DIR, f"{job_id}.json")
+
+def job_file(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def capture_file(job_id: str) -> str:
+    return os.path.join(CAPTURES_DIR, f"{job_id}.bmp")
+
+def template_file(job_id: str) -> str:
+    return os.path.join(TEMPLATES_DIR, f"{job_id}.fpt")
+
+def cancel_file(job_id: str) -> str:
+    return os.path.join(CANCELS_DIR, job_id)
+
+def pending_request_ids() -> list:
+    """IDs of requests waiting in the file transport's queue, oldest first."""
+    return sorted(name[:-5] for name in os.listdir(REQUESTS_DIR)
+                  if name.endswith(".json") and is_valid_job_id(name[:-5]))
+
+def pending_cancel_ids() -> list:
+    """IDs of jobs with a cancellation request waiting in the file transport."""
+    return [name for name in os.listdir(CANCELS_DIR) if is_valid_job_id(name)]
+
+# ===== History =====
+class JobHistory:
+    """Bounded in-memory table of recent job records.
+
+    Evicting a finished job also removes its status record, image and template, so the
+    communication directory holds at most `limit` jobs.
+    """
+
+    def __init__(self, limit: int = JOB_HISTORY, remove_files: bool = False):
+        self.limit = limit
+        self.remove_files = remove_files
+        self._records = OrderedDict()
+        self._lock = threading.Lock()  # Updated by every capture worker
+
+    def get(self, job_id: str):
+        return self._records.get(job_id)
+
+    def put(self, record: dict):
+        job_id = record["job_id"]
+        with self._lock:
+            self._records[job_id] = record
+            self._records.move_to_end(job_id)
+            evicted = []
+            while len(self._records) > self.limit:
+                evicted.append(self._records.popitem(last=False)[0])
+        if not self.remove_files:
+            return
+        for old_id in evicted:
+            for path in (job_file(old_id), capture_file(old_id), template_file(old_id)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,96 @@
+import os
+import json
+import queue
+import atexit
+import threading
+from datetime import datetime
+
+# ===== Configuration =====
+LOG_MAX_BYTES = int(os.environ.get("FINGERPRINT_LOG_MAX_BYTES", str(1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("FINGERPRINT_LOG_BACKUPS", "3"))
+LOG_FLUSH_INTERVAL = 0.5   # Max seconds a record waits before it is written
+LOG_QUEUE_SIZE = 10000     # Records beyond this are dropped rather than block callers
+
+_STOP = object()
+
+class BackgroundLogger:
+    """JSON-lines logger that writes from a background thread.
+
+    log() only enqueues the record, so callers on the capture path never
+    wait on disk. The writer drains the queue in batches, appends them with
+    one write, and rotates the file to path.1 .. path.<backups> once it
+    exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS,
+                 flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, level: str, message: str, **fields):
+        record = {"ts": datetime.now().isoformat(), "level": level, "msg": message, **fields}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def error(self, message: str, **fields):
+        self.log("error", message, **fields)
+
+    def info(self, message: str, **fields):
+        self.log("info", message, **fields)
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                self._write(records)
+            if stop:
+                return
+
+    def _write(self, records: list):
+        if self.dropped:
+            records.append({"ts": datetime.now().isoformat(), "level": "warning",
+                            "msg": f"{self.dropped} log records dropped"})
+            self.dropped = 0
+        data = "".join(json.dumps(r, default=str, separators=(',', ':')) + "\n" for r in records)
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+                size = f.tell()
+            if size > self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass  # Logging must never take the service down
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        """Flush pending records and stop the writer."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(5)
@@ -0,0 +1,258 @@
+import os
+import time
+import bisect
+import threading
+from transport import write_file_atomic, COMM_DIR
+
+# ===== Configuration =====
+# The service writes its metrics here and the bridge appends them to GET /metrics,
+# so one scrape covers both processes whichever transport is in use
+SERVICE_METRICS_FILE = os.environ.get("FINGERPRINT_METRICS_FILE", os.path.join(COMM_DIR, "service_metrics.prom"))
+EXPORT_INTERVAL = float(os.environ.get("FINGERPRINT_METRICS_INTERVAL", "5"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, from a fast status publish up to a full capture timeout
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value) -> str:
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+# ===== Metric Values =====
+class CounterValue:
+    """A monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+class GaugeValue:
+    """A value that can go up and down, or be read from a function at render time."""
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+class HistogramValue:
+    """Observation counts per bucket, plus their sum."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager observing the duration of its block in seconds."""
+        return _Timer(self)
+
+    def snapshot(self) -> tuple:
+        with self._lock:
+            return list(self.counts), self.sum
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+# ===== Metrics =====
+class Metric:
+    """A named metric family with one value per combination of label values.
+
+    An unlabelled metric forwards inc()/set()/observe() to its single value;
+    a labelled one hands out values through labels(), which callers on hot
+    paths can look up once and keep.
+    """
+
+    kind = None
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_value(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        key = tuple(str(v) for v in values)
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def __getattr__(self, name):
+        # inc/set/observe/... on an unlabelled metric
+        if name.startswith("_") or not self.__dict__.get("_default"):
+            raise AttributeError(name)
+        return getattr(self._default, name)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {_escape(self.help)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value.get())}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return CounterValue()
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value.value)}"]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def _new_value(self):
+        return GaugeValue()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_value(self):
+        return HistogramValue(self.buckets)
+
+    def _render_value(self, key, value):
+        counts, total = value.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _number(float(bound))
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {cumulative}")
+        labels = _labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+# ===== Registry =====
+class Registry:
+    """The metrics of one process, rendered together in text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing gauge function must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+class FileExporter:
+    """Periodically write a registry to a file for another process to serve."""
+
+    def __init__(self, path: str = SERVICE_METRICS_FILE, interval: float = EXPORT_INTERVAL,
+                 registry: Registry = None):
+        self.path = path
+        self.interval = interval
+        self.registry = registry or REGISTRY
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self):
+        try:
+            write_file_atomic(self.path, self.registry.render().encode('utf-8'))
+        except OSError:
+            pass  # Metrics must never take the service down
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """Stop exporting after one last write."""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(self.interval + 1)
+        self.write()
@@ -0,0 +1,94 @@
+import os
+import time
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; frames are then subsampled instead of averaged
+    np = None
+
+from imaging import encode_png
+
+# ===== Configuration =====
+PREVIEW_ENABLED = os.environ.get("FINGERPRINT_PREVIEW", "1") != "0"
+PREVIEW_SCALE = int(os.environ.get("FINGERPRINT_PREVIEW_SCALE", "2"))        # 256x288 -> 128x144
+PREVIEW_MAX_FPS = float(os.environ.get("FINGERPRINT_PREVIEW_MAX_FPS", "10"))
+PREVIEW_REFRESH = 1.0       # How often the bridge renews its request while clients watch
+PREVIEW_COMPRESSION = 1     # zlib level; preview frames favour speed over size
+
+PREVIEW_MIME = "image/png"
+
+def downsample(pixels, width: int, height: int, scale: int = PREVIEW_SCALE) -> tuple:
+    """Shrink a top-down grayscale frame by scale, returning (width, height, pixels)."""
+    if scale <= 1:
+        return width, height, bytes(memoryview(pixels).cast('B')[:width * height])
+    view = memoryview(pixels).cast('B')
+    w, h = width // scale, height // scale
+    if np is not None:
+        img = np.frombuffer(view, dtype=np.uint8, count=width * height).reshape(height, width)
+        img = img[:h * scale, :w * scale].reshape(h, scale, w, scale).mean(axis=(1, 3))
+        return w, h, img.astype(np.uint8).tobytes()
+    rows = (view[y * width:y * width + w * scale:scale].tobytes() for y in range(0, h * scale, scale))
+    return w, h, b"".join(rows)
+
+def encode_preview(pixels, width: int, height: int, scale: int = PREVIEW_SCALE) -> bytes:
+    """Downsample a frame and encode it as a fast-compressed PNG."""
+    w, h, small = downsample(pixels, width, height, scale)
+    return encode_png(small, w, h, PREVIEW_COMPRESSION)
+
+def blank_preview(width: int, height: int, scale: int = PREVIEW_SCALE) -> bytes:
+    """An empty-sensor frame, shown until the first real preview frame arrives."""
+    w, h = max(1, width // scale), max(1, height // scale)
+    return encode_png(b"\xff" * (w * h), w, h, PREVIEW_COMPRESSION)
+
+class PreviewPublisher:
+    """Hands live-preview frames from capture workers to the transport.
+
+    publish() only copies the raw frame into a single latest-frame slot, so
+    capture workers never wait on encoding or on a slow reader. A background
+    thread encodes and sends whichever frame is newest when it gets to it;
+    frames replaced before then are dropped.
+    """
+
+    def __init__(self, send, width: int, height: int, scale: int = PREVIEW_SCALE):
+        self.send = send
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.sent = 0
+        self.dropped = 0
+        self._latest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="preview-encoder", daemon=True)
+        self._thread.start()
+
+    def publish(self, device: str, pixels):
+        frame = bytes(memoryview(pixels).cast('B')[:self.width * self.height])
+        with self._cond:
+            if self._latest is not None:
+                self.dropped += 1
+            self._latest = (device, time.time(), frame)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._latest is None and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                device, timestamp, frame = self._latest
+                self._latest = None
+            try:
+                png = encode_preview(frame, self.width, self.height, self.scale)
+                self.sent += 1
+                self.send({"seq": self.sent, "device": device, "timestamp": timestamp, "png": png})
+            except Exception as e:
+                print(f"Preview frame dropped: {e}")
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(1)
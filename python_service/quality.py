@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; captures are reported without a score
+    np = None
+
+# ===== Configuration =====
+IMAGE_X, IMAGE_Y = 256, 288
+BLOCK_SIZE = 16
+
+# Captures scoring below QUALITY_THRESHOLD (0-100) are re-captured up to
+# QUALITY_RETRIES times before the job fails; 0 disables the check
+QUALITY_THRESHOLD = float(os.environ.get("FINGERPRINT_QUALITY_THRESHOLD", "0"))
+QUALITY_RETRIES = int(os.environ.get("FINGERPRINT_QUALITY_RETRIES", "2"))
+
+# A block is foreground (ridges) when its gray-level std exceeds this
+FOREGROUND_STD = 10.0
+# Foreground std that counts as full contrast
+FULL_CONTRAST_STD = 50.0
+# Foreground fraction that counts as full coverage (the sensor edges are blank)
+FULL_COVERAGE = 0.6
+
+# Exponents of the weighted geometric mean, so any metric near 0 sinks the score
+WEIGHTS = {"coverage": 0.3, "contrast": 0.2, "coherence": 0.5}
+
+# ===== Scoring =====
+def block_sums(values, block: int):
+    """Sum each block x block tile of a 2-D array."""
+    h, w = values.shape
+    return values.reshape(h // block, block, w // block, block).sum(axis=(1, 3))
+
+def assess_quality(pixels, width: int = IMAGE_X, height: int = IMAGE_Y,
+                   block: int = BLOCK_SIZE) -> dict:
+    """Score a top-down 8-bit grayscale capture, or return None without NumPy.
+
+    Returns the fraction of blocks holding ridges ("coverage"), their mean
+    contrast ("contrast") and ridge orientation coherence ("coherence"),
+    each 0-1, and a combined "score" from 0 to 100.
+    """
+    if np is None:
+        return None
+    img = np.frombuffer(memoryview(pixels).cast('B'), dtype=np.uint8, count=width * height)
+    img = img.reshape(height, width)
+    # Whole blocks only
+    h, w = height - height % block, width - width % block
+    img = img[:h, :w].astype(np.float32)
+
+    n = block * block
+    mean = block_sums(img, block) / n
+    var = np.maximum(block_sums(img * img, block) / n - mean * mean, 0)
+    std = np.sqrt(var)
+    foreground = std > FOREGROUND_STD
+    coverage = float(foreground.mean())
+    if not foreground.any():
+        return {"score": 0.0, "coverage": 0.0, "contrast": 0.0, "coherence": 0.0}
+
+    contrast = float(np.minimum(std[foreground] / FULL_CONTRAST_STD, 1.0).mean())
+
+    # Structure tensor per block: coherence is 1 for parallel ridges, 0 for noise
+    gy, gx = np.gradient(img)
+    gxx = block_sums(gx * gx, block)
+    gyy = block_sums(gy * gy, block)
+    gxy = block_sums(gx * gy, block)
+    energy = gxx + gyy
+    coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy * gxy) / np.maximum(energy, 1e-6)
+    coherence = float(coherence[foreground].mean())
+
+    metrics = {"coverage": coverage, "contrast": contrast, "coherence": coherence}
+    terms = {**metrics, "coverage": min(coverage / FULL_COVERAGE, 1.0)}
+    score = 100 * float(np.prod([max(terms[k], 1e-6) ** w for k, w in WEIGHTS.items()]))
+    return {"score": round(score, 1), **{k: round(v, 3) for k, v in metrics.items()}}
+
+def burst_score(pixels, width: int = IMAGE_X, height: int = IMAGE_Y, block: int = BLOCK_SIZE) -> float:
+    """Cheap focus score for ranking the frames of one burst, or None without NumPy.
+
+    Ridge coverage (as in assess_quality) times the mean squared difference
+    between neighbouring pixels over the covered blocks, so a smeared or
+    half-placed finger ranks below a settled one. Scores only compare
+    frames of the same placement.
+    """
+    if np is None:
+        return None
+    img = np.frombuffer(memoryview(pixels).cast('B'), dtype=np.uint8, count=width * height)
+    h, w = height - height % block, width - width % block
+    img = img.reshape(height, width)[:h, :w].astype(np.float32)
+
+    n = block * block
+    mean = block_sums(img, block) / n
+    std = np.sqrt(np.maximum(block_sums(img * img, block) / n - mean * mean, 0))
+    foreground = std > FOREGROUND_STD
+    if not foreground.any():
+        return 0.0
+    energy = np.zeros_like(img)
+    energy[:, :-1] = np.square(img[:, 1:] - img[:, :-1])
+    energy[:-1, :] += np.square(img[1:, :] - img[:-1, :])
+    sharpness = float(block_sums(energy, block)[foreground].mean()) / n
+    return round(min(float(foreground.mean()) / FULL_COVERAGE, 1.0) * sharpness, 1)
+
+# ===== Benchmark =====
+def benchmark(path: str, iterations: int = 200):
+    """Score a BMP file and time assess_quality and burst_score per frame."""
+    from imaging import decode_bmp
+
+    with open(path, 'rb') as f:
+        width, height, pixels = decode_bmp(f.read())
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = assess_quality(pixels, width, height)
+    ms = (time.perf_counter() - start) / iterations * 1000
+    print(f"{path}: {result}  ({ms:.3f} ms/frame)")
+    start = time.perf_counter()
+    for _ in range(iterations):
+        score = burst_score(pixels, width, height)
+    ms = (time.perf_counter() - start) / iterations * 1000
+    print(f"{path}: burst score {score}  ({ms:.3f} ms/frame)")
+    return result
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python quality.py <capture.bmp> [iterations]")
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 200)
@@ -1,13 +1,12 @@
 import os
 import time
 import json
-import ctypes
 from datetime import datetime
-from ctypes import byref, c_int, c_uint, c_ubyte, c_char_p, c_void_p
+from imaging import encode_bmp
+from buffers import BufferPool, CaptureBuffer
+from device import Device, create_device, IMAGE_X, IMAGE_Y, IMAGE_BYTES
 
 # ===== Configuration =====
-DLL_NAME = "SynoAPIEx.dll"
-DEFAULT_ADDR = 0xFFFFFFFF
 CAPTURE_TIMEOUT = 15  # Shorter timeout for web interface
 
 # File paths for communication
@@ -20,41 +19,7 @@ ERROR_LOG = os.path.join(COMM_DIR, "error.log")
 # Create communication directory
 os.makedirs(COMM_DIR, exist_ok=True)
 
-# ===== Load DLL =====
-def load_vendor_dll(name: str) -> ctypes.CDLL:
-    try:
-        here = os.path.dirname(os.path.abspath(__file__))
-        candidate = os.path.join(here, name)
-        return ctypes.WinDLL(candidate if os.path.isfile(candidate) else name)
-    except OSError as e:
-        raise SystemExit(f"Failed to load {name}: {e}")
-
-dll = load_vendor_dll(DLL_NAME)
-
-# ===== DLL Setup =====
-HANDLE = c_void_p
-DEVICE_USB, DEVICE_COM, DEVICE_UDISK = 0, 1, 2
-PS_OK, PS_COMM_ERR, PS_NO_FINGER = 0x00, 0x01, 0x02
-IMAGE_X, IMAGE_Y = 256, 288
-IMAGE_BYTES = IMAGE_X * IMAGE_Y
-
-# Function signatures
-dll.PSAutoOpen.argtypes = [ctypes.POINTER(HANDLE), ctypes.POINTER(c_int), c_int, c_uint, c_int]
-dll.PSAutoOpen.restype = c_int
-dll.PSCloseDeviceEx.argtypes = [HANDLE]
-dll.PSCloseDeviceEx.restype = c_int
-dll.PSGetImage.argtypes = [HANDLE, c_int]
-dll.PSGetImage.restype = c_int
-dll.PSUpImage.argtypes = [HANDLE, c_int, ctypes.POINTER(c_ubyte), ctypes.POINTER(c_int)]
-dll.PSUpImage.restype = c_int
-dll.PSImgData2BMP.argtypes = [ctypes.POINTER(c_ubyte), c_char_p]
-dll.PSImgData2BMP.restype = c_int
-dll.PSErr2Str.argtypes = [c_int]
-dll.PSErr2Str.restype = ctypes.c_char_p
-
-def err_text(code: int) -> str:
-    s = dll.PSErr2Str(code)
-    return s.decode(errors="ignore") if s else f"Error 0x{code:02X}"
+buffer_pool = BufferPool(size=IMAGE_BYTES)
 
 # ===== Status Management =====
 def update_status(status: str, message: str = "", error: str = None):
@@ -82,54 +47,25 @@ def log_error(error_msg: str):
         pass  # Silently fail if can't log
 
 # ===== Device Operations =====
-def open_device() -> HANDLE:
+def open_device() -> Device:
     """Open fingerprint device."""
-    h = HANDLE()
-    dtype = c_int(-1)
-    rc = dll.PSAutoOpen(byref(h), byref(dtype), DEFAULT_ADDR, 0, 1)
-    
-    if rc != PS_OK or not h:
-        raise RuntimeError(f"Device open failed: {err_text(rc)}")
-    
-    return h
+    device = create_device()
+    device.open()
+    return device
 
-def close_device(h: HANDLE):
+def close_device(device: Device):
     """Close fingerprint device."""
-    if h:
-        dll.PSCloseDeviceEx(h)
+    if device:
+        device.close()
 
-def capture_fingerprint(h: HANDLE) -> bytes:
-    """Capture fingerprint image."""
-    # Wait for finger with timeout
-    start_time = time.time()
-    while True:
-        rc = dll.PSGetImage(h, DEFAULT_ADDR)
-        if rc == PS_OK:
-            break
-        if rc == PS_NO_FINGER:
-            if time.time() - start_time > CAPTURE_TIMEOUT:
-                raise TimeoutError("No finger detected within timeout")
-            time.sleep(0.2)
-            continue
-        raise RuntimeError(f"Capture failed: {err_text(rc)}")
-    
-    # Upload image data
-    img_buf = (c_ubyte * IMAGE_BYTES)()
-    img_len = c_int(IMAGE_BYTES)
-    rc = dll.PSUpImage(h, DEFAULT_ADDR, img_buf, byref(img_len))
-    
-    if rc != PS_OK:
-        raise RuntimeError(f"Image upload failed: {err_text(rc)}")
-    
-    return bytes(bytearray(img_buf)[:img_len.value])
+def capture_fingerprint(device: Device, buf: CaptureBuffer) -> CaptureBuffer:
+    """Capture fingerprint image into buf."""
+    return device.capture(buf, CAPTURE_TIMEOUT)
 
-def save_fingerprint_image(img_bytes: bytes):
+def save_fingerprint_image(img_bytes):
     """Save fingerprint as BMP file."""
-    buf = (c_ubyte * len(img_bytes)).from_buffer_copy(img_bytes)
-    rc = dll.PSImgData2BMP(buf, IMAGE_FILE.encode("utf-8"))
-    
-    if rc != PS_OK:
-        raise RuntimeError(f"Image save failed: {err_text(rc)}")
+    with open(IMAGE_FILE, 'wb') as f:
+        f.write(encode_bmp(img_bytes, IMAGE_X, IMAGE_Y))
 
 # ===== Main Service Loop =====
 def cleanup_old_files():
@@ -142,7 +78,7 @@ def cleanup_old_files():
             except:
                 pass
 
-def process_capture_request(h: HANDLE):
+def process_capture_request(device: Device):
     """Process a single capture request."""
     try:
         # Remove request flag
@@ -151,11 +87,12 @@ def process_capture_request(h: HANDLE):
         # Update status to capturing
         update_status("capturing", "Place finger on sensor now...")
         
-        # Capture fingerprint
-        img_bytes = capture_fingerprint(h)
-        
-        # Save image
-        save_fingerprint_image(img_bytes)
+        with buffer_pool.acquire() as buf:
+            # Capture fingerprint
+            capture_fingerprint(device, buf)
+            
+            # Save image
+            save_fingerprint_image(buf.view)
         
         # Update status to success
         update_status("success", "Fingerprint captured successfully!")
@@ -182,10 +119,10 @@ def main():
     # Initialize status
     update_status("initializing", "Starting fingerprint device...")
     
-    h = None
+    device = None
     try:
         # Open device
-        h = open_device()
+        device = open_device()
         update_status("ready", "Service ready. Waiting for capture requests...")
         print("Device opened successfully. Service is ready.")
         print("Monitoring for capture requests... (Press Ctrl+C to stop)")
@@ -196,7 +133,7 @@ def main():
                 # Check for capture request
                 if os.path.exists(REQUEST_FLAG):
                     print("Capture request detected. Processing...")
-                    process_capture_request(h)
+                    process_capture_request(device)
                     print("Capture request completed.")
                 
                 # Small delay to avoid busy waiting
@@ -217,8 +154,8 @@ def main():
         log_error(error_msg)
     
     finally:
-        if h:
-            close_device(h)
+        if device:
+            close_device(device)
         update_status("stopped", "Service stopped")
         print("Service stopped.")
 
@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+
+from device import Device, PS_OK, PS_NO_FINGER
+
+# ===== Configuration =====
+HEALTH_INTERVAL = float(os.environ.get("FINGERPRINT_HEALTH_INTERVAL", "5"))        # Idle probe period
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = float(os.environ.get("FINGERPRINT_RECONNECT_MAX_DELAY", "10"))
+
+# Device states reported in status updates
+CONNECTING = "connecting"      # Opening for the first time
+READY = "ready"
+RECONNECTING = "reconnecting"  # Failed; being closed and reopened with backoff
+STOPPED = "stopped"
+
+class DeviceSupervisor:
+    """Keeps one sensor usable, reopening it when it stops answering.
+
+    The capture worker calls connect() whenever the device is not ready;
+    it retries open() with exponential backoff (bounded by
+    RECONNECT_MAX_DELAY) until it succeeds or the worker stops. Failures seen
+    during captures go through verify(), which probes the existing handle
+    first so a one-off transfer error does not cost a reopen. While idle,
+    probe_if_due() pings the sensor every HEALTH_INTERVAL seconds so an
+    unplugged sensor is noticed before the next capture request.
+
+    on_change(supervisor) is called after every state change.
+    """
+
+    def __init__(self, device: Device, on_change=None, health_interval: float = HEALTH_INTERVAL,
+                 min_delay: float = RECONNECT_MIN_DELAY, max_delay: float = RECONNECT_MAX_DELAY):
+        self.device = device
+        self.on_change = on_change
+        self.health_interval = health_interval
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.state = CONNECTING
+        self.error = None
+        self.since = time.time()
+        self.reconnects = 0
+        self.open_seconds = None  # Duration of the last successful open
+        self._is_open = False
+        self._last_ok = time.monotonic()
+
+    @property
+    def label(self) -> str:
+        return self.device.label
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def snapshot(self) -> dict:
+        return {"state": self.state, "backend": self.device.name, "error": self.error,
+                "since": self.since, "reconnects": self.reconnects}
+
+    def _set_state(self, state: str, error: str = None):
+        changed = state != self.state or error != self.error
+        self.state = state
+        self.error = error
+        if changed:
+            self.since = time.time()
+            if self.on_change is not None:
+                self.on_change(self)
+
+    def _close(self):
+        if self._is_open:
+            self._is_open = False
+            try:
+                self.device.close()
+            except Exception:
+                pass  # The handle is already unusable
+
+    def connect(self, stop: threading.Event) -> bool:
+        """Open the device, retrying with backoff; False if stop was set first."""
+        delay = self.min_delay
+        while not stop.is_set():
+            self._close()
+            started = time.perf_counter()
+            try:
+                self.device.open()
+            except Exception as e:
+                self._set_state(CONNECTING if self.state == CONNECTING else RECONNECTING,
+                                f"Open failed: {e}")
+                stop.wait(delay)
+                delay = min(delay * 2, self.max_delay)
+                continue
+            self.open_seconds = time.perf_counter() - started
+            self._is_open = True
+            if self.state != CONNECTING:
+                self.reconnects += 1
+            self._last_ok = time.monotonic()
+            self._set_state(READY)
+            return True
+        return False
+
+    def report_ok(self):
+        """Record that the device just answered normally."""
+        self._last_ok = time.monotonic()
+
+    def probe(self) -> bool:
+        """Ping the sensor with PSGetImage; a failure marks it for reconnecting."""
+        try:
+            rc = self.device.get_image()
+        except Exception as e:
+            self.fail(f"Health probe failed: {e}")
+            return False
+        if rc in (PS_OK, PS_NO_FINGER):
+            self.report_ok()
+            return True
+        self.fail(f"Health probe failed: {self.device.err_text(rc)}")
+        return False
+
+    def probe_if_due(self):
+        if self.ready and time.monotonic() - self._last_ok >= self.health_interval:
+            self.probe()
+
+    def verify(self, error: str) -> bool:
+        """After a device error, keep the handle if it still answers, else mark it failed."""
+        if self.ready and self.probe():
+            return True
+        if self.ready:
+            self.fail(error)
+        return False
+
+    def fail(self, error: str):
+        self._set_state(RECONNECTING, error)
+
+    def stop(self):
+        """Close the device for shutdown; not reported through on_change."""
+        self._close()
+        self.state = STOPPED
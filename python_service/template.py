@@ -0,0 +1,257 @@
+import math
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; without it no templates are produced
+    np = None
+
+from quality import block_sums, FOREGROUND_STD
+
+# ===== Configuration =====
+AVAILABLE = np is not None
+IMAGE_X, IMAGE_Y = 256, 288
+BLOCK_SIZE = 16
+
+RIDGE_PERIOD = 9.0       # Pixels between ridges on the sensor (~500 dpi)
+GABOR_SIGMA = 4.0
+GABOR_SIZE = 17          # Kernel width/height, odd
+GABOR_ANGLES = 16        # Orientation bins for the filter bank
+MAX_THINNING_PASSES = 50
+MIN_DISTANCE = 6         # Minutiae closer than this are spurs/bridges
+MAX_MINUTIAE = 128
+BORDER_BLOCKS = 3        # Minutiae this many blocks inside the print count as fully reliable
+
+# Template format, little-endian:
+#   header  magic "FPT", version u8, width u16, height u16, quality u8, flags u8, count u16
+#   minutia x u16, y u16, angle u8 (1/256ths of a turn), type u8
+TEMPLATE_MAGIC = b"FPT"
+TEMPLATE_VERSION = 1
+TEMPLATE_MIME = "application/octet-stream"
+HEADER = struct.Struct('<3sBHHBBH')
+MINUTIA = struct.Struct('<HHBB')
+ENDING, BIFURCATION = 1, 2
+
+# ===== Enhancement =====
+def _block_mask(img, block: int):
+    """Per-block foreground mask from the gray-level std, as quality.py uses."""
+    n = block * block
+    mean = block_sums(img, block) / n
+    var = np.maximum(block_sums(img * img, block) / n - mean * mean, 0)
+    return np.sqrt(var) > FOREGROUND_STD
+
+def _orientation_field(img, block: int):
+    """Per-block ridge normal angle in [0, pi), smoothed over neighbouring blocks.
+
+    Also returns each block's coherence in [0, 1]: how consistently the
+    gradients agree on that angle, high on clean parallel ridges.
+    """
+    gy, gx = np.gradient(img)
+    gxx = block_sums(gx * gx, block)
+    gyy = block_sums(gy * gy, block)
+    gxy = block_sums(gx * gy, block)
+    # Average the doubled-angle vectors over 3x3 blocks so noise cancels out
+    c = np.pad(gxx - gyy, 1, mode='edge')
+    s = np.pad(2 * gxy, 1, mode='edge')
+    h, w = gxx.shape
+    c = sum(c[i:i + h, j:j + w] for i in range(3) for j in range(3))
+    s = sum(s[i:i + h, j:j + w] for i in range(3) for j in range(3))
+    energy = np.pad(gxx + gyy, 1, mode='edge')
+    energy = sum(energy[i:i + h, j:j + w] for i in range(3) for j in range(3))
+    coherence = np.hypot(c, s) / np.maximum(energy, 1e-6)
+    return (0.5 * np.arctan2(s, c)) % np.pi, coherence
+
+def _gabor_kernel(normal: float):
+    """Even-symmetric Gabor kernel whose wave runs along the ridge normal."""
+    half = GABOR_SIZE // 2
+    y, x = np.mgrid[-half:half + 1, -half:half + 1].astype(np.float32)
+    u = x * math.cos(normal) + y * math.sin(normal)
+    kernel = np.exp(-(x * x + y * y) / (2 * GABOR_SIGMA ** 2)) * np.cos(2 * np.pi * u / RIDGE_PERIOD)
+    return kernel - kernel.mean()  # Zero DC so flat areas give no response
+
+def enhance(img, normals, mask, block: int):
+    """Gabor-filter img with each block's orientation; returns the ridge map."""
+    h, w = img.shape
+    k = GABOR_SIZE
+    shape = (h + k - 1, w + k - 1)
+    spectrum = np.fft.rfft2(img, shape)
+    bins = np.round(normals / np.pi * GABOR_ANGLES).astype(int) % GABOR_ANGLES
+    bins_px = np.repeat(np.repeat(bins, block, axis=0), block, axis=1)
+    mask_px = np.repeat(np.repeat(mask, block, axis=0), block, axis=1)
+
+    filtered = np.zeros_like(img)
+    for b in np.unique(bins[mask]):
+        kernel = _gabor_kernel(b * np.pi / GABOR_ANGLES)
+        full = np.fft.irfft2(spectrum * np.fft.rfft2(kernel, shape), shape)
+        response = full[k // 2:k // 2 + h, k // 2:k // 2 + w]
+        selected = (bins_px == b) & mask_px
+        filtered[selected] = response[selected]
+    # Ridges are dark, so they give a negative response
+    return (filtered < 0) & mask_px
+
+# ===== Thinning =====
+def _neighbours(img):
+    """The 8 neighbours P2..P9 of every pixel, clockwise from north."""
+    p = np.pad(img, 1)
+    h, w = img.shape
+    offsets = ((0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0), (0, 0))
+    return [p[i:i + h, j:j + w] for i, j in offsets]
+
+def thin(ridges):
+    """Zhang-Suen thinning of a boolean ridge map to 1-pixel-wide skeleton."""
+    skel = ridges.astype(np.uint8)
+    for _ in range(MAX_THINNING_PASSES):
+        changed = False
+        for step in (0, 1):
+            n = _neighbours(skel)
+            p2, p3, p4, p5, p6, p7, p8, p9 = n
+            count = sum(n)
+            transitions = sum(((a == 0) & (b == 1)).astype(np.uint8)
+                              for a, b in zip(n, n[1:] + n[:1]))
+            if step == 0:
+                cond = (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+            else:
+                cond = (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+            remove = (skel == 1) & (count >= 2) & (count <= 6) & (transitions == 1) & cond
+            if remove.any():
+                skel[remove] = 0
+                changed = True
+        if not changed:
+            break
+    return skel.astype(bool)
+
+# ===== Minutiae =====
+def _erode_blocks(mask):
+    """Drop blocks touching the background so border ridge ends are ignored."""
+    p = np.pad(mask, 1)
+    h, w = mask.shape
+    return np.logical_and.reduce([p[i:i + h, j:j + w] for i in range(3) for j in range(3)])
+
+def _border_depth(mask, limit: int):
+    """Per-block distance in blocks from the background (1 at the edge), up to limit."""
+    depth = np.zeros(mask.shape, dtype=np.int32)
+    for _ in range(limit):
+        depth += mask
+        mask = _erode_blocks(mask)
+    return depth
+
+def _ending_angle(skel, x: int, y: int, ridge: float) -> float:
+    """Resolve an ending's direction: pointing away from the ridge it ends."""
+    ys, xs = np.nonzero(skel[max(y - 4, 0):y + 5, max(x - 4, 0):x + 5])
+    dx = x - (xs.mean() + max(x - 4, 0))
+    dy = y - (ys.mean() + max(y - 4, 0))
+    if dx * math.cos(ridge) + dy * math.sin(ridge) < 0:
+        ridge += math.pi
+    return ridge % (2 * math.pi)
+
+def extract_minutiae(pixels, width: int = IMAGE_X, height: int = IMAGE_Y,
+                     block: int = BLOCK_SIZE) -> list:
+    """Find ridge endings and bifurcations in a top-down grayscale capture.
+
+    Returns (x, y, angle, type) tuples, most reliable first; angle is in
+    radians and type is ENDING or BIFURCATION. Reliability is the ridge
+    coherence around a minutia scaled by its depth inside the print, so
+    when there are more than MAX_MINUTIAE the ones dropped are those in
+    noisy areas or near the edge.
+    """
+    if np is None:
+        raise RuntimeError("Template extraction requires NumPy")
+    img = np.frombuffer(memoryview(pixels).cast('B'), dtype=np.uint8, count=width * height)
+    h, w = height - height % block, width - width % block
+    img = img.reshape(height, width)[:h, :w].astype(np.float32)
+
+    mask = _block_mask(img, block)
+    if not mask.any():
+        return []
+    img = (img - img.mean()) / max(float(img.std()), 1.0)
+    normals, coherence = _orientation_field(img, block)
+    skel = thin(enhance(img, normals, mask, block))
+
+    # Crossing number: 1 at ridge endings, 3 at bifurcations
+    n = [a.astype(np.int8) for a in _neighbours(skel.astype(np.uint8))]
+    crossings = sum(np.abs(a - b) for a, b in zip(n, n[1:] + n[:1])) // 2
+    inner = np.repeat(np.repeat(_erode_blocks(mask), block, axis=0), block, axis=1)
+    kinds = np.where(skel & inner & (crossings == 1), ENDING,
+                     np.where(skel & inner & (crossings == 3), BIFURCATION, 0))
+    ys, xs = np.nonzero(kinds)
+    if len(xs) == 0:
+        return []
+
+    # Pairs of close minutiae are artefacts (short spurs, bridges, broken ridges)
+    points = np.stack([xs, ys], axis=1).astype(np.float32)
+    dist = np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+    np.fill_diagonal(dist, np.inf)
+    keep = dist.min(axis=1) >= MIN_DISTANCE
+
+    xs, ys = xs[keep], ys[keep]
+    reliability = (coherence * _border_depth(mask, BORDER_BLOCKS))[ys // block, xs // block]
+    order = np.argsort(-reliability, kind='stable')[:MAX_MINUTIAE]
+
+    minutiae = []
+    for x, y in zip(xs[order], ys[order]):
+        kind = int(kinds[y, x])
+        ridge = float(normals[y // block, x // block]) + math.pi / 2
+        angle = _ending_angle(skel, x, y, ridge) if kind == ENDING else ridge % math.pi
+        minutiae.append((int(x), int(y), angle, kind))
+    return minutiae
+
+# ===== Template Format =====
+def encode_template(minutiae: list, width: int = IMAGE_X, height: int = IMAGE_Y,
+                    quality: float = None) -> bytes:
+    """Pack minutiae into the binary template format."""
+    minutiae = minutiae[:MAX_MINUTIAE]
+    score = 0 if quality is None else max(0, min(100, int(round(quality))))
+    out = bytearray(HEADER.size + MINUTIA.size * len(minutiae))
+    HEADER.pack_into(out, 0, TEMPLATE_MAGIC, TEMPLATE_VERSION, width, height, score, 0, len(minutiae))
+    for i, (x, y, angle, kind) in enumerate(minutiae):
+        turn = int(round(angle / (2 * math.pi) * 256)) % 256
+        MINUTIA.pack_into(out, HEADER.size + i * MINUTIA.size, x, y, turn, kind)
+    return bytes(out)
+
+def decode_template(data) -> dict:
+    """Unpack a binary template into its header fields and minutiae."""
+    data = memoryview(data).cast('B')
+    if len(data) < HEADER.size:
+        raise ValueError("Template too short")
+    magic, version, width, height, quality, _, count = HEADER.unpack_from(data, 0)
+    if magic != TEMPLATE_MAGIC:
+        raise ValueError("Not a fingerprint template")
+    if version != TEMPLATE_VERSION:
+        raise ValueError(f"Unsupported template version: {version}")
+    if len(data) < HEADER.size + count * MINUTIA.size:
+        raise ValueError("Truncated template")
+    minutiae = []
+    for i in range(count):
+        x, y, turn, kind = MINUTIA.unpack_from(data, HEADER.size + i * MINUTIA.size)
+        minutiae.append((x, y, turn / 256 * 2 * math.pi, kind))
+    return {"version": version, "width": width, "height": height,
+            "quality": quality, "minutiae": minutiae}
+
+def extract_template(pixels, width: int = IMAGE_X, height: int = IMAGE_Y,
+                     quality: float = None) -> bytes:
+    """Extract minutiae from a capture and encode them as a template."""
+    return encode_template(extract_minutiae(pixels, width, height), width, height, quality)
+
+# ===== Benchmark =====
+def benchmark(path: str, iterations: int = 20):
+    """Extract a template from a BMP file and time extraction per frame."""
+    from imaging import decode_bmp
+
+    with open(path, 'rb') as f:
+        width, height, pixels = decode_bmp(f.read())
+    start = time.perf_counter()
+    for _ in range(iterations):
+        data = extract_template(pixels, width, height)
+    ms = (time.perf_counter() - start) / iterations * 1000
+    minutiae = decode_template(data)["minutiae"]
+    endings = sum(1 for m in minutiae if m[3] == ENDING)
+    print(f"{path}: {len(minutiae)} minutiae ({endings} endings, "
+          f"{len(minutiae) - endings} bifurcations), {len(data)} bytes  ({ms:.1f} ms/frame)")
+    return data
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise SystemExit("Usage: python template.py <capture.bmp> [iterations]")
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sibling modules are imported flat, as when the services run as scripts
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import jobs
+import transport
+
+@pytest.fixture
+def channel_dir(tmp_path, monkeypatch):
+    """Point the job files, the file channel and the socket at a scratch directory."""
+    for name in ("REQUESTS_DIR", "CANCELS_DIR", "JOBS_DIR", "CAPTURES_DIR", "TEMPLATES_DIR"):
+        path = tmp_path / name.lower()
+        path.mkdir()
+        monkeypatch.setattr(jobs, name, str(path))
+    monkeypatch.setattr(transport, "SOCKET_PATH", str(tmp_path / "service.sock"))
+    monkeypatch.setattr(transport, "STATUS_FILE", str(tmp_path / "status.json"))
+    monkeypatch.setattr(transport, "PREVIEW_FILE", str(tmp_path / "preview.png"))
+    monkeypatch.setattr(transport, "PREVIEW_WANTED_FILE", str(tmp_path / "preview.wanted"))
+    # Default arguments were bound to the real paths at import
+    monkeypatch.setattr(transport.write_status_file, "__defaults__", (str(tmp_path / "status.json"),))
+    monkeypatch.setattr(transport.read_status_file, "__defaults__", (str(tmp_path / "status.json"),))
+    monkeypatch.setattr(transport.consume_request_flag, "__defaults__", (str(tmp_path / "request.flag"),))
+    monkeypatch.setattr(transport, "RECONNECT_DELAY", 0.05)
+    return tmp_path
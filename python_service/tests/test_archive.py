@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from archive import CaptureArchive, FRAME_BYTES, INDEX_RECORD
+from jobs import new_job_id
+
+def frame(value: int) -> bytes:
+    return bytes([value % 256]) * FRAME_BYTES
+
+def test_append_and_read(tmp_path):
+    archive = CaptureArchive(str(tmp_path), segment_frames=4)
+    job_ids = [new_job_id() for _ in range(3)]
+    for n, job_id in enumerate(job_ids):
+        archive.append(job_id, frame(n), device="sensor0", quality=70 + n, timestamp=100.0 + n)
+    assert len(archive) == 3
+    assert archive.read(job_ids[1]) == frame(1)
+    assert archive.read(new_job_id()) is None
+    entry = archive.entry(job_ids[2])
+    assert (entry.device, entry.quality, entry.timestamp) == ("sensor0", 72, 102.0)
+    assert [e.job_id for e in archive.scan(start=101.0, end=103.0)] == job_ids[1:]
+    archive.close()
+
+def test_rejects_wrong_frame_size(tmp_path):
+    archive = CaptureArchive(str(tmp_path))
+    with pytest.raises(ValueError):
+        archive.append(new_job_id(), b"\0" * (FRAME_BYTES - 1))
+    archive.close()
+
+def test_reopen_keeps_frames_across_segments(tmp_path):
+    archive = CaptureArchive(str(tmp_path), segment_frames=2)
+    job_ids = [new_job_id() for _ in range(5)]
+    for n, job_id in enumerate(job_ids):
+        archive.append(job_id, frame(n))
+    archive.close()
+
+    archive = CaptureArchive(str(tmp_path), segment_frames=2)
+    assert [e.job_id for e in archive.scan()] == job_ids
+    assert [e.segment for e in archive.scan()] == [1, 1, 2, 2, 3]
+    archive.append(new_job_id(), frame(5))
+    assert archive.entry(job_ids[4]).segment == archive.scan()[-1].segment == 3
+    assert archive.read(job_ids[3]) == frame(3)
+    archive.close()
+
+def test_torn_index_record_is_dropped(tmp_path):
+    archive = CaptureArchive(str(tmp_path))
+    kept = new_job_id()
+    archive.append(kept, frame(1))
+    archive.close()
+    # A crash while appending the next index record leaves part of it behind
+    with open(os.path.join(str(tmp_path), "index.dat"), 'ab') as f:
+        f.write(b"\x01" * (INDEX_RECORD.size // 2))
+
+    archive = CaptureArchive(str(tmp_path))
+    assert [e.job_id for e in archive.scan()] == [kept]
+    added = new_job_id()
+    archive.append(added, frame(2))
+    archive.close()
+
+    archive = CaptureArchive(str(tmp_path), readonly=True)
+    assert [e.job_id for e in archive.scan()] == [kept, added]
+    assert archive.read(added) == frame(2)
+    archive.close()
+
+def test_reader_sees_frames_appended_later(tmp_path):
+    writer = CaptureArchive(str(tmp_path))
+    reader = CaptureArchive(str(tmp_path), readonly=True)
+    assert len(reader) == 0
+    job_id = new_job_id()
+    writer.append(job_id, frame(7))
+    assert reader.read(job_id) == frame(7)
+    writer.close()
+    reader.close()
+
+def test_retention_drops_old_segments(tmp_path):
+    archive = CaptureArchive(str(tmp_path), segment_frames=2, max_segments=2)
+    job_ids = [new_job_id() for _ in range(7)]
+    for n, job_id in enumerate(job_ids):
+        archive.append(job_id, frame(n))
+    # Segments 3 and 4 are kept; 1 and 2 were deleted on rotation
+    assert [e.job_id for e in archive.scan()] == job_ids[4:]
+    assert archive.read(job_ids[0]) is None
+    assert sorted(n for n in os.listdir(str(tmp_path)) if n.startswith("segment-")) == \
+        ["segment-000003.dat", "segment-000004.dat"]
+    archive.close()
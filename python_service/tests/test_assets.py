@@ -0,0 +1,72 @@
+import gzip
+
+import pytest
+
+import assets
+from assets import AssetTable, accepted_encodings, IMMUTABLE_CACHE, REVALIDATE_CACHE
+from test_bridge import bridge  # noqa: F401  (fixture)
+
+SCRIPT = b"export const scan = () => fetch('/api/trigger-scan');\n" * 40
+
+@pytest.fixture
+def static_dir(tmp_path):
+    root = tmp_path / "dist"
+    (root / "assets").mkdir(parents=True)
+    (root / "node_modules").mkdir()
+    (root / "index.html").write_bytes(b"<!doctype html><div id=app></div>")
+    (root / "assets" / "index-AbC123_x.js").write_bytes(SCRIPT)
+    (root / "assets" / "logo.png").write_bytes(b"\x89PNG" + bytes(600))
+    (root / "assets" / "big.map").write_bytes(b"x" * 4096)
+    (root / "node_modules" / "dep.js").write_bytes(b"skipped")
+    (root / "notes.md").write_bytes(b"not an asset type")
+    return root
+
+@pytest.fixture
+def table(static_dir, monkeypatch):
+    monkeypatch.setattr(assets, "MAX_MEMORY_ASSET", 3072)
+    return AssetTable(str(static_dir))
+
+def test_accepted_encodings_honours_q_values():
+    assert accepted_encodings("gzip, br;q=0") == {"gzip"}
+    assert accepted_encodings("deflate;q=0.5, GZIP;q=bad") == {"deflate"}
+    assert accepted_encodings("*") >= {"br", "gzip"}
+    assert accepted_encodings(None) == set()
+
+def test_table_loads_servable_files_once(table):
+    assert sorted(table.assets) == ["/", "/assets/big.map", "/assets/index-AbC123_x.js",
+                                    "/assets/logo.png", "/index.html"]
+    assert table.get("/") is table.get("/index.html") and len(table) == 4
+    assert table.get("/assets/index-AbC123_x.js").cache_control == IMMUTABLE_CACHE
+    assert table.get("/index.html").cache_control == REVALIDATE_CACHE
+    assert table.get("/index.html").content_type == "text/html; charset=utf-8"
+
+def test_variants_are_precompressed_and_tagged(table):
+    script = table.get("/assets/index-AbC123_x.js")
+    encoding, etag, body = script.select("gzip, deflate")
+    assert encoding == "gzip" and gzip.decompress(body) == SCRIPT
+    assert etag == script.etag[:-1] + '-gzip"'
+    assert script.select("identity") == ("identity", script.etag, SCRIPT)
+    # Small and already-compressed files are only held as-is
+    assert set(table.get("/index.html").variants) == {"identity"}
+    assert set(table.get("/assets/logo.png").variants) == {"identity"}
+
+def test_large_files_stay_on_disk(table):
+    big = table.get("/assets/big.map")
+    assert not big.in_memory and big.size == 4096
+    assert big.select("gzip") == ("identity", big.etag, None)
+    assert table.memory_bytes() < 4096
+
+def test_bridge_serves_compressed_and_revalidated_assets(bridge, table):
+    bridge.httpd.assets = table
+    status, headers, body = bridge.request("GET", "/assets/index-AbC123_x.js", headers={"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert headers["Vary"] == "Accept-Encoding" and headers["Cache-Control"] == IMMUTABLE_CACHE
+    assert gzip.decompress(body) == SCRIPT
+
+    status, headers, _ = bridge.request("GET", "/assets/index-AbC123_x.js",
+                                        headers={"Accept-Encoding": "gzip", "If-None-Match": headers["ETag"]})
+    assert status == 304
+
+    status, headers, body = bridge.request("GET", "/assets/big.map")
+    assert status == 200 and body == b"x" * 4096 and "Content-Encoding" not in headers
+    assert bridge.request("GET", "/assets/missing.js")[0] == 404
@@ -0,0 +1,77 @@
+import os
+import json
+import shutil
+
+import pytest
+
+import batch
+from imaging import encode_bmp, decode_bmp
+from device import SIM_FIXTURES
+from archive import CaptureArchive, IMAGE_X, IMAGE_Y
+from jobs import new_job_id
+
+def frame(value: int) -> bytes:
+    return bytes((value + x // 9) % 256 for x in range(IMAGE_X)) * IMAGE_Y
+
+def results(output) -> list:
+    with open(os.path.join(str(output), batch.RESULTS_FILE)) as f:
+        return [json.loads(line) for line in f]
+
+@pytest.fixture
+def captures(tmp_path):
+    """A BMP tree whose keys would collide if flattened, plus one unreadable file."""
+    with open(os.path.join(SIM_FIXTURES, "sample_capture.bmp"), 'rb') as f:
+        width, height, pixels = decode_bmp(f.read())
+    rows = [bytes(pixels[y * width:(y + 1) * width]) for y in range(height)]
+    root = tmp_path / "captures"
+    (root / "a").mkdir(parents=True)
+    (root / "a" / "b.bmp").write_bytes(encode_bmp(b"".join(rows), width, height))
+    (root / "a_b.bmp").write_bytes(encode_bmp(b"".join(reversed(rows)), width, height))
+    (root / "partial.bmp").write_bytes(b"BM\0\0")  # Still being copied in
+    return root
+
+def test_templates_mirror_capture_paths(captures, tmp_path):
+    output = tmp_path / "out"
+    batch.run_batch("bmp", str(captures), str(output), ("template",), workers=1, chunk_size=2)
+    templates = output / "templates"
+    assert (templates / "a" / "b.fpt").exists() and (templates / "a_b.fpt").exists()
+    assert (templates / "a" / "b.fpt").read_bytes() != (templates / "a_b.fpt").read_bytes()
+
+def test_resume_skips_successes_and_retries_errors(captures, tmp_path):
+    output = tmp_path / "out"
+    summary = batch.run_batch("bmp", str(captures), str(output), batch.STAGES, workers=2, chunk_size=1)
+    assert (summary["processed"], summary["errors"]) == (3, 1)
+    assert batch.read_checkpoint(os.path.join(str(output), batch.RESULTS_FILE)) == \
+        {os.path.join("a", "b.bmp"), "a_b.bmp"}
+
+    # The failed capture is complete now; only it is processed again
+    shutil.copy(captures / "a_b.bmp", captures / "partial.bmp")
+    summary = batch.run_batch("bmp", str(captures), str(output), batch.STAGES, workers=2, chunk_size=1)
+    assert (summary["processed"], summary["errors"]) == (1, 0)
+    assert [r["key"] for r in results(output)][-1] == "partial.bmp"
+
+    summary = batch.run_batch("bmp", str(captures), str(output), batch.STAGES, workers=2, chunk_size=1)
+    assert summary["processed"] == 0
+
+    summary = batch.run_batch("bmp", str(captures), str(output), batch.STAGES, workers=2, chunk_size=1,
+                              restart=True)
+    assert (summary["processed"], summary["errors"]) == (3, 0)
+    assert len(results(output)) == 3
+
+def test_checkpoint_ignores_torn_line(tmp_path):
+    path = tmp_path / batch.RESULTS_FILE
+    path.write_text('{"key": "a.bmp", "ms": 1}\n{"key": "b.bmp", "error": "locked"}\n{"key": "c.b')
+    assert batch.read_checkpoint(str(path)) == {"a.bmp"}
+
+def test_archive_source(tmp_path):
+    archive = CaptureArchive(str(tmp_path / "archive"))
+    job_ids = [new_job_id() for _ in range(3)]
+    for n, job_id in enumerate(job_ids):
+        archive.append(job_id, frame(n * 30))
+    archive.close()
+    output = tmp_path / "out"
+    summary = batch.run_batch("archive", str(tmp_path / "archive"), str(output), batch.STAGES,
+                              workers=1, chunk_size=2)
+    assert (summary["processed"], summary["errors"]) == (3, 0)
+    assert sorted(r["key"] for r in results(output)) == sorted(job_ids)
+    assert sorted(os.listdir(output / "templates")) == sorted(f"{job_id}.fpt" for job_id in job_ids)
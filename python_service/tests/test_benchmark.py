@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import benchmark
+from benchmark import BridgeClient, percentile, summarize, run_status_benchmark, compare_results
+from test_bridge import bridge  # noqa: F401  (fixture)
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) == 0.0
+
+def test_summarize_sorts_and_rounds():
+    assert summarize([]) == {"count": 0}
+    stats = summarize([3.0, 1.0, 2.0004])
+    assert stats == {"count": 3, "mean": 2.0, "p50": 2.0, "p95": 3.0, "p99": 3.0, "max": 3.0}
+
+def test_client_reuses_its_connection(bridge):
+    client = BridgeClient(f"http://127.0.0.1:{bridge.port}")
+    try:
+        status, data = client.request("GET", "/api/status")
+        conn = client.conn
+        assert status == 200 and "status" in json.loads(data)
+        assert client.request("GET", "/api/status")[0] == 200
+        assert client.conn is conn
+    finally:
+        client.close()
+
+def test_status_benchmark_counts_requests(bridge):
+    result = run_status_benchmark(f"http://127.0.0.1:{bridge.port}", clients=2, duration=0.3)
+    assert result["clients"] == 2 and not result["errors"]
+    assert result["requests"] == result["latency"]["count"] > 0
+    assert result["requests_per_sec"] > 0
+
+def test_compare_prints_percentile_deltas(capsys):
+    baseline = {"meta": {"timestamp": "then"},
+                "capture": {"stages": {"detect_ms": {"count": 2, "p50": 100.0, "p95": 200.0, "p99": 200.0}}},
+                "status_throughput": {"requests_per_sec": 1000.0}}
+    current = {"capture": {"stages": {"detect_ms": {"count": 2, "p50": 50.0, "p95": 200.0, "p99": 300.0},
+                                      "upload_ms": {"count": 1, "p50": 1.0, "p95": 1.0, "p99": 1.0}}},
+               "status_throughput": {"requests_per_sec": 1500.0}}
+    compare_results(baseline, current)
+    out = capsys.readouterr().out
+    assert "p50 100.00->50.00 (-50.0%)" in out and "p99 200.00->300.00 (+50.0%)" in out
+    assert "upload_ms" not in out
+    assert "1000.0 -> 1500.0 (+50.0%)" in out
+
+def test_args_default_to_simulated_run_settings():
+    args = benchmark.parse_args(["--spawn", "--kiosks", "2"])
+    assert args.spawn and args.kiosks == 2 and args.detect_policy == "adaptive"
+    with pytest.raises(SystemExit):
+        benchmark.parse_args(["--format", "webp"])
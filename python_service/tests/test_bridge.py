@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import time
+import secrets
+import threading
+import subprocess
+import http.client
+
+import pytest
+
+import jobs
+import transport
+import bridge_server
+from conftest import SERVICE_DIR
+from imaging import encode_bmp
+from jobs import JobHistory, JOB_HISTORY, new_job_id, capture_file, template_file
+from transport import FileBridgeTransport
+from bridge_server import (BridgeHTTPServer, FingerprintBridgeHandler, StatusBroadcaster, FileCache,
+                           FILE_CACHE_ENTRIES, MAX_BODY_BYTES)
+
+class Bridge:
+    """A bridge server on a free local port, over the file channel."""
+
+    def __init__(self, transport, max_connections: int = bridge_server.MAX_CONNECTIONS):
+        self.httpd = BridgeHTTPServer(('127.0.0.1', 0), FingerprintBridgeHandler, max_connections)
+        self.httpd.transport = transport
+        self.httpd.broadcaster = StatusBroadcaster(transport)
+        self.httpd.file_cache = FileCache()
+        self.httpd.gallery = None
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def request(self, method: str, path: str, body: bytes = None, headers: dict = None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=5)
+        try:
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            conn.close()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def bridge(channel_dir, monkeypatch):
+    monkeypatch.setattr(FingerprintBridgeHandler, "log_message", lambda self, *args: None)
+    bridge = Bridge(FileBridgeTransport(max_pending=2))
+    yield bridge
+    bridge.close()
+
+def test_file_cache_stays_bounded_as_jobs_are_pruned(channel_dir):
+    cache = FileCache()
+    history = JobHistory(remove_files=True)
+    for n in range(JOB_HISTORY + 50):
+        job_id = new_job_id()
+        with open(capture_file(job_id), 'wb') as f:
+            f.write(b"BM" + bytes([n % 256]) * 64)
+        with open(template_file(job_id), 'wb') as f:
+            f.write(b"FPT" + bytes([n % 256]) * 8)
+        history.put({"job_id": job_id, "status": "success"})
+        assert cache.get(capture_file(job_id))[1][2] == n % 256
+        assert cache.get_variant(capture_file(job_id), "png", lambda data: data[::-1]) is not None
+        assert cache.get(template_file(job_id)) is not None
+        assert len(cache) <= FILE_CACHE_ENTRIES
+    assert len(os.listdir(jobs.CAPTURES_DIR)) == JOB_HISTORY
+
+def test_file_cache_drops_deleted_files(tmp_path):
+    cache = FileCache(max_entries=4)
+    path = tmp_path / "capture.bmp"
+    path.write_bytes(b"first")
+    etag, content = cache.get(str(path))
+    assert content == b"first" and len(cache) == 1
+    path.unlink()
+    assert cache.get(str(path)) is None
+    assert cache.get_variant(str(path), "png", bytes) is None
+    assert len(cache) == 0
+
+def test_file_cache_revalidates_rewritten_files(tmp_path):
+    cache = FileCache()
+    path = tmp_path / "capture.bmp"
+    path.write_bytes(b"first")
+    etag, _ = cache.get(str(path))
+    assert cache.get_variant(str(path), "rev", lambda data: data[::-1]) == (f'{etag[:-1]}-rev"', b"tsrif")
+    path.write_bytes(b"second!")
+    new_etag, content = cache.get(str(path))
+    assert (new_etag != etag, content) == (True, b"second!")
+    assert cache.get_variant(str(path), "rev", lambda data: data[::-1])[1] == b"!dnoces"
+
+def test_file_cache_evicts_least_recently_used(tmp_path):
+    cache = FileCache(max_entries=2)
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    cache.get(paths[0])
+    cache.get(paths[1])
+    cache.get(paths[0])  # a is now more recent than b
+    cache.get(paths[2])
+    assert list(cache._entries) == [paths[0], paths[2]]
+
+def test_trigger_queues_a_request(bridge):
+    status, _, body = bridge.request('POST', '/api/trigger-scan', b'{"burst": 2}',
+                                     {'Content-Type': 'application/json'})
+    assert status == 200
+    job_id = json.loads(body)["job_id"]
+    assert jobs.pending_request_ids() == [job_id]
+
+def test_malformed_content_length_is_refused(bridge):
+    status, headers, _ = bridge.request('POST', '/api/trigger-scan', headers={'Content-Length': 'lots'})
+    assert status == 400
+    assert headers.get('Connection') == 'close'
+    assert jobs.pending_request_ids() == []
+
+def test_oversized_body_is_refused_unread(bridge):
+    conn = http.client.HTTPConnection('127.0.0.1', bridge.port, timeout=5)
+    try:
+        # Only the headers are sent: the reply must not wait for the body
+        conn.putrequest('POST', '/api/trigger-scan')
+        conn.putheader('Content-Length', str(MAX_BODY_BYTES + 1))
+        conn.endheaders()
+        response = conn.getresponse()
+        assert response.status == 413
+    finally:
+        conn.close()
+    assert jobs.pending_request_ids() == []
+
+def test_keep_alive_serves_several_requests_per_connection(bridge):
+    conn = http.client.HTTPConnection('127.0.0.1', bridge.port, timeout=5)
+    try:
+        for _ in range(3):
+            conn.request('GET', '/api/status')
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200
+            assert response.getheader('Keep-Alive').startswith('timeout=')
+        assert bridge.httpd.active_connections == 1
+    finally:
+        conn.close()
+
+def test_connections_over_the_limit_get_503(channel_dir, monkeypatch):
+    monkeypatch.setattr(FingerprintBridgeHandler, "log_message", lambda self, *args: None)
+    bridge = Bridge(FileBridgeTransport(), max_connections=1)
+    idle = http.client.HTTPConnection('127.0.0.1', bridge.port, timeout=5)
+    try:
+        # An idle keep-alive connection holds the only slot
+        idle.request('GET', '/api/status')
+        idle.getresponse().read()
+        status, headers, _ = bridge.request('GET', '/api/status')
+        assert status == 503 and headers['Retry-After'] == '1'
+        idle.close()
+        for _ in range(100):
+            if bridge.httpd.active_connections == 0:
+                break
+            time.sleep(0.02)
+        assert bridge.request('GET', '/api/status')[0] == 200
+    finally:
+        idle.close()
+        bridge.close()
+
+def wait_for_status(bridge, message: str):
+    """Wait for the bridge's status watcher to pick up a status the service wrote."""
+    for _ in range(100):
+        version, status, _ = bridge.httpd.broadcaster.snapshot()
+        if status.get("message") == message:
+            return version
+        bridge.httpd.broadcaster.wait_for(version, 0.05)
+    raise AssertionError(f"Bridge never saw status {message!r}")
+
+def test_status_etag_revalidates_until_status_changes(bridge):
+    transport.write_status_file({"status": "ready", "message": "first", "seq": 1})
+    wait_for_status(bridge, "first")
+    status, headers, body = bridge.request('GET', '/api/status')
+    assert status == 200 and json.loads(body)["message"] == "first"
+    etag = headers['ETag']
+    assert bridge.request('GET', '/api/status', headers={'If-None-Match': etag})[0] == 304
+
+    transport.write_status_file({"status": "ready", "message": "second", "seq": 2})
+    wait_for_status(bridge, "second")
+    status, headers, body = bridge.request('GET', '/api/status', headers={'If-None-Match': etag})
+    assert status == 200 and headers['ETag'] != etag
+
+def test_status_etag_does_not_revalidate_across_restart(channel_dir, monkeypatch):
+    monkeypatch.setattr(FingerprintBridgeHandler, "log_message", lambda self, *args: None)
+    transport.write_status_file({"status": "ready", "message": "before restart", "seq": 1})
+    before = Bridge(FileBridgeTransport())
+    try:
+        version = wait_for_status(before, "before restart")
+        _, headers, _ = before.request('GET', '/api/status')
+        etag = headers['ETag']
+    finally:
+        before.close()
+
+    # The restarted bridge numbers its versions from scratch, so the same
+    # version now stands for a different status
+    monkeypatch.setattr(bridge_server, "BOOT_ID", secrets.token_hex(4))
+    transport.write_status_file({"status": "ready", "message": "after restart", "seq": 1})
+    after = Bridge(FileBridgeTransport())
+    try:
+        assert wait_for_status(after, "after restart") == version
+        status, headers, body = after.request('GET', '/api/status', headers={'If-None-Match': etag})
+        assert status == 200 and headers['ETag'] != etag
+        assert json.loads(body)["message"] == "after restart"
+    finally:
+        after.close()
+
+def test_boot_id_differs_per_process():
+    script = "import bridge_server; print(bridge_server.BOOT_ID)"
+    ids = {subprocess.run([sys.executable, "-c", script], cwd=SERVICE_DIR, capture_output=True,
+                          text=True, check=True).stdout.strip() for _ in range(2)}
+    assert len(ids) == 2 and bridge_server.BOOT_ID not in ids
+
+def test_job_image_etag_revalidates(bridge):
+    job_id = new_job_id()
+    with open(capture_file(job_id), 'wb') as f:
+        f.write(encode_bmp(bytes(range(256)) * 288))
+    status, headers, body = bridge.request('GET', f'/api/image/{job_id}?format=bmp')
+    assert status == 200 and body[:2] == b"BM"
+    etag = headers['ETag']
+    assert bridge.request('GET', f'/api/image/{job_id}?format=bmp', headers={'If-None-Match': etag})[0] == 304
+
+    status, headers, body = bridge.request('GET', f'/api/image/{job_id}?format=png')
+    assert status == 200 and body[:4] == b"\x89PNG" and headers['ETag'] != etag
+    png_etag = headers['ETag']
+    assert bridge.request('GET', f'/api/image/{job_id}?format=png', headers={'If-None-Match': png_etag})[0] == 304
+
+def test_full_queue_answers_429(bridge):
+    for _ in range(2):
+        assert bridge.request('POST', '/api/trigger-scan')[0] == 200
+    status, headers, body = bridge.request('POST', '/api/trigger-scan')
+    assert status == 429 and headers['Retry-After'] == '1'
+    assert json.loads(body)["error"] == "queue_full"
+    assert len(jobs.pending_request_ids()) == 2
+
+def test_job_status_and_unknown_jobs(bridge):
+    status, _, body = bridge.request('POST', '/api/trigger-scan')
+    job_id = json.loads(body)["job_id"]
+    status, _, body = bridge.request('GET', f'/api/status/{job_id}')
+    assert status == 200 and json.loads(body)["status"] == "queued"
+    assert bridge.request('GET', f'/api/status/{new_job_id()}')[0] == 404
+    assert bridge.request('GET', f'/api/image/{new_job_id()}')[0] == 404
+
+def test_cancel_scan(bridge):
+    _, _, body = bridge.request('POST', '/api/trigger-scan')
+    queued = json.loads(body)["job_id"]
+    status, _, body = bridge.request('POST', '/api/cancel-scan', json.dumps({"job_id": queued}).encode())
+    assert status == 200 and json.loads(body)["success"]
+    assert jobs.pending_cancel_ids() == [queued]
+
+    finished = new_job_id()
+    transport.write_job_file({"job_id": finished, "status": "success"})
+    status, _, body = bridge.request('POST', '/api/cancel-scan', json.dumps({"job_id": finished}).encode())
+    assert status == 409 and json.loads(body)["status"] == "success"
+
+    status, _, _ = bridge.request('POST', '/api/cancel-scan', json.dumps({"job_id": new_job_id()}).encode())
+    assert status == 404
+    assert bridge.request('POST', '/api/cancel-scan', b'not json')[0] == 404
+
+def test_long_poll_returns_on_status_change(bridge):
+    transport.write_status_file({"status": "ready", "message": "idle", "seq": 1})
+    version = wait_for_status(bridge, "idle")
+    threading.Timer(0.2, transport.write_status_file, ({"status": "capturing", "message": "go", "seq": 2},)).start()
+    status, _, body = bridge.request('GET', f'/api/status?since={version}&timeout=5')
+    assert status == 200
+    data = json.loads(body)
+    assert data["message"] == "go" and data["version"] > version
+
+    # Nothing newer: the poll ends at its timeout with the current status
+    status, _, body = bridge.request('GET', f'/api/status?since={data["version"]}&timeout=0.1')
+    assert status == 200 and json.loads(body)["version"] == data["version"]
+    assert bridge.request('GET', '/api/status?since=soon')[0] == 400
+
+def test_status_stream_sends_events(bridge):
+    transport.write_status_file({"status": "ready", "message": "idle", "seq": 1})
+    version = wait_for_status(bridge, "idle")
+    conn = http.client.HTTPConnection('127.0.0.1', bridge.port, timeout=5)
+    try:
+        conn.request('GET', '/api/status/stream', headers={'Last-Event-ID': str(version - 1)})
+        response = conn.getresponse()
+        assert response.getheader('Content-Type') == 'text/event-stream'
+        assert response.readline() == f"id: {version}\n".encode()
+        assert json.loads(response.readline()[len("data: "):])["message"] == "idle"
+        assert response.readline() == b"\n"
+
+        transport.write_status_file({"status": "capturing", "message": "go", "seq": 2})
+        assert response.readline() == f"id: {version + 1}\n".encode()
+        assert json.loads(response.readline()[len("data: "):])["message"] == "go"
+    finally:
+        conn.close()
+
+class FailingTransport:
+    """Status source whose first reads and waits raise, as a dropped channel would."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def wait_for_update(self, timeout: float):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError("channel reset")
+        threading.Event().wait(0.01)
+
+    def read_status(self):
+        return {"status": "ready", "failures_left": self.failures}
+
+def test_status_watcher_survives_transport_errors(monkeypatch):
+    monkeypatch.setattr(bridge_server, "WATCH_ERROR_DELAY", 0.01)
+    failing = FailingTransport(failures=3)
+    broadcaster = StatusBroadcaster(failing)
+    version, status, _ = broadcaster.wait_for(1, 5.0)
+    for _ in range(100):
+        version, status, _ = broadcaster.wait_for(version, 0.05)
+        if status["failures_left"] == 0:
+            break
+    assert status == {"status": "ready", "failures_left": 0}
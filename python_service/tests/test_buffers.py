@@ -0,0 +1,36 @@
+import pytest
+
+from buffers import BufferPool, IMAGE_BYTES, IMAGE_X, IMAGE_Y
+
+def test_view_covers_valid_bytes_without_copying():
+    with BufferPool(count=1).acquire() as buf:
+        assert len(buf.view) == 0
+        buf.length = 4
+        view = buf.view
+        buf.raw[0] = 7
+        assert len(view) == 4 and view[0] == 7
+
+def test_array_shares_the_buffer():
+    np = pytest.importorskip("numpy")
+    with BufferPool(count=1).acquire() as buf:
+        buf.length = IMAGE_BYTES
+        image = buf.array()
+        assert image.shape == (IMAGE_Y, IMAGE_X) and image.dtype == np.uint8
+        buf.raw[IMAGE_X + 2] = 9
+        assert image[1, 2] == 9
+
+def test_pool_reuses_most_recent_buffer_and_resets_length():
+    pool = BufferPool(count=2)
+    first = pool.acquire()
+    first.length = IMAGE_BYTES
+    first.release()
+    again = pool.acquire()
+    assert again is first and again.length == 0
+
+def test_exhausted_pool_times_out():
+    pool = BufferPool(count=1)
+    with pool.acquire():
+        with pytest.raises(RuntimeError):
+            pool.acquire(0.05)
+    # Leaving the block handed it back
+    pool.acquire(0).release()
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import burst
+from buffers import BufferPool
+from imaging import encode_bmp, decode_bmp
+from device import SimulatedDevice, SIM_FIXTURES, IMAGE_X, IMAGE_Y
+
+def soften(pixels: bytes) -> bytes:
+    """The same print blurred: each pixel averaged with its right and lower neighbours."""
+    def at(x, y):
+        return pixels[min(y, IMAGE_Y - 1) * IMAGE_X + min(x, IMAGE_X - 1)]
+    return bytes((at(x, y) + at(x + 1, y) + at(x, y + 1) + at(x + 1, y + 1)) // 4
+                 for y in range(IMAGE_Y) for x in range(IMAGE_X))
+
+@pytest.fixture
+def frames(tmp_path):
+    """Fixtures the simulated device replays in order: soft, sharp, soft."""
+    with open(os.path.join(SIM_FIXTURES, "sample_capture.bmp"), 'rb') as f:
+        _, _, pixels = decode_bmp(f.read())
+    sharp, soft = bytes(pixels), soften(pixels)
+    for name, data in (("0_soft", soft), ("1_sharp", sharp), ("2_soft", soft)):
+        (tmp_path / (name + ".bmp")).write_bytes(encode_bmp(data))
+    return tmp_path, sharp, soft
+
+def held_device(fixtures, hold: float = 30.0, upload_latency: float = 0.0) -> SimulatedDevice:
+    device = SimulatedDevice(str(fixtures), finger_delay=0.05, upload_latency=upload_latency,
+                             finger_hold=hold, seed=1)
+    device.open()
+    return device
+
+def test_burst_keeps_sharpest_frame(frames):
+    pytest.importorskip("numpy")
+    fixtures, sharp, _ = frames
+    pool = BufferPool(count=3)
+    with pool.acquire() as buf:
+        timings, seen = {}, []
+        result = burst.capture_burst(held_device(fixtures), buf, pool, 3, 2.0, timings,
+                                     on_frame=lambda frame: seen.append(bytes(frame.view)))
+        assert result["frames"] == 3 and result["best"] == 1
+        assert result["scores"][1] > max(result["scores"][0], result["scores"][2])
+        assert bytes(buf.view) == sharp
+    assert len(seen) == 3 and "burst_ms" in timings
+    # Both spares went back to the pool
+    for _ in range(3):
+        pool.acquire(0)
+
+def test_burst_ends_when_finger_lifts(frames):
+    fixtures, _, _ = frames
+    pool = BufferPool(count=3)
+    with pool.acquire() as buf:
+        result = burst.capture_burst(held_device(fixtures, hold=0.15, upload_latency=0.05),
+                                     buf, pool, burst.MAX_BURST_FRAMES, 2.0)
+    assert 1 <= result["frames"] < burst.MAX_BURST_FRAMES
+
+def test_burst_keeps_last_frame_without_scores(frames, monkeypatch):
+    fixtures, _, soft = frames
+    monkeypatch.setattr(burst, "burst_score", lambda *args: None)
+    pool = BufferPool(count=3)
+    with pool.acquire() as buf:
+        result = burst.capture_burst(held_device(fixtures), buf, pool, 3, 2.0)
+        assert result == {"frames": 3, "best": 2, "scores": [None, None, None]}
+        assert bytes(buf.view) == soft
+
+def test_burst_options_are_validated():
+    assert burst.burst_options({"burst": 3, "publish_all": True}) == (3, True)
+    for request in ({"burst": 0}, {"burst": True}, {"burst": burst.MAX_BURST_FRAMES + 1},
+                    {"publish_all": "yes"}):
+        with pytest.raises(ValueError):
+            burst.burst_options(request)
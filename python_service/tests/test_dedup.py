@@ -0,0 +1,74 @@
+import os
+import random
+
+import pytest
+
+import dedup
+from dedup import HashIndex, DuplicateDetector, RECORD, HASH_BITS, hamming, perceptual_hash
+from jobs import new_job_id
+
+@pytest.mark.parametrize("distance,chunks", [(3, 4), (7, 4), (2, 2)])
+def test_index_matches_brute_force(distance, chunks):
+    rng = random.Random(distance * 10 + chunks)
+    values = [rng.getrandbits(HASH_BITS) for _ in range(2000)]
+    index = HashIndex(distance, chunks)
+    for value in values:
+        index.add(value)
+    for i in range(200):
+        probe = values[rng.randrange(len(values))] if i % 2 == 0 else rng.getrandbits(HASH_BITS)
+        for bit in rng.sample(range(HASH_BITS), rng.randint(0, distance + 1)):
+            probe ^= 1 << bit
+        expected = sorted((hamming(v, probe), p) for p, v in enumerate(values) if hamming(v, probe) <= distance)
+        assert index.search(probe) == expected
+
+def test_search_limit_never_exceeds_index_radius():
+    index = HashIndex(3)
+    index.add(0)
+    index.add(0b111)
+    assert index.search(0, max_distance=2) == [(0, 0)]
+    assert index.search(0, max_distance=10) == [(0, 0), (3, 1)]
+
+def test_detector_persists_records(tmp_path):
+    first, second = new_job_id(), new_job_id()
+    detector = DuplicateDetector(str(tmp_path), max_distance=3)
+    assert detector.check_and_add(0xF0F0, first, timestamp=10.0) is None
+    duplicate = detector.check_and_add(0xF0F1, second, timestamp=11.0)
+    assert duplicate == {"job_id": first, "distance": 1, "timestamp": 10.0}
+    detector.close()
+
+    detector = DuplicateDetector(str(tmp_path), max_distance=3)
+    assert len(detector) == 2
+    assert [m["job_id"] for m in detector.find(0xF0F0)] == [first, second]
+    assert detector.check_and_add(~0xF0F0 & (2 ** HASH_BITS - 1), new_job_id()) is None
+    detector.close()
+
+def test_detector_drops_torn_record(tmp_path):
+    detector = DuplicateDetector(str(tmp_path))
+    kept = new_job_id()
+    detector.check_and_add(42, kept)
+    detector.close()
+    path = os.path.join(str(tmp_path), "hashes.bin")
+    with open(path, 'ab') as f:
+        f.write(b"\xff" * (RECORD.size - 3))
+
+    detector = DuplicateDetector(str(tmp_path))
+    assert len(detector) == 1
+    assert os.path.getsize(path) == RECORD.size
+    added = new_job_id()
+    assert detector.check_and_add(42, added)["job_id"] == kept
+    detector.close()
+    assert len(DuplicateDetector(str(tmp_path))) == 2
+
+@pytest.mark.skipif(not dedup.AVAILABLE, reason="needs NumPy")
+def test_hash_tolerates_noise_but_not_other_frames():
+    np = dedup.np
+    rng = np.random.default_rng(1)
+    width, height = 256, 288
+    y, x = np.mgrid[0:height, 0:width]
+    frame = (128 + 100 * np.sin(x / 4.0 + np.sin(y / 30.0) * 3)).astype(np.uint8)
+    noisy = np.clip(frame + rng.normal(0, 4, frame.shape), 0, 255).astype(np.uint8)
+    other = (128 + 100 * np.sin(y / 5.0 + np.cos(x / 25.0) * 2)).astype(np.uint8)
+
+    value = perceptual_hash(frame.tobytes(), width, height)
+    assert hamming(value, perceptual_hash(noisy.tobytes(), width, height)) <= dedup.DUPLICATE_DISTANCE
+    assert hamming(value, perceptual_hash(other.tobytes(), width, height)) > dedup.DUPLICATE_DISTANCE
@@ -0,0 +1,84 @@
+import threading
+
+import pytest
+
+from buffers import BufferPool
+from imaging import encode_bmp
+from device import (SimulatedDevice, DetectionPolicy, CaptureCancelled, DeviceError, create_device, create_devices,
+                    IMAGE_BYTES, IMAGE_X, PS_OK, PS_NO_FINGER, PS_COMM_ERR)
+
+@pytest.fixture
+def buf():
+    with BufferPool(count=1).acquire() as buf:
+        yield buf
+
+def test_detection_policy_backs_off_after_fast_window():
+    policy = DetectionPolicy(fast_interval=0.02, fast_window=0.5, backoff=2.0, max_interval=0.1)
+    assert policy.next_interval(0.1, 0.0) == 0.02
+    assert policy.next_interval(0.6, 0.02) == 0.04
+    assert policy.next_interval(0.9, 0.08) == 0.1
+
+def test_capture_keeps_counts_out_of_timings(buf):
+    device = SimulatedDevice(finger_delay=0.1, upload_latency=0.0, seed=1)
+    device.open()
+    timings, stats = {}, {}
+    device.capture(buf, 2.0, timings, stats=stats)
+    assert set(timings) == {"detect_ms", "upload_ms"}
+    assert timings["detect_ms"] >= 100
+    assert stats["detect_polls"] > 1
+    assert buf.length == IMAGE_BYTES
+
+    # A second capture of the same job adds to the poll count
+    polls = stats["detect_polls"]
+    device.capture(buf, 2.0, stats=stats)
+    assert stats["detect_polls"] > polls
+
+def test_capture_times_out_without_finger(buf):
+    device = SimulatedDevice(finger_delay=10.0, upload_latency=0.0)
+    device.open()
+    with pytest.raises(TimeoutError):
+        device.capture(buf, 0.2)
+
+def test_capture_is_cancelled_between_polls(buf):
+    device = SimulatedDevice(finger_delay=10.0, upload_latency=0.0)
+    device.open()
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    with pytest.raises(CaptureCancelled):
+        device.capture(buf, 5.0, cancel=cancel)
+
+def test_simulated_finger_is_placed_then_lifted(buf):
+    device = SimulatedDevice(finger_delay=0.1, upload_latency=0.0, seed=1)
+    assert device.get_image() == PS_COMM_ERR  # Not open yet
+    device.open()
+    device.arm()
+    assert device.get_image() == PS_NO_FINGER
+    # Uploads before the finger lands show it partly placed
+    assert device.up_image(buf) == PS_OK
+    assert bytes(buf.view[-IMAGE_X:]) == b"\xff" * IMAGE_X
+    device.capture(buf, 2.0)
+    assert buf.length == IMAGE_BYTES and bytes(buf.view[-IMAGE_X:]) != b"\xff" * IMAGE_X
+    # The upload lifted it; the next capture waits for a new placement
+    assert device.get_image() == PS_NO_FINGER
+
+def test_simulated_comm_errors_fail_the_capture(buf):
+    device = SimulatedDevice(finger_delay=0.0, upload_latency=0.0, comm_error_rate=1.0)
+    device.open()
+    with pytest.raises(DeviceError):
+        device.capture(buf, 1.0)
+
+def test_simulated_fixtures_must_match_the_sensor(tmp_path):
+    (tmp_path / "small.bmp").write_bytes(encode_bmp(bytes(64 * 64), 64, 64))
+    with pytest.raises(ValueError):
+        SimulatedDevice(str(tmp_path))
+    (tmp_path / "empty").mkdir()
+    with pytest.raises(ValueError):
+        SimulatedDevice(str(tmp_path / "empty"))
+
+def test_repeated_devices_get_distinct_labels():
+    devices = create_devices("simulated, simulated")
+    assert [d.label for d in devices] == ["simulated#0", "simulated#1"]
+    assert all(isinstance(d, SimulatedDevice) for d in devices)
+    assert create_devices("simulated")[0].label == "simulated"
+    with pytest.raises(ValueError):
+        create_device("floppy")
@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+import dlltrace
+from dlltrace import TracingDLL, ReplayDLL, read_trace, HEADER, GET_IMAGE, UP_IMAGE, OPEN_AUTO
+from device import SynoDevice, DeviceError, PS_OK, PS_COMM_ERR, PS_NO_FINGER, IMAGE_BYTES
+from buffers import BufferPool
+
+class FakeDLL:
+    """Scripted SynoAPIEx: the finger lands on the third poll of each capture."""
+
+    def __init__(self):
+        self.polls = 0
+        self.frames = 0
+
+    def PSAutoOpen(self, p_handle, p_type, addr, baud, verify):
+        dlltrace._target(p_handle).value = 0x1234
+        return PS_OK
+
+    def PSCloseDeviceEx(self, handle):
+        return PS_OK
+
+    def PSGetImage(self, handle, addr):
+        self.polls += 1
+        return PS_OK if self.polls % 3 == 0 else PS_NO_FINGER
+
+    def PSUpImage(self, handle, addr, data, p_length):
+        self.frames += 1
+        frame = bytes([self.frames * 40 + i % 7 for i in range(256)]) * (IMAGE_BYTES // 256)
+        memoryview(data).cast('B')[:IMAGE_BYTES] = frame
+        dlltrace._target(p_length).value = IMAGE_BYTES
+        return PS_OK
+
+    def PSErr2Str(self, code):
+        return b"No finger on sensor" if code == PS_NO_FINGER else None
+
+def capture_frames(device, count: int) -> list:
+    frames, polls = [], []
+    with BufferPool(count=1).acquire() as buf:
+        for _ in range(count):
+            stats = {}
+            device.capture(buf, 5.0, stats=stats)
+            frames.append(bytes(buf.view))
+            polls.append(stats["detect_polls"])
+    return frames, polls
+
+@pytest.fixture
+def trace(tmp_path):
+    """A trace of two captures from the scripted DLL, with the frames they returned."""
+    path = str(tmp_path / "sensor.trace")
+    dll = TracingDLL(FakeDLL(), path)
+    device = SynoDevice(dll=dll)
+    device.open()
+    frames, polls = capture_frames(device, 2)
+    assert device.err_text(PS_NO_FINGER) == "No finger on sensor"
+    device.close()
+    dll.close()
+    return path, frames, polls
+
+def test_trace_records_every_call(trace):
+    path, frames, _ = trace
+    _, records = read_trace(path)
+    ops = [r.op for r in records]
+    assert ops[0] == OPEN_AUTO
+    assert ops.count(GET_IMAGE) == 6 and ops.count(UP_IMAGE) == 2
+    assert [r.payload for r in records if r.op == UP_IMAGE] == frames
+
+def test_replay_returns_recorded_frames(trace):
+    path, frames, polls = trace
+    dll = ReplayDLL(path, speed=0)
+    device = SynoDevice(dll=dll)
+    device.open()
+    assert capture_frames(device, 2) == (frames, polls)
+    assert device.err_text(PS_NO_FINGER) == "No finger on sensor"
+    # Past the end of the trace the sensor looks unplugged
+    assert device.get_image() == PS_COMM_ERR
+    assert dll.exhausted.is_set()
+    device.close()
+
+def test_replay_without_open_fails_to_open(trace):
+    path, _, _ = trace
+    dll = ReplayDLL(path, speed=0)
+    SynoDevice(dll=dll).open()
+    with pytest.raises(DeviceError):
+        SynoDevice(dll=dll).open()
+
+def test_torn_record_is_dropped(trace):
+    path, _, _ = trace
+    _, records = read_trace(path)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)  # A crash in the middle of the last write
+    _, torn = read_trace(path)
+    assert [(r.op, r.payload) for r in torn] == [(r.op, r.payload) for r in records[:-1]]
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.trace"
+    path.write_bytes(b"BM" + bytes(HEADER.size))
+    with pytest.raises(ValueError):
+        read_trace(str(path))
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import identify
+from identify import Gallery, EMBEDDING_SIZE
+
+pytestmark = pytest.mark.skipif(identify.np is None, reason="needs NumPy")
+
+@pytest.fixture
+def prints():
+    rng = identify.np.random.default_rng(7)
+    return rng, [identify._synthetic_minutiae(rng, int(rng.integers(25, 50))) for _ in range(40)]
+
+def enrol_all(gallery, prints, first: int = 0):
+    for n, minutiae in enumerate(prints, first):
+        gallery.enroll(f"user{n}", identify._encode(minutiae))
+
+def best_match(gallery, minutiae):
+    matches = gallery.identify(identify._encode(minutiae))["matches"]
+    return matches[0]["user_id"] if matches else None
+
+def test_enrol_and_identify(tmp_path, prints):
+    rng, minutiae = prints
+    gallery = Gallery(str(tmp_path), workers=1)
+    enrol_all(gallery, minutiae)
+    assert len(gallery) == len(minutiae)
+    for target in (0, 17, 39):
+        assert best_match(gallery, identify._impression(rng, minutiae[target])) == f"user{target}"
+    result = gallery.identify(identify._encode(minutiae[5]), top=3)
+    assert result["gallery_size"] == len(minutiae)
+    assert len(result["matches"]) <= 3
+    gallery.close()
+
+def test_reload_keeps_enrolments(tmp_path, prints):
+    rng, minutiae = prints
+    gallery = Gallery(str(tmp_path), workers=1)
+    enrol_all(gallery, minutiae)
+    gallery.close()
+
+    gallery = Gallery(str(tmp_path), workers=1)
+    assert len(gallery) == len(minutiae)
+    assert best_match(gallery, identify._impression(rng, minutiae[23])) == "user23"
+    gallery.close()
+
+def test_torn_template_record_is_dropped(tmp_path, prints):
+    rng, minutiae = prints
+    gallery = Gallery(str(tmp_path), workers=1)
+    enrol_all(gallery, minutiae[:10])
+    gallery.close()
+    with open(gallery.records_path, 'ab') as f:
+        f.write(identify.RECORD_HEADER.pack(5, 200) + b"user")
+
+    gallery = Gallery(str(tmp_path), workers=1)
+    assert len(gallery) == 10
+    gallery.enroll("user10", identify._encode(minutiae[10]))
+    gallery.close()
+    gallery = Gallery(str(tmp_path), workers=1)
+    assert gallery.user_ids == [f"user{n}" for n in range(11)]
+    assert best_match(gallery, identify._impression(rng, minutiae[10])) == "user10"
+    gallery.close()
+
+def test_torn_embedding_row_is_dropped(tmp_path, prints):
+    _, minutiae = prints
+    gallery = Gallery(str(tmp_path), workers=1)
+    enrol_all(gallery, minutiae[:10])
+    gallery.close()
+    # A crash after the template record but part way through its embedding
+    with open(gallery.vectors_path, 'ab') as f:
+        f.write(b"\x7f" * (EMBEDDING_SIZE * 2 + 3))
+
+    gallery = Gallery(str(tmp_path), workers=1)
+    assert os.path.getsize(gallery.vectors_path) == 10 * EMBEDDING_SIZE * 4
+    enrol_all(gallery, minutiae[10:], 10)
+    gallery.close()
+
+    gallery = Gallery(str(tmp_path), workers=1)
+    assert os.path.getsize(gallery.vectors_path) == len(minutiae) * EMBEDDING_SIZE * 4
+    for n, m in enumerate(minutiae):
+        expected = identify.embed(identify.minutiae_array(identify._encode(m)))
+        assert identify.np.allclose(gallery._vectors[n], expected)
+    assert best_match(gallery, minutiae[35]) == "user35"
+    gallery.close()
@@ -0,0 +1,96 @@
+import zlib
+import struct
+
+import pytest
+
+import imaging
+from imaging import (encode_bmp, decode_bmp, encode_png, encode_image, transcode_bmp, negotiate_format,
+                     PNG_SIGNATURE, GRAY_PALETTE)
+
+def gradient(width: int, height: int) -> bytes:
+    return bytes((x * 3 + y * 7 + (x * y) % 11) % 256 for y in range(height) for x in range(width))
+
+def decode_png(data: bytes) -> tuple:
+    """Minimal decoder for the 8-bit grayscale PNGs encode_png writes."""
+    assert data[:8] == PNG_SIGNATURE
+    pos, idat = 8, b""
+    while pos < len(data):
+        length, kind = struct.unpack_from('>I4s', data, pos)
+        payload = data[pos + 8:pos + 8 + length]
+        assert struct.unpack_from('>I', data, pos + 8 + length)[0] == zlib.crc32(kind + payload)
+        if kind == b'IHDR':
+            width, height, depth, color = struct.unpack_from('>IIBB', payload)
+            assert (depth, color) == (8, 0)
+        elif kind == b'IDAT':
+            idat += payload
+        pos += 12 + length
+    raw = zlib.decompress(idat)
+    rows, prev = [], bytes(width)
+    for y in range(height):
+        kind, line = raw[y * (width + 1)], bytearray(raw[y * (width + 1) + 1:(y + 1) * (width + 1)])
+        for x in range(width):
+            a = line[x - 1] if x else 0
+            b, c = prev[x], prev[x - 1] if x else 0
+            if kind == 4:
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                line[x] = (line[x] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+            else:
+                assert kind == 0
+        rows.append(bytes(line))
+        prev = line
+    return width, height, b"".join(rows)
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy" and imaging.np is None:
+        pytest.skip("needs NumPy")
+    if request.param == "python":
+        monkeypatch.setattr(imaging, "np", None)
+    return request.param
+
+@pytest.mark.parametrize("width,height", [(256, 288), (13, 5)])
+def test_bmp_round_trip(backend, width, height):
+    pixels = gradient(width, height)
+    data = encode_bmp(pixels, width, height)
+    assert len(data) == imaging.BMP_HEADER_SIZE + len(GRAY_PALETTE) + ((width + 3) & ~3) * height
+    assert decode_bmp(data) == (width, height, pixels)
+
+@pytest.mark.parametrize("width,height", [(256, 288), (13, 5)])
+def test_png_round_trip(backend, width, height):
+    pixels = gradient(width, height)
+    assert decode_png(encode_png(pixels, width, height)) == (width, height, pixels)
+
+def test_transcode_bmp_to_png():
+    pixels = gradient(32, 16)
+    bmp = encode_bmp(pixels, 32, 16)
+    assert transcode_bmp(bmp, "bmp") == bytes(bmp)
+    assert decode_png(transcode_bmp(bmp, "png")) == (32, 16, pixels)
+
+def test_decode_maps_other_palettes():
+    data = encode_bmp(bytes([0, 1, 2, 3]), 4, 1)
+    inverted = b"".join(bytes((255 - i, 255 - i, 255 - i, 0)) for i in range(256))
+    data[imaging.BMP_HEADER_SIZE:imaging.BMP_HEADER_SIZE + 1024] = inverted
+    assert decode_bmp(data)[2] == bytes([255, 254, 253, 252])
+
+def test_rejects_bad_input():
+    with pytest.raises(ValueError):
+        decode_bmp(b"PK\x03\x04" + bytes(60))
+    with pytest.raises(ValueError):
+        encode_bmp(bytes(10), 4, 4)
+    with pytest.raises(ValueError):
+        encode_image(bytes(16), "gif", 4, 4)
+
+@pytest.mark.parametrize("requested,accept,expected", [
+    ("PNG", None, "png"),
+    (None, "image/png", "png"),
+    (None, "image/png;q=0.4, image/bmp;q=0.9", "bmp"),
+    (None, "text/html, */*", "bmp"),
+    (None, None, "bmp"),
+])
+def test_negotiate_format(requested, accept, expected):
+    assert negotiate_format(requested, accept) == expected
+
+def test_negotiate_rejects_unknown_format():
+    with pytest.raises(ValueError):
+        negotiate_format("gif")
@@ -0,0 +1,59 @@
+import os
+
+from jobs import (JobHistory, new_job_id, is_valid_job_id, job_file, capture_file, template_file,
+                  request_file, pending_request_ids)
+
+def make_job(job_id: str):
+    for path in (job_file(job_id), capture_file(job_id), template_file(job_id)):
+        with open(path, 'wb') as f:
+            f.write(b"x")
+
+def test_job_ids_are_valid_and_sort_by_submission():
+    job_ids = [new_job_id() for _ in range(50)]
+    assert all(is_valid_job_id(job_id) for job_id in job_ids)
+    assert sorted(job_ids) == job_ids
+    assert not is_valid_job_id("../" + job_ids[0][3:])
+    assert not is_valid_job_id(None)
+
+def test_eviction_removes_job_files(channel_dir):
+    history = JobHistory(limit=3, remove_files=True)
+    job_ids = [new_job_id() for _ in range(5)]
+    for job_id in job_ids:
+        make_job(job_id)
+        history.put({"job_id": job_id, "status": "success"})
+    for job_id in job_ids[:2]:
+        assert history.get(job_id) is None
+        assert not any(os.path.exists(p) for p in (job_file(job_id), capture_file(job_id), template_file(job_id)))
+    for job_id in job_ids[2:]:
+        assert history.get(job_id)["status"] == "success"
+        assert all(os.path.exists(p) for p in (job_file(job_id), capture_file(job_id), template_file(job_id)))
+
+def test_updating_a_job_keeps_it_recent(channel_dir):
+    history = JobHistory(limit=2, remove_files=True)
+    first, second, third = new_job_id(), new_job_id(), new_job_id()
+    for job_id in (first, second):
+        make_job(job_id)
+        history.put({"job_id": job_id, "status": "queued"})
+    history.put({"job_id": first, "status": "success"})
+    make_job(third)
+    history.put({"job_id": third, "status": "queued"})
+    assert history.get(second) is None and not os.path.exists(capture_file(second))
+    assert history.get(first)["status"] == "success" and os.path.exists(capture_file(first))
+
+def test_eviction_keeps_files_unless_asked(channel_dir):
+    history = JobHistory(limit=1)
+    job_ids = [new_job_id() for _ in range(3)]
+    for job_id in job_ids:
+        make_job(job_id)
+        history.put({"job_id": job_id, "status": "success"})
+    assert history.get(job_ids[0]) is None
+    assert all(os.path.exists(capture_file(job_id)) for job_id in job_ids)
+
+def test_pending_requests_oldest_first(channel_dir):
+    job_ids = [new_job_id() for _ in range(3)]
+    for job_id in reversed(job_ids):
+        with open(request_file(job_id), 'w') as f:
+            f.write("{}")
+    with open(request_file("not-a-job"), 'w') as f:
+        f.write("{}")
+    assert pending_request_ids() == job_ids
@@ -0,0 +1,45 @@
+import json
+
+import logger
+from logger import BackgroundLogger
+
+def read_records(path) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_records_are_written_as_json_lines(tmp_path):
+    path = tmp_path / "error.log"
+    log = BackgroundLogger(str(path), flush_interval=0.05)
+    log.error("Capture timeout", job_id="abc", device="usb")
+    log.info("Device ready")
+    log.close()
+    records = read_records(path)
+    assert [(r["level"], r["msg"]) for r in records] == [("error", "Capture timeout"), ("info", "Device ready")]
+    assert records[0]["job_id"] == "abc" and records[0]["device"] == "usb"
+
+def test_log_rotates_past_max_bytes(tmp_path):
+    path = tmp_path / "error.log"
+    log = BackgroundLogger(str(path), max_bytes=200, backups=2, flush_interval=0.05)
+    for n in range(3):
+        log.error("x" * 150, n=n)
+        log.close()
+        log = BackgroundLogger(str(path), max_bytes=200, backups=2, flush_interval=0.05)
+    log.close()
+    assert not path.exists()
+    assert read_records(f"{path}.1")[0]["n"] == 2
+    assert read_records(f"{path}.2")[0]["n"] == 1
+    assert not (tmp_path / "error.log.3").exists()
+
+def test_full_queue_drops_and_reports(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "LOG_QUEUE_SIZE", 2)
+    path = tmp_path / "error.log"
+    log = BackgroundLogger(str(path))
+    log.close()
+    # With the writer stopped nothing drains the queue; callers never block on it
+    for n in range(5):
+        log.error("burst", n=n)
+    assert log.dropped == 3
+    log._write([log._queue.get_nowait(), log._queue.get_nowait()])
+    records = read_records(path)
+    assert [r.get("n") for r in records] == [0, 1, None]
+    assert records[-1]["msg"] == "3 log records dropped" and log.dropped == 0
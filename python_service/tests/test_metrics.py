@@ -0,0 +1,70 @@
+import pytest
+
+import bridge_server
+from metrics import Registry, Counter, Gauge, Histogram, FileExporter, CONTENT_TYPE
+from bridge_server import route_label
+from test_bridge import bridge  # noqa: F401  (fixture)
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+def test_counter_and_gauge_render_with_escaped_labels(registry):
+    polls = Counter("polls_total", "Sensor polls", ("device",), registry=registry)
+    polls.labels('usb "a"').inc(3)
+    polls.labels('usb "a"').inc()
+    active = Gauge("active", "Active captures", registry=registry)
+    active.inc(2)
+    active.dec()
+    text = registry.render()
+    assert '# TYPE polls_total counter' in text
+    assert 'polls_total{device="usb \\"a\\""} 4' in text
+    assert '\nactive 1\n' in text
+
+def test_histogram_buckets_are_cumulative(registry):
+    stage = Histogram("stage_seconds", "Stage time", ("stage",), buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.5, 5.0):
+        stage.labels("detect").observe(value)
+    lines = registry.render().splitlines()
+    assert 'stage_seconds_bucket{stage="detect",le="0.1"} 1' in lines
+    assert 'stage_seconds_bucket{stage="detect",le="1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="detect",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="detect"} 6.05' in lines
+    assert 'stage_seconds_count{stage="detect"} 4' in lines
+
+def test_labels_must_match_and_names_are_unique(registry):
+    stage = Histogram("stage_seconds", "Stage time", ("stage",), registry=registry)
+    with pytest.raises(ValueError):
+        stage.labels()
+    with pytest.raises(ValueError):
+        Counter("stage_seconds", "Duplicate", registry=registry)
+
+def test_failing_gauge_function_does_not_break_scrape(registry):
+    Gauge("broken", "Raises", registry=registry).set_function(lambda: 1 / 0)
+    Counter("fine_total", "Still rendered", registry=registry).inc()
+    text = registry.render()
+    assert "# broken unavailable: division by zero" in text
+    assert "fine_total 1" in text
+
+def test_file_exporter_writes_on_close(registry, tmp_path):
+    Counter("captures_total", "Captures", registry=registry).inc(2)
+    path = tmp_path / "service.prom"
+    FileExporter(str(path), interval=60, registry=registry).start().close()
+    assert "captures_total 2" in path.read_text()
+
+def test_route_labels_stay_bounded():
+    assert route_label("/api/status?since=3") == "/api/status"
+    assert route_label("/api/image/0123456789abcdef01234567") == "/api/image/{job_id}"
+    assert route_label("/api/unknown") == "other"
+    assert route_label("/assets/app.js") == "static"
+
+def test_bridge_serves_its_own_and_service_metrics(bridge, tmp_path, monkeypatch):
+    service_metrics = tmp_path / "service.prom"
+    service_metrics.write_text("fingerprint_captures_total 7\n")
+    monkeypatch.setattr(bridge_server, "SERVICE_METRICS_FILE", str(service_metrics))
+    bridge.request("GET", "/api/status")
+    status, headers, body = bridge.request("GET", "/metrics")
+    text = body.decode()
+    assert status == 200 and headers["Content-Type"] == CONTENT_TYPE
+    assert 'bridge_responses_total{method="GET",route="/api/status",code="200"}' in text
+    assert text.endswith("fingerprint_captures_total 7\n")
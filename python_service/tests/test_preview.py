@@ -0,0 +1,115 @@
+import time
+import threading
+import http.client
+
+import pytest
+
+import preview
+import bridge_server
+from preview import PreviewPublisher, downsample, encode_preview, blank_preview
+from transport import FileServiceTransport
+from bridge_server import PreviewBroadcaster, PREVIEW_BOUNDARY
+from test_imaging import gradient, decode_png
+from test_bridge import bridge  # noqa: F401  (fixture)
+
+def test_downsample_averages_blocks():
+    pytest.importorskip("numpy")
+    pixels = bytes([0, 100, 10, 30,
+                    200, 20, 50, 70])
+    assert downsample(pixels, 4, 2, 2) == (2, 1, bytes([80, 40]))
+    assert downsample(pixels, 4, 2, 1) == (4, 2, pixels)
+
+def test_downsample_subsamples_without_numpy(monkeypatch):
+    monkeypatch.setattr(preview, "np", None)
+    pixels = bytes(range(24))
+    assert downsample(pixels, 6, 4, 2) == (3, 2, bytes([0, 2, 4, 12, 14, 16]))
+
+def test_preview_frames_are_small_pngs():
+    pixels = gradient(256, 288)
+    assert decode_png(encode_preview(pixels, 256, 288, 2))[:2] == (128, 144)
+    assert decode_png(blank_preview(256, 288, 2)) == (128, 144, b"\xff" * (128 * 144))
+
+class SlowSender:
+    """Collects sent frames, holding the first until released."""
+
+    def __init__(self):
+        self.frames = []
+        self.release = threading.Event()
+
+    def __call__(self, frame: dict):
+        self.release.wait(5)
+        self.frames.append(frame)
+
+def test_publisher_sends_newest_frame_and_drops_the_rest():
+    sender = SlowSender()
+    publisher = PreviewPublisher(sender, 16, 8, scale=1)
+    try:
+        publisher.publish("a", b"\x01" * 128)
+        for _ in range(100):
+            if publisher._latest is None:
+                break  # The encoder took the first frame and is blocked sending it
+            time.sleep(0.01)
+        for value in (2, 3, 4):
+            publisher.publish("a", bytes([value]) * 128)
+        sender.release.set()
+        for _ in range(100):
+            if len(sender.frames) == 2:
+                break
+            time.sleep(0.01)
+    finally:
+        publisher.close()
+    assert [frame["seq"] for frame in sender.frames] == [1, 2]
+    assert decode_png(sender.frames[1]["png"])[2] == b"\x04" * 128
+    assert publisher.dropped == 2
+
+def read_part(response) -> bytes:
+    """Read one multipart frame body, after the part headers."""
+    headers = {}
+    while True:
+        line = response.fp.readline().strip()
+        if not line:
+            if headers:
+                break
+            continue
+        if line.startswith(b"--"):
+            continue
+        name, _, value = line.decode().partition(":")
+        headers[name.lower()] = value.strip()
+    assert headers["content-type"] == "image/png"
+    return response.fp.read(int(headers["content-length"]))
+
+def test_preview_stream_sends_blank_then_service_frames(bridge, monkeypatch):
+    # Repeats come often, so the stream notices the client leaving
+    monkeypatch.setattr(bridge_server, "SSE_HEARTBEAT", 0.1)
+    service = FileServiceTransport()
+    broadcaster = bridge.httpd.preview = PreviewBroadcaster(bridge.httpd.transport)
+    bridge.httpd.blank_preview = blank_preview(256, 288)
+
+    conn = http.client.HTTPConnection('127.0.0.1', bridge.port, timeout=5)
+    response = None
+    try:
+        conn.request("GET", "/api/preview/stream")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert PREVIEW_BOUNDARY.decode() in response.getheader("Content-Type")
+        assert decode_png(read_part(response))[2] == b"\xff" * (128 * 144)
+
+        # The bridge asks the service for frames while someone watches
+        for _ in range(100):
+            if service.preview_wanted():
+                break
+            time.sleep(0.02)
+        assert service.preview_wanted()
+        service.publish_preview({"png": encode_preview(gradient(256, 288), 256, 288)})
+        assert decode_png(read_part(response))[:2] == (128, 144)
+    finally:
+        if response is not None:
+            response.close()
+        conn.close()
+        # The watcher must go idle before the channel paths are restored
+        for _ in range(100):
+            if broadcaster.clients == 0:
+                break
+            time.sleep(0.02)
+        time.sleep(0.3)
+    assert broadcaster.clients == 0
@@ -0,0 +1,36 @@
+import os
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from imaging import decode_bmp
+from device import SIM_FIXTURES
+from quality import assess_quality, burst_score, IMAGE_X, IMAGE_Y
+
+@pytest.fixture(scope="module")
+def sample():
+    with open(os.path.join(SIM_FIXTURES, "sample_capture.bmp"), 'rb') as f:
+        return bytes(decode_bmp(f.read())[2])
+
+def test_sample_print_scores_well(sample):
+    quality = assess_quality(sample)
+    assert set(quality) == {"score", "coverage", "contrast", "coherence"}
+    assert quality["score"] > 40 and quality["coherence"] > 0.5
+
+def test_empty_sensor_scores_zero():
+    assert assess_quality(b"\xff" * (IMAGE_X * IMAGE_Y)) == {"score": 0.0, "coverage": 0.0,
+                                                            "contrast": 0.0, "coherence": 0.0}
+    assert burst_score(b"\xff" * (IMAGE_X * IMAGE_Y)) == 0.0
+
+def test_noise_scores_below_ridges(sample):
+    rng = random.Random(1)
+    noise = bytes(rng.randrange(256) for _ in range(IMAGE_X * IMAGE_Y))
+    assert assess_quality(noise)["coherence"] < 0.3
+    assert assess_quality(noise)["score"] < assess_quality(sample)["score"]
+
+def test_partial_placement_lowers_coverage(sample):
+    half = sample[:IMAGE_X * IMAGE_Y // 2] + b"\xff" * (IMAGE_X * IMAGE_Y // 2)
+    assert assess_quality(half)["coverage"] < assess_quality(sample)["coverage"]
+    assert burst_score(half) < burst_score(sample)
@@ -0,0 +1,106 @@
+import time
+import threading
+
+import pytest
+
+import fingerprint_service
+from jobs import JobHistory, FINAL_STATES
+from logger import BackgroundLogger
+from device import SimulatedDevice
+from supervisor import DeviceSupervisor
+from transport import FileServiceTransport, FileBridgeTransport, read_job_file
+
+@pytest.fixture
+def service(channel_dir, monkeypatch):
+    """The capture service's module state, pointed at the scratch channel."""
+    error_logger = BackgroundLogger(str(channel_dir / "error.log"))
+    monkeypatch.setattr(fingerprint_service, "transport", FileServiceTransport())
+    monkeypatch.setattr(fingerprint_service, "STATUS_FILE", str(channel_dir / "status.json"))
+    monkeypatch.setattr(fingerprint_service, "IMAGE_FILE", str(channel_dir / "latest_capture.bmp"))
+    monkeypatch.setattr(fingerprint_service, "error_logger", error_logger)
+    monkeypatch.setattr(fingerprint_service, "job_history", JobHistory(remove_files=True))
+    monkeypatch.setattr(fingerprint_service, "supervisors", [])
+    monkeypatch.setattr(fingerprint_service, "CAPTURE_TIMEOUT", 3)
+    monkeypatch.setattr(fingerprint_service, "REQUEST_WAIT", 0.05)
+    yield fingerprint_service
+    error_logger.close()
+
+def simulated(label: str, finger_delay: float = 0.05) -> SimulatedDevice:
+    device = SimulatedDevice(finger_delay=finger_delay, upload_latency=0.0, seed=1)
+    device.label = label
+    return device
+
+def wait_for_jobs(bridge: FileBridgeTransport, job_ids: list, timeout: float = 10.0) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        records = [bridge.read_job(job_id) for job_id in job_ids]
+        if all(r is not None and r["status"] in FINAL_STATES for r in records):
+            return records
+        time.sleep(0.05)
+    raise AssertionError(f"Jobs did not finish: {records}")
+
+def test_each_device_worker_takes_its_own_job(service):
+    supervisors = [DeviceSupervisor(simulated(label, 0.4), on_change=service.device_state_changed)
+                   for label in ("left", "right")]
+    service.supervisors.extend(supervisors)
+    stop = threading.Event()
+    workers = [threading.Thread(target=service.capture_worker, args=(s, stop), daemon=True) for s in supervisors]
+    for worker in workers:
+        worker.start()
+    try:
+        bridge = FileBridgeTransport()
+        records = wait_for_jobs(bridge, [bridge.trigger(), bridge.trigger()])
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(5)
+    assert [r["status"] for r in records] == ["success", "success"]
+    # Both sensors captured at once rather than one after the other
+    assert {r["device"] for r in records} == {"left", "right"}
+    assert {label: d["state"] for label, d in records[-1]["devices"].items()} == {"left": "ready", "right": "ready"}
+
+def test_capture_reports_quality_and_timings(service):
+    pytest.importorskip("numpy")
+    device = simulated("sim")
+    device.open()
+    job_id = FileBridgeTransport().trigger()
+    assert service.process_capture_request(device, {"job_id": job_id}) == "success"
+    record = read_job_file(job_id)
+    assert record["quality"]["attempts"] == 1 and record["quality"]["score"] > 0
+    assert {"detect_ms", "upload_ms", "quality_ms", "save_ms"} <= set(record["timings"])
+    assert "detect_polls" not in record["timings"]
+    with open(record["image_path"], 'rb') as f:
+        assert f.read(2) == b"BM"
+
+def test_poor_prints_are_recaptured_then_rejected(service, monkeypatch):
+    pytest.importorskip("numpy")
+    monkeypatch.setattr(service, "QUALITY_THRESHOLD", 101)
+    device = simulated("sim")
+    device.open()
+    job_id = FileBridgeTransport().trigger()
+    assert service.process_capture_request(device, {"job_id": job_id}) == "low_quality"
+    record = read_job_file(job_id)
+    assert (record["status"], record["error"]) == ("error", "low_quality")
+    assert record["quality"]["attempts"] == service.QUALITY_RETRIES + 1
+    assert record["image_path"] is None
+
+def test_status_updates_are_numbered_in_publish_order(service):
+    def publish(n):
+        for _ in range(25):
+            service.update_status("capturing", f"worker {n}")
+
+    first = service.status_seq
+    threads = [threading.Thread(target=publish, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    status = FileBridgeTransport().read_status()
+    assert service.status_seq == first + 100 and status["seq"] == first + 100
+
+def test_job_status_is_recorded_with_the_shared_status(service):
+    job_id = FileBridgeTransport().trigger()
+    service.update_status("capturing", "Place finger on sensor now...", job_id=job_id, device="sim")
+    record = read_job_file(job_id)
+    assert record["status"] == "capturing" and record["device"] == "sim"
+    assert service.job_history.get(job_id)["seq"] == FileBridgeTransport().read_status()["seq"]
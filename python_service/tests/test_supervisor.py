@@ -0,0 +1,116 @@
+import threading
+
+from device import SimulatedDevice, DeviceError, PS_COMM_ERR
+from supervisor import DeviceSupervisor, CONNECTING, READY, RECONNECTING, STOPPED
+
+class FlakyDevice(SimulatedDevice):
+    """Simulated sensor whose next open_failures opens fail, as if unplugged."""
+
+    def __init__(self, open_failures: int = 0, **kwargs):
+        super().__init__(finger_delay=0.0, upload_latency=0.0, **kwargs)
+        self.open_failures = open_failures
+        self.opens = 0
+        self.closes = 0
+
+    def open(self):
+        self.opens += 1
+        if self.open_failures:
+            self.open_failures -= 1
+            raise DeviceError("Device open failed: Send package error", PS_COMM_ERR)
+        super().open()
+
+    def close(self):
+        self.closes += 1
+        super().close()
+
+class RecordingStop(threading.Event):
+    """Stop event that records back-off waits instead of sleeping through them."""
+
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return self.is_set()
+
+def supervise(device, **kwargs):
+    changes = []
+    supervisor = DeviceSupervisor(device, on_change=lambda s: changes.append((s.state, s.error)),
+                                  min_delay=0.5, max_delay=2.0, **kwargs)
+    return supervisor, changes
+
+def test_connect_backs_off_until_open_succeeds():
+    device = FlakyDevice(open_failures=5)
+    supervisor, changes = supervise(device)
+    stop = RecordingStop()
+    assert supervisor.connect(stop)
+    assert stop.waits == [0.5, 1.0, 2.0, 2.0, 2.0]
+    assert device.opens == 6
+    assert supervisor.ready and supervisor.reconnects == 0
+    assert changes[0][0] == CONNECTING and "Open failed" in changes[0][1]
+    assert changes[-1] == (READY, None)
+
+def test_failed_probe_reconnects():
+    device = FlakyDevice()
+    supervisor, changes = supervise(device)
+    stop = RecordingStop()
+    supervisor.connect(stop)
+
+    device.comm_error_rate = 1.0  # Sensor stops answering
+    assert not supervisor.probe()
+    assert supervisor.state == RECONNECTING
+    assert changes[-1] == (RECONNECTING, "Health probe failed: Send package error")
+
+    device.comm_error_rate = 0.0
+    device.open_failures = 2
+    assert supervisor.connect(stop)
+    assert stop.waits == [0.5, 1.0]
+    assert device.closes == 1  # The dead handle was closed before reopening
+    assert supervisor.ready and supervisor.reconnects == 1
+    assert supervisor.snapshot()["reconnects"] == 1
+
+def test_verify_keeps_a_working_handle():
+    device = FlakyDevice()
+    supervisor, changes = supervise(device)
+    supervisor.connect(RecordingStop())
+    assert supervisor.verify("Capture failed: Send package error")
+    assert supervisor.ready and device.opens == 1
+
+    device.comm_error_rate = 1.0
+    assert not supervisor.verify("Capture failed: Send package error")
+    assert supervisor.state == RECONNECTING
+
+def test_connect_gives_up_when_stopped():
+    device = FlakyDevice(open_failures=100)
+    supervisor, _ = supervise(device)
+    stop = RecordingStop()
+    stop.set()
+    assert not supervisor.connect(stop)
+    assert device.opens == 0
+
+    stop = RecordingStop()
+    stop.wait = lambda timeout=None: stop.set() or True  # Stopped during the first back-off
+    assert not supervisor.connect(stop)
+    assert device.opens == 1 and supervisor.state == CONNECTING
+
+def test_probe_only_when_due():
+    device = FlakyDevice()
+    supervisor, _ = supervise(device, health_interval=60.0)
+    supervisor.connect(RecordingStop())
+    device.comm_error_rate = 1.0
+    supervisor.probe_if_due()
+    assert supervisor.ready  # Not due yet, so the sensor was not touched
+
+    supervisor.health_interval = 0.0
+    supervisor.probe_if_due()
+    assert supervisor.state == RECONNECTING
+
+def test_stop_closes_device():
+    device = FlakyDevice()
+    supervisor, changes = supervise(device)
+    supervisor.connect(RecordingStop())
+    count = len(changes)
+    supervisor.stop()
+    assert supervisor.state == STOPPED and device.closes == 1
+    assert len(changes) == count
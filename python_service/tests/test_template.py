@@ -0,0 +1,66 @@
+import math
+
+import pytest
+
+import template
+from template import (encode_template, decode_template, extract_minutiae, HEADER, MINUTIA,
+                      MAX_MINUTIAE, ENDING, BIFURCATION, TEMPLATE_VERSION)
+
+MINUTIAE = [(10, 20, 0.0, ENDING), (255, 287, math.pi, BIFURCATION), (128, 5, 5.0, ENDING)]
+
+def test_round_trip():
+    data = encode_template(MINUTIAE, quality=73.4)
+    assert len(data) == HEADER.size + MINUTIA.size * len(MINUTIAE)
+    decoded = decode_template(data)
+    assert (decoded["version"], decoded["width"], decoded["height"], decoded["quality"]) == \
+        (TEMPLATE_VERSION, template.IMAGE_X, template.IMAGE_Y, 73)
+    for (x, y, angle, kind), (dx, dy, dangle, dkind) in zip(MINUTIAE, decoded["minutiae"]):
+        assert (dx, dy, dkind) == (x, y, kind)
+        # Angles are stored in 1/256ths of a turn
+        error = abs((dangle - angle + math.pi) % (2 * math.pi) - math.pi)
+        assert error <= math.pi / 256 + 1e-9
+
+def test_quality_is_clamped_and_optional():
+    assert decode_template(encode_template(MINUTIAE, quality=250))["quality"] == 100
+    assert decode_template(encode_template(MINUTIAE, quality=-5))["quality"] == 0
+    assert decode_template(encode_template(MINUTIAE))["quality"] == 0
+
+def test_encode_keeps_at_most_max_minutiae():
+    many = [(i % 256, i // 256, 0.0, ENDING) for i in range(MAX_MINUTIAE + 10)]
+    minutiae = decode_template(encode_template(many))["minutiae"]
+    assert [(x, y) for x, y, _, _ in minutiae] == [(x, y) for x, y, _, _ in many[:MAX_MINUTIAE]]
+
+@pytest.mark.parametrize("mutate,message", [
+    (lambda d: d[:HEADER.size - 1], "too short"),
+    (lambda d: b"XYZ" + d[3:], "Not a fingerprint template"),
+    (lambda d: d[:3] + bytes([TEMPLATE_VERSION + 1]) + d[4:], "Unsupported template version"),
+    (lambda d: d[:-1], "Truncated"),
+])
+def test_decode_rejects_bad_data(mutate, message):
+    with pytest.raises(ValueError, match=message):
+        decode_template(mutate(encode_template(MINUTIAE)))
+
+@pytest.mark.skipif(not template.AVAILABLE, reason="needs NumPy")
+def test_extract_from_synthetic_print(monkeypatch):
+    np = template.np
+    height, width = template.IMAGE_Y, template.IMAGE_X
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    # Concentric ridges with a break, inside an elliptical print on a white background
+    r = np.hypot(x - 128, y - 150)
+    ridges = np.sin(2 * np.pi * r / template.RIDGE_PERIOD + np.where(x > 128, 0, np.pi * (y > 150)))
+    inside = ((x - 128) / 100) ** 2 + ((y - 150) / 120) ** 2 < 1
+    pixels = np.where(inside, 128 + 100 * ridges, 255).astype(np.uint8).tobytes()
+
+    minutiae = extract_minutiae(pixels)
+    assert 0 < len(minutiae) <= MAX_MINUTIAE
+    assert all(kind in (ENDING, BIFURCATION) for _, _, _, kind in minutiae)
+    assert all(inside[y, x] for x, y, _, _ in minutiae)
+
+    # Truncation keeps the most reliable, which come first
+    assert len(minutiae) > 3
+    monkeypatch.setattr(template, "MAX_MINUTIAE", 3)
+    assert extract_minutiae(pixels) == minutiae[:3]
+
+@pytest.mark.skipif(not template.AVAILABLE, reason="needs NumPy")
+def test_extract_from_blank_frame():
+    assert extract_minutiae(b"\xff" * (template.IMAGE_X * template.IMAGE_Y)) == []
@@ -0,0 +1,119 @@
+import json
+import time
+import socket
+
+import pytest
+
+import jobs
+import transport
+from transport import (FileBridgeTransport, FileServiceTransport, SocketBridgeTransport,
+                       SocketServiceTransport, encode_message)
+
+pytestmark = pytest.mark.skipif(not transport.HAS_UNIX_SOCKETS, reason="needs Unix sockets")
+
+@pytest.fixture(autouse=True)
+def scratch_channel(channel_dir):
+    return channel_dir
+
+@pytest.fixture
+def service():
+    service = SocketServiceTransport()
+    yield service
+    service.close()
+
+def test_file_channel_round_trip():
+    job_id = FileBridgeTransport().trigger({"burst": 2})
+    request = FileServiceTransport().poll_request(0)
+    assert request == {"source": "file", "job_id": job_id, "burst": 2}
+    assert FileServiceTransport().poll_request(0) is None
+
+def test_socket_service_drains_request_files(service):
+    first = FileBridgeTransport().trigger({"burst": 3})
+    second = FileBridgeTransport().trigger()
+    assert service.poll_request(0.01) == {"source": "file", "job_id": first, "burst": 3}
+    assert service.poll_request(0.01) == {"source": "file", "job_id": second}
+    assert service.poll_request(0.01) is None
+
+def test_socket_bridge_triggers_over_socket(service):
+    bridge = SocketBridgeTransport()
+    try:
+        job_id = bridge.trigger({"publish_all": True})
+    finally:
+        bridge.close()
+    request = service.poll_request(1.0)
+    assert request == {"source": "socket", "job_id": job_id, "publish_all": True}
+    assert jobs.pending_request_ids() == []
+
+def test_socket_bridge_falls_back_to_files_without_service():
+    bridge = SocketBridgeTransport()
+    try:
+        job_id = bridge.trigger({"burst": 2})
+        bridge.cancel(job_id)
+    finally:
+        bridge.close()
+    assert jobs.pending_request_ids() == [job_id]
+    service = FileServiceTransport()
+    assert service.poll_request(0)["job_id"] == job_id
+    assert service.poll_cancel(0) == [job_id]
+
+def test_socket_service_takes_file_cancels(service):
+    job_id = jobs.new_job_id()
+    FileBridgeTransport().cancel(job_id)
+    assert service.poll_cancel(0.01) == [job_id]
+
+def test_trigger_with_invalid_request_is_refused(service):
+    with transport.connect_channel() as sock, sock.makefile('rb') as reader:
+        sock.sendall(encode_message({"op": "trigger", "request": ["burst", 2]}))
+        reply = json.loads(reader.readline())
+    assert reply == {"op": "ack", "ok": False, "error": "invalid_request"}
+    assert service.poll_request(0.01) is None
+
+def test_full_queue_is_refused():
+    service = SocketServiceTransport(max_pending=1)
+    try:
+        bridge = SocketBridgeTransport()
+        try:
+            bridge.trigger()
+            with pytest.raises(jobs.QueueFullError):
+                bridge.trigger()
+        finally:
+            bridge.close()
+    finally:
+        service.close()
+
+def test_status_reaches_subscribers_and_file(service, channel_dir):
+    bridge = SocketBridgeTransport()
+    try:
+        for _ in range(100):
+            if bridge.connected and service._subscribers:
+                break
+            bridge.wait_for_update(0.05)
+        service.publish_status({"status": "ready", "n": 1})
+        for _ in range(20):
+            if bridge.read_status() == {"status": "ready", "n": 1}:
+                break
+            bridge.wait_for_update(0.05)
+        assert bridge.read_status() == {"status": "ready", "n": 1}
+    finally:
+        bridge.close()
+    assert json.loads((channel_dir / "status.json").read_text()) == {"status": "ready", "n": 1}
+
+def test_stalled_subscriber_is_dropped(service, monkeypatch):
+    monkeypatch.setattr(transport, "SEND_TIMEOUT", 0.2)
+    stalled = transport.connect_channel()
+    stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    stalled.sendall(encode_message({"op": "subscribe"}))
+    try:
+        for _ in range(100):
+            if service._subscribers:
+                break
+            time.sleep(0.01)
+        assert service._subscribers
+        # Never read: once the socket buffers fill, a send times out and it is dropped
+        for n in range(2000):
+            service.publish_status({"status": "scanning", "message": "x" * 1024, "n": n})
+            if not service._subscribers:
+                break
+        assert not service._subscribers
+    finally:
+        stalled.close()
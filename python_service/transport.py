@@ -0,0 +1,635 @@
+import os
+import json
+import base64
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from jobs import (MAX_PENDING_JOBS, JOB_HISTORY, QueueFullError, new_job_id, is_valid_job_id,
+                  request_file, job_file, cancel_file, pending_request_ids, pending_cancel_ids)
+
+# ===== Configuration =====
+# "socket" uses a local stream socket (Unix domain socket where available,
+# loopback TCP otherwise); "file" is the original flag-file/status.json channel.
+TRANSPORT = os.environ.get("FINGERPRINT_TRANSPORT", "socket")
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+COMM_DIR = os.path.join(PROJECT_ROOT, "communication")
+
+REQUEST_FLAG = os.path.join(COMM_DIR, "capture_request.flag")
+STATUS_FILE = os.path.join(COMM_DIR, "status.json")
+SOCKET_PATH = os.path.join(COMM_DIR, "service.sock")
+# Live preview over the file channel: the bridge touches PREVIEW_WANTED_FILE
+# while clients watch, the service replaces PREVIEW_FILE with each frame
+PREVIEW_FILE = os.path.join(COMM_DIR, "preview.png")
+PREVIEW_WANTED_FILE = os.path.join(COMM_DIR, "preview.wanted")
+PREVIEW_LINGER = 5.0  # Seconds the service keeps sending preview frames after the last request
+SOCKET_HOST = "127.0.0.1"
+SOCKET_PORT = int(os.environ.get("FINGERPRINT_CHANNEL_PORT", "8765"))
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+FLAG_POLL_INTERVAL = 0.1
+CONNECT_TIMEOUT = 1.0
+SEND_TIMEOUT = 2.0  # A subscriber that cannot take a message within this is dropped
+RECONNECT_DELAY = 1.0
+
+os.makedirs(COMM_DIR, exist_ok=True)
+
+# ===== Helpers =====
+def write_file_atomic(path: str, data: bytes):
+    """Write data to path via a temporary file so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_status_file(status_data: dict, path: str = STATUS_FILE):
+    """Write status data to the status file."""
+    write_file_atomic(path, json.dumps(status_data, separators=(',', ':')).encode('utf-8'))
+
+def read_status_file(path: str = STATUS_FILE):
+    """Read status data from the status file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def claim_file(path: str):
+    """Read and remove a file, or return None if it is gone.
+
+    The file is renamed first, so when several capture workers race for the
+    same request exactly one of them gets it.
+    """
+    claimed = f"{path}.{os.getpid()}.{threading.get_ident()}.claimed"
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    try:
+        with open(claimed, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(claimed)
+
+def consume_request_flag(path: str = REQUEST_FLAG):
+    """Remove the request flag file, returning its request data if it was present."""
+    content = claim_file(path)
+    if content is None:
+        return None
+    # Manually created flags (e.g. "echo. > capture_request.flag") carry no data
+    try:
+        request = json.loads(content)
+    except ValueError:
+        request = None
+    return request if isinstance(request, dict) else {}
+
+def consume_request_file(job_id: str):
+    """Take a queued request file, returning its request data."""
+    content = claim_file(request_file(job_id))
+    if content is None:
+        return None
+    try:
+        return {**json.loads(content), "job_id": job_id}
+    except ValueError:
+        return {"job_id": job_id}
+
+def take_file_request():
+    """Take the oldest queued request file, or a request flag, or return None."""
+    for job_id in pending_request_ids():
+        request = consume_request_file(job_id)
+        if request is not None:
+            return {"source": "file", **request}
+    request = consume_request_flag()
+    if request is not None:
+        return {"source": "file", "job_id": new_job_id(), **request}
+    return None
+
+def consume_cancel_files() -> list:
+    """Take every queued cancellation request file, returning the job IDs."""
+    return [job_id for job_id in pending_cancel_ids() if claim_file(cancel_file(job_id)) is not None]
+
+def read_job_file(job_id: str):
+    """Read a job's status record, or None if the service has not written one."""
+    try:
+        with open(job_file(job_id), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def write_job_file(record: dict):
+    write_file_atomic(job_file(record["job_id"]), json.dumps(record, separators=(',', ':')).encode('utf-8'))
+
+def preview_requested(linger: float = PREVIEW_LINGER) -> bool:
+    """Whether a bridge on the file channel asked for preview frames recently."""
+    try:
+        return time.time() - os.path.getmtime(PREVIEW_WANTED_FILE) < linger
+    except OSError:
+        return False
+
+def queued_record(job_id: str) -> dict:
+    return {"job_id": job_id, "status": "queued", "message": "Waiting for the scanner...",
+            "image_path": None, "error": None}
+
+def encode_message(message: dict) -> bytes:
+    """Encode a message as a single newline-terminated JSON line."""
+    return (json.dumps(message, separators=(',', ':')) + "\n").encode('utf-8')
+
+def connect_channel(timeout: float = CONNECT_TIMEOUT) -> socket.socket:
+    """Open a client connection to the service channel."""
+    if HAS_UNIX_SOCKETS:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = SOCKET_PATH
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = (SOCKET_HOST, SOCKET_PORT)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+# ===== Service Side =====
+class FileServiceTransport:
+    """Service end of the flag-file/status.json channel."""
+
+    name = "file"
+
+    def poll_request(self, timeout: float):
+        """Wait up to timeout seconds for a capture request."""
+        deadline = time.monotonic() + timeout
+        while True:
+            request = take_file_request()
+            if request is not None:
+                return request
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(FLAG_POLL_INTERVAL, remaining))
+
+    def poll_cancel(self, timeout: float) -> list:
+        """Wait up to timeout seconds for cancellation requests, returning job IDs."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job_ids = consume_cancel_files()
+            remaining = deadline - time.monotonic()
+            if job_ids or remaining <= 0:
+                return job_ids
+            time.sleep(min(FLAG_POLL_INTERVAL, remaining))
+
+    def publish_status(self, status_data: dict):
+        """Publish a status update to readers."""
+        write_status_file(status_data)
+
+    def publish_job(self, record: dict):
+        """Publish a job's status record to readers."""
+        write_job_file(record)
+
+    def preview_wanted(self) -> bool:
+        """Whether a bridge is currently asking for live preview frames."""
+        return preview_requested()
+
+    def publish_preview(self, frame: dict):
+        """Publish an encoded live preview frame to readers."""
+        write_file_atomic(PREVIEW_FILE, frame["png"])
+
+    def close(self):
+        pass
+
+class SocketServiceTransport:
+    """Service end of the local socket channel.
+
+    Capture requests arrive on a bounded queue fed by per-connection reader
+    threads, so a trigger wakes the service loop immediately instead of on the
+    next flag poll, and triggers beyond max_pending are refused. Status and
+    job updates are pushed to every subscribed bridge and also written to
+    disk so file-based readers keep working. Writes to a connection are
+    serialised by its own lock and bounded by SEND_TIMEOUT, so a stalled
+    bridge is dropped instead of holding up publishers.
+    """
+
+    name = "socket"
+
+    def __init__(self, max_pending: int = MAX_PENDING_JOBS):
+        self._requests = queue.Queue(maxsize=max_pending)
+        self._cancels = queue.Queue()
+        self._subscribers = set()
+        self._send_locks = {}  # Connection -> lock serialising writes to it
+        self._lock = threading.Lock()
+        self._status = None
+        self._preview_until = 0.0
+        self._closed = False
+        self._listener = self._listen()
+        threading.Thread(target=self._accept_loop, name="channel-accept", daemon=True).start()
+
+    def _listen(self) -> socket.socket:
+        if HAS_UNIX_SOCKETS:
+            if os.path.exists(SOCKET_PATH):
+                os.remove(SOCKET_PATH)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(SOCKET_PATH)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((SOCKET_HOST, SOCKET_PORT))
+        sock.listen(16)
+        return sock
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn: socket.socket):
+        # The timeout bounds sends; an idle read just times out and retries
+        conn.settimeout(SEND_TIMEOUT)
+        with self._lock:
+            self._send_locks[conn] = threading.Lock()
+        pending = b""
+        try:
+            with conn:
+                while not self._closed:
+                    try:
+                        chunk = conn.recv(65536)
+                    except socket.timeout:
+                        continue
+                    if not chunk:
+                        break
+                    *lines, pending = (pending + chunk).split(b"\n")
+                    for line in lines:
+                        try:
+                            message = json.loads(line)
+                        except ValueError:
+                            continue
+                        if isinstance(message, dict):
+                            self._handle_message(conn, message)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._subscribers.discard(conn)
+                self._send_locks.pop(conn, None)
+
+    def _send(self, conn: socket.socket, payload: bytes) -> bool:
+        """Write a message to one connection, dropping it if the write fails or stalls."""
+        lock = self._send_locks.get(conn)
+        if lock is None:
+            return False
+        with lock:
+            return self._send_locked(conn, payload)
+
+    def _send_locked(self, conn: socket.socket, payload: bytes) -> bool:
+        try:
+            conn.sendall(payload)
+            return True
+        except OSError:
+            # A partial write leaves the stream unusable; the bridge reconnects
+            with self._lock:
+                self._subscribers.discard(conn)
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return False
+
+    def _handle_message(self, conn: socket.socket, message: dict):
+        op = message.get("op")
+        if op == "trigger":
+            request = message.get("request", {})
+            if not isinstance(request, dict):
+                self._send(conn, encode_message({"op": "ack", "ok": False, "error": "invalid_request"}))
+                return
+            request = {**request, "source": "socket"}
+            if not is_valid_job_id(request.get("job_id")):
+                request["job_id"] = new_job_id()
+            try:
+                self._requests.put_nowait(request)
+            except queue.Full:
+                self._send(conn, encode_message({"op": "ack", "ok": False, "error": "queue_full"}))
+                return
+            self.publish_job(queued_record(request["job_id"]))
+            self._send(conn, encode_message({"op": "ack", "ok": True, "job_id": request["job_id"],
+                                             "queue_depth": self._requests.qsize()}))
+        elif op == "cancel":
+            job_id = message.get("job_id")
+            if not is_valid_job_id(job_id):
+                self._send(conn, encode_message({"op": "ack", "ok": False, "error": "invalid_job"}))
+                return
+            self._cancels.put(job_id)
+            self._send(conn, encode_message({"op": "ack", "ok": True, "job_id": job_id}))
+        elif op == "subscribe":
+            # Holding the connection's send lock keeps broadcasts behind the current status
+            with self._send_locks[conn]:
+                with self._lock:
+                    self._subscribers.add(conn)
+                    status = self._status
+                if status is not None:
+                    self._send_locked(conn, encode_message({"op": "status", "data": status}))
+        elif op == "status":
+            self._send(conn, encode_message({"op": "status", "data": self._status}))
+        elif op == "preview":
+            # Renewed by the bridge while it has preview clients; no reply
+            self._preview_until = time.monotonic() + PREVIEW_LINGER
+
+    def poll_request(self, timeout: float):
+        """Wait up to timeout seconds for a capture request."""
+        try:
+            return self._requests.get(timeout=timeout)
+        except queue.Empty:
+            pass
+        # Bridges that fell back to the file channel queue request files, and
+        # manual flag-file triggers still work alongside the socket channel
+        return take_file_request()
+
+    def poll_cancel(self, timeout: float) -> list:
+        """Wait up to timeout seconds for cancellation requests, returning job IDs."""
+        try:
+            job_ids = [self._cancels.get(timeout=timeout)]
+        except queue.Empty:
+            job_ids = []
+        while not self._cancels.empty():
+            job_ids.append(self._cancels.get_nowait())
+        # Bridges that fell back to the file channel cancel through files
+        return job_ids + consume_cancel_files()
+
+    def _broadcast(self, payload: bytes):
+        """Send a message to every subscriber, outside the shared lock."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for conn in subscribers:
+            self._send(conn, payload)
+
+    def publish_status(self, status_data: dict):
+        """Publish a status update to subscribers and the status file."""
+        payload = encode_message({"op": "status", "data": status_data})
+        with self._lock:
+            self._status = status_data
+        self._broadcast(payload)
+        write_status_file(status_data)
+
+    def publish_job(self, record: dict):
+        """Publish a job's status record to subscribers and its job file."""
+        self._broadcast(encode_message({"op": "job", "data": record}))
+        write_job_file(record)
+
+    def preview_wanted(self) -> bool:
+        """Whether a bridge is currently asking for live preview frames."""
+        return time.monotonic() < self._preview_until or preview_requested()
+
+    def publish_preview(self, frame: dict):
+        """Push an encoded live preview frame to subscribers."""
+        payload = encode_message({"op": "preview", "seq": frame["seq"], "device": frame["device"],
+                                  "timestamp": frame["timestamp"],
+                                  "data": base64.b64encode(frame["png"]).decode('ascii')})
+        self._broadcast(payload)
+        if preview_requested():
+            write_file_atomic(PREVIEW_FILE, frame["png"])
+
+    def close(self):
+        self._closed = True
+        try:
+            self._listener.close()
+        except OSError:
+            pass
+        if HAS_UNIX_SOCKETS and os.path.exists(SOCKET_PATH):
+            try:
+                os.remove(SOCKET_PATH)
+            except OSError:
+                pass
+
+# ===== Bridge Side =====
+class FileBridgeTransport:
+    """Bridge end of the flag-file/status.json channel."""
+
+    name = "file"
+
+    def __init__(self, max_pending: int = MAX_PENDING_JOBS):
+        self.max_pending = max_pending
+        # Parsed status keyed on the file's (mtime, size)
+        self._status = None
+        self._status_key = None
+        self._preview_key = None
+        self._preview_seq = 0
+
+    def trigger(self, request: dict = None) -> str:
+        """Queue a capture request with the service, returning its job ID."""
+        request = dict(request or {})
+        if len(pending_request_ids()) >= self.max_pending:
+            raise QueueFullError("Capture queue is full")
+        job_id = request.pop("job_id", None) or new_job_id()
+        write_file_atomic(request_file(job_id), json.dumps(request).encode('utf-8'))
+        return job_id
+
+    def cancel(self, job_id: str):
+        """Ask the service to cancel a queued or running job."""
+        write_file_atomic(cancel_file(job_id), b"")
+
+    def read_status(self):
+        """Return the latest status, or None if the service has not reported."""
+        try:
+            st = os.stat(STATUS_FILE)
+        except FileNotFoundError:
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        if key != self._status_key:
+            try:
+                self._status = read_status_file()
+            except ValueError:
+                return self._status  # Torn write from an older service; keep the last good status
+            self._status_key = key
+        return self._status
+
+    def read_job(self, job_id: str):
+        """Return a job's status record, or None if the job is unknown."""
+        record = read_job_file(job_id)
+        if record is None and os.path.exists(request_file(job_id)):
+            record = queued_record(job_id)
+        return record
+
+    def wait_for_update(self, timeout: float):
+        """Block until the status may have changed or timeout elapses."""
+        time.sleep(min(timeout, FLAG_POLL_INTERVAL))
+
+    def request_preview(self):
+        """Ask the service to keep sending live preview frames for a while."""
+        write_file_atomic(PREVIEW_WANTED_FILE, b"")
+
+    def read_preview(self, timeout: float):
+        """Wait up to timeout seconds for a new preview frame, or return None."""
+        time.sleep(min(timeout, FLAG_POLL_INTERVAL))
+        try:
+            st = os.stat(PREVIEW_FILE)
+            key = (st.st_mtime_ns, st.st_size)
+            if key == self._preview_key:
+                return None
+            with open(PREVIEW_FILE, 'rb') as f:
+                png = f.read()
+        except OSError:
+            return None
+        self._preview_key = key
+        self._preview_seq += 1
+        return {"seq": self._preview_seq, "device": None, "timestamp": st.st_mtime, "png": png}
+
+    def close(self):
+        pass
+
+class SocketBridgeTransport:
+    """Bridge end of the local socket channel.
+
+    A background subscriber keeps the latest status pushed by the service in
+    memory, so status reads never touch disk while the channel is connected.
+    Falls back to the file channel whenever the service socket is unreachable.
+    """
+
+    name = "socket"
+
+    def __init__(self):
+        self._fallback = FileBridgeTransport()
+        self._status = None
+        self._jobs = OrderedDict()
+        self._updated = threading.Event()
+        self._preview = None
+        self._preview_ready = threading.Event()
+        self._sock = None
+        self._connected = False
+        self._closed = False
+        threading.Thread(target=self._subscribe_loop, name="channel-subscribe", daemon=True).start()
+
+    def _subscribe_loop(self):
+        while not self._closed:
+            try:
+                sock = connect_channel()
+            except OSError:
+                time.sleep(RECONNECT_DELAY)
+                continue
+            try:
+                sock.settimeout(None)
+                sock.sendall(encode_message({"op": "subscribe"}))
+                self._sock = sock
+                self._connected = True
+                with sock, sock.makefile('rb') as reader:
+                    for line in reader:
+                        message = json.loads(line)
+                        if message.get("op") == "status" and message.get("data") is not None:
+                            self._status = message["data"]
+                            self._updated.set()
+                        elif message.get("op") == "job":
+                            self._remember_job(message["data"])
+                        elif message.get("op") == "preview":
+                            self._preview = {"seq": message["seq"], "device": message.get("device"),
+                                             "timestamp": message.get("timestamp"),
+                                             "png": base64.b64decode(message["data"])}
+                            self._preview_ready.set()
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._connected = False
+                self._sock = None
+                self._status = None
+                self._updated.set()
+            time.sleep(RECONNECT_DELAY)
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    def _remember_job(self, record: dict):
+        self._jobs[record["job_id"]] = record
+        self._jobs.move_to_end(record["job_id"])
+        while len(self._jobs) > JOB_HISTORY:
+            self._jobs.popitem(last=False)
+
+    def trigger(self, request: dict = None) -> str:
+        """Queue a capture request with the service, returning its job ID."""
+        request = dict(request or {})
+        request.setdefault("job_id", new_job_id())
+        try:
+            with connect_channel() as sock:
+                sock.sendall(encode_message({"op": "trigger", "request": request}))
+                with sock.makefile('rb') as reader:
+                    reply = json.loads(reader.readline() or b'{}')
+        except (OSError, ValueError):
+            return self._fallback.trigger(request)
+        if not reply.get("ok"):
+            if reply.get("error") == "queue_full":
+                raise QueueFullError("Capture queue is full")
+            raise RuntimeError(f"Service rejected trigger: {reply.get('error')}")
+        return reply["job_id"]
+
+    def cancel(self, job_id: str):
+        """Ask the service to cancel a queued or running job."""
+        try:
+            with connect_channel() as sock:
+                sock.sendall(encode_message({"op": "cancel", "job_id": job_id}))
+                with sock.makefile('rb') as reader:
+                    reply = json.loads(reader.readline() or b'{}')
+        except (OSError, ValueError):
+            self._fallback.cancel(job_id)
+            return
+        if not reply.get("ok"):
+            raise RuntimeError(f"Service rejected cancel: {reply.get('error')}")
+
+    def read_status(self):
+        """Return the latest status, or None if the service has not reported."""
+        if self._connected and self._status is not None:
+            return self._status
+        return self._fallback.read_status()
+
+    def read_job(self, job_id: str):
+        """Return a job's status record, or None if the job is unknown."""
+        record = self._jobs.get(job_id) if self._connected else None
+        return record if record is not None else self._fallback.read_job(job_id)
+
+    def wait_for_update(self, timeout: float):
+        """Block until the status may have changed or timeout elapses."""
+        if not self._connected:
+            self._fallback.wait_for_update(timeout)
+            return
+        self._updated.wait(timeout)
+        self._updated.clear()
+
+    def request_preview(self):
+        """Ask the service to keep sending live preview frames for a while."""
+        sock = self._sock
+        if sock is None:
+            self._fallback.request_preview()
+            return
+        try:
+            sock.sendall(encode_message({"op": "preview"}))
+        except OSError:
+            self._fallback.request_preview()
+
+    def read_preview(self, timeout: float):
+        """Wait up to timeout seconds for a new preview frame, or return None."""
+        if not self._connected:
+            return self._fallback.read_preview(timeout)
+        if not self._preview_ready.wait(timeout):
+            return None
+        self._preview_ready.clear()
+        return self._preview
+
+    def close(self):
+        self._closed = True
+
+# ===== Factories =====
+def create_service_transport(kind: str = TRANSPORT):
+    """Create the service end of the configured transport."""
+    if kind == "socket":
+        try:
+            return SocketServiceTransport()
+        except OSError as e:
+            print(f"Socket channel unavailable ({e}), falling back to file transport")
+    return FileServiceTransport()
+
+def create_bridge_transport(kind: str = TRANSPORT):
+    """Create the bridge end of the configured transport."""
+    if kind == "socket":
+        return SocketBridgeTransport()
+    return FileBridgeTransport()